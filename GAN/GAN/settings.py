@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -162,6 +162,16 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded and generated files (medical_images/, translated_images/, ...).
+# Served at MEDIA_URL under DEBUG, so nothing else may live in this tree.
+MEDIA_URL = '/media/'
+MEDIA_ROOT = Path(config('MEDIA_ROOT', default=str(BASE_DIR / 'media')))
+
+# Internal working files (translation cache, upload temp files, volumes,
+# shards). Never served; keep it out of MEDIA_ROOT.
+GAN_DATA_DIR = Path(config('GAN_DATA_DIR', default=str(BASE_DIR / 'var')))
+
+
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),  # Short-lived access token
@@ -173,4 +183,144 @@ SIMPLE_JWT = {
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
-}
\ No newline at end of file
+}
+
+
+# GAN inference
+
+# Target modalities ('MRI', 'CT') whose generators are loaded when a web or
+# Celery worker starts, so the first translation does not pay for it. Other
+# manage.py commands skip it (translate.apps.serves_translations).
+GAN_WARMUP_MODALITIES = config('GAN_WARMUP_MODALITIES', default='', cast=Csv())
+
+# Reload a cached generator when its checkpoint file changes on disk.
+GAN_RELOAD_ON_CHANGE = config('GAN_RELOAD_ON_CHANGE', default=True, cast=bool)
+
+# Micro-batching: concurrent translations for the same target modality are
+# collected for up to GAN_BATCH_MAX_WAIT_MS or GAN_BATCH_MAX_SIZE images and
+# run through the generator as one batch. Off by default: it only pays off
+# with many concurrent translations per process.
+GAN_BATCHING_ENABLED = config('GAN_BATCHING_ENABLED', default=False, cast=bool)
+GAN_BATCH_MAX_SIZE = config('GAN_BATCH_MAX_SIZE', default=8, cast=int)
+GAN_BATCH_MAX_WAIT_MS = config('GAN_BATCH_MAX_WAIT_MS', default=10, cast=float)
+
+# Upper bound on slices accepted by /api/translate/gan/batch/ per request.
+GAN_BATCH_MAX_SLICES = config('GAN_BATCH_MAX_SLICES', default=1000, cast=int)
+DATA_UPLOAD_MAX_NUMBER_FILES = GAN_BATCH_MAX_SLICES
+
+# Tiled inference: translate at the input resolution by running the
+# generator over overlapping tiles blended with a feathered window. The HPB
+# generator only accepts 256x256 inputs, so keep GAN_TILE_SIZE at 256 for it.
+GAN_TILED_INFERENCE = config('GAN_TILED_INFERENCE', default=False, cast=bool)
+GAN_TILE_SIZE = config('GAN_TILE_SIZE', default=256, cast=int)
+GAN_TILE_OVERLAP = config('GAN_TILE_OVERLAP', default=32, cast=int)
+GAN_TILE_BATCH_SIZE = config('GAN_TILE_BATCH_SIZE', default=4, cast=int)
+
+# Content-addressed cache of translated PNGs, keyed by the input bytes,
+# target modality, weights digest and preprocessing options. Memory tier is
+# an LRU; the disk tier lives under GAN_DATA_DIR and is pruned oldest-first.
+GAN_TRANSLATION_CACHE_ENABLED = config('GAN_TRANSLATION_CACHE_ENABLED', default=True, cast=bool)
+GAN_TRANSLATION_CACHE_DIR = config('GAN_TRANSLATION_CACHE_DIR', default=str(GAN_DATA_DIR / 'translation_cache'))
+GAN_TRANSLATION_CACHE_MEMORY_BYTES = config('GAN_TRANSLATION_CACHE_MEMORY_BYTES', default=64 * 1024 * 1024, cast=int)
+GAN_TRANSLATION_CACHE_DISK_BYTES = config('GAN_TRANSLATION_CACHE_DISK_BYTES', default=1024 * 1024 * 1024, cast=int)
+
+# CPU inference optimizations applied to each loaded generator. Every mode
+# is checked against the fp32 output on a fixed input at load time and
+# dropped if it misses GAN_ACCURACY_MIN_PSNR / GAN_ACCURACY_MAX_ABS_DIFF.
+# GAN_COMPILE is 'none', 'compile' (torch.compile) or 'trace' (torch.jit).
+# GAN_NUM_THREADS sets torch intra-op threads per worker (0: torch default).
+GAN_CHANNELS_LAST = config('GAN_CHANNELS_LAST', default=False, cast=bool)
+GAN_AUTOCAST_BF16 = config('GAN_AUTOCAST_BF16', default=False, cast=bool)
+GAN_COMPILE = config('GAN_COMPILE', default='none')
+GAN_NUM_THREADS = config('GAN_NUM_THREADS', default=0, cast=int)
+GAN_ACCURACY_GUARD = config('GAN_ACCURACY_GUARD', default=True, cast=bool)
+GAN_ACCURACY_MIN_PSNR = config('GAN_ACCURACY_MIN_PSNR', default=30.0, cast=float)
+GAN_ACCURACY_MAX_ABS_DIFF = config('GAN_ACCURACY_MAX_ABS_DIFF', default=0.25, cast=float)
+
+# 'int8' serves the dynamically quantized generators saved by
+# manage.py quantize_generators (CPU only); 'none' serves fp32.
+GAN_QUANTIZATION = config('GAN_QUANTIZATION', default='none')
+
+# Run the HPB attention blocks with FusedDPSA: same weights and outputs,
+# less transient memory per block.
+GAN_FUSED_ATTENTION = config('GAN_FUSED_ATTENTION', default=False, cast=bool)
+
+# Serve an inference-only rewrite of the generator (models.networks.freeze_G),
+# checked by the accuracy guard like the other optimizations.
+GAN_FREEZE_GENERATOR = config('GAN_FREEZE_GENERATOR', default=False, cast=bool)
+
+# 'torch' runs the generators in PyTorch; 'onnx' runs the models written by
+# manage.py export_onnx with ONNX Runtime's CPU provider (the rest of the
+# pipeline still uses PyTorch); 'pool' runs them in the forked inference
+# worker pool below.
+GAN_INFERENCE_BACKEND = config('GAN_INFERENCE_BACKEND', default='torch')
+
+# Uploads to the translation endpoints stream to temporary files here while
+# being hashed; keeping them on the same filesystem as MEDIA_ROOT makes
+# saving them to a FileField a rename instead of a copy.
+GAN_UPLOAD_TEMP_DIR = config('GAN_UPLOAD_TEMP_DIR', default=str(GAN_DATA_DIR / 'uploads'))
+
+# Series stacked into one memory-mapped (slices, H, W) .npy per series
+GAN_VOLUME_DIR = config('GAN_VOLUME_DIR', default=str(GAN_DATA_DIR / 'volumes'))
+
+# Default format of translated results: 'png' (8-bit preview) or 'dicom'
+# (16-bit, source header with new UIDs; DICOM inputs only). Requests can
+# override it with output_format.
+GAN_OUTPUT_FORMAT = config('GAN_OUTPUT_FORMAT', default='png')
+
+# /api/translate/gan/ is an async view: inference runs on a pool of
+# GAN_ASYNC_WORKERS threads with up to GAN_ASYNC_QUEUE_DEPTH requests waiting.
+# Past that it answers 429 with Retry-After; requests still waiting after
+# GAN_ASYNC_TIMEOUT seconds get a 504. Serve with an ASGI server (GAN.asgi).
+GAN_ASYNC_WORKERS = config('GAN_ASYNC_WORKERS', default=2, cast=int)
+GAN_ASYNC_QUEUE_DEPTH = config('GAN_ASYNC_QUEUE_DEPTH', default=8, cast=int)
+GAN_ASYNC_TIMEOUT = config('GAN_ASYNC_TIMEOUT', default=60, cast=float)
+
+# Inference worker pool (GAN_INFERENCE_BACKEND=pool): GAN_POOL_WORKERS forked
+# processes share one copy of both generators' weights, each running
+# GAN_POOL_THREADS_PER_WORKER torch threads. GAN_POOL_AFFINITY pins them to
+# CPUs: '' (off), 'auto', or per-worker lists like '0-1;2-3'. Inputs and
+# outputs go through shared buffers of GAN_POOL_BUFFER_IMAGES 256x256 images.
+# The weights are loaded when the app starts in a serving process; run
+# gunicorn with --preload (Celery's prefork parent does this already) so that
+# happens before the fork and all serving processes share one copy.
+GAN_POOL_WORKERS = config('GAN_POOL_WORKERS', default=2, cast=int)
+GAN_POOL_THREADS_PER_WORKER = config('GAN_POOL_THREADS_PER_WORKER', default=1, cast=int)
+GAN_POOL_AFFINITY = config('GAN_POOL_AFFINITY', default='')
+GAN_POOL_BUFFER_IMAGES = config('GAN_POOL_BUFFER_IMAGES', default=8, cast=int)
+
+# Gemini image analysis: model name, requests in flight for batch analyses,
+# and the longest side / JPEG quality images are re-encoded to before upload.
+GEMINI_MODEL = config('GEMINI_MODEL', default='gemini-2.0-flash')
+GEMINI_CONCURRENCY = config('GEMINI_CONCURRENCY', default=4, cast=int)
+GEMINI_IMAGE_MAX_SIZE = config('GEMINI_IMAGE_MAX_SIZE', default=1024, cast=int)
+GEMINI_IMAGE_QUALITY = config('GEMINI_IMAGE_QUALITY', default=90, cast=int)
+
+# Reuse an existing analysis of identical content (same upload bytes) made
+# with the same model and prompt within GEMINI_ANALYSIS_CACHE_TTL seconds
+# (0 turns reuse off). GEMINI_ANALYSIS_NEAR_DUPLICATES also matches images
+# whose perceptual hashes differ by at most GEMINI_ANALYSIS_PHASH_DISTANCE
+# of 64 bits.
+GEMINI_ANALYSIS_CACHE_TTL = config('GEMINI_ANALYSIS_CACHE_TTL', default=30 * 24 * 3600, cast=int)
+GEMINI_ANALYSIS_NEAR_DUPLICATES = config('GEMINI_ANALYSIS_NEAR_DUPLICATES', default=False, cast=bool)
+GEMINI_ANALYSIS_PHASH_DISTANCE = config('GEMINI_ANALYSIS_PHASH_DISTANCE', default=4, cast=int)
+
+# Preprocessed shard store (manage.py build_shards): images decoded,
+# windowed and resized to GAN_SHARD_IMAGE_SIZE, kept as float16 in
+# memory-mapped shards of GAN_SHARD_CAPACITY images.
+GAN_SHARD_DIR = config('GAN_SHARD_DIR', default=str(GAN_DATA_DIR / 'shards'))
+GAN_SHARD_IMAGE_SIZE = config('GAN_SHARD_IMAGE_SIZE', default=256, cast=int)
+GAN_SHARD_CAPACITY = config('GAN_SHARD_CAPACITY', default=1024, cast=int)
+
+# Distributed training (manage.py train_gan --nproc-per-node/--nnodes):
+# torch.distributed backend, rendezvous address of node 0, and the
+# DistributedDataParallel gradient bucket size in MB.
+GAN_DDP_BACKEND = config('GAN_DDP_BACKEND', default='gloo')
+GAN_DDP_MASTER_ADDR = config('GAN_DDP_MASTER_ADDR', default='127.0.0.1')
+GAN_DDP_MASTER_PORT = config('GAN_DDP_MASTER_PORT', default=29500, cast=int)
+GAN_DDP_BUCKET_CAP_MB = config('GAN_DDP_BUCKET_CAP_MB', default=25, cast=int)
+
+# /api/translations/ listing: cursor pages of GAN_LIST_PAGE_SIZE images,
+# newest first; clients may ask for up to GAN_LIST_MAX_PAGE_SIZE.
+GAN_LIST_PAGE_SIZE = config('GAN_LIST_PAGE_SIZE', default=50, cast=int)
+GAN_LIST_MAX_PAGE_SIZE = config('GAN_LIST_MAX_PAGE_SIZE', default=200, cast=int)
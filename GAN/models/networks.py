@@ -1,6 +1,7 @@
 import torch
 import torch.nn as nn
 from torch.nn import init
+import copy
 import functools
 from torch.optim import lr_scheduler
 # from .spectralNormalization import SpectralNorm
@@ -76,7 +77,32 @@ def init_net(net, init_type='normal', init_gain=0.02, gpu_ids=[]):
     return net
 
 
+def distribute_net(net, bucket_cap_mb=25, find_unused_parameters=False):
+    # DistributedDataParallel over the default process group (gloo on CPU
+    # machines); `net` is returned as is when no process group is set up.
+    # Gradients are all-reduced in buckets of bucket_cap_mb while backward
+    # still runs, and are views into the buckets, so there is no extra copy.
+    if not (torch.distributed.is_available() and torch.distributed.is_initialized()):
+        return net
+    return torch.nn.parallel.DistributedDataParallel(
+        net, bucket_cap_mb=bucket_cap_mb, find_unused_parameters=find_unused_parameters,
+        gradient_as_bucket_view=True,
+    )
+
+
+def unwrap_net(net):
+    # The module inside a DataParallel/DistributedDataParallel wrapper, so
+    # saved state dicts have no `module.` prefix
+    return getattr(net, 'module', net)
+
+
 def define_G(input_nc, output_nc, ngf, netG, norm='batch', use_dropout=False, init_type='normal', init_gain=0.02, gpu_ids=[], use_attention=False):
+    net = build_G(input_nc, output_nc, ngf, netG, norm=norm, use_dropout=use_dropout, use_attention=use_attention)
+    return init_net(net, init_type, init_gain, gpu_ids)
+
+
+def build_G(input_nc, output_nc, ngf, netG, norm='batch', use_dropout=False, use_attention=False):
+    """Construct the generator modules without initializing their weights."""
     net = None
     norm_layer = get_norm_layer(norm_type=norm)
 
@@ -94,7 +120,39 @@ def define_G(input_nc, output_nc, ngf, netG, norm='batch', use_dropout=False, in
         net = HPBGenerator(input_nc, output_nc, ngf, norm_layer=norm_layer, use_dropout=use_dropout, n_blocks=9)
     else:
         raise NotImplementedError('Generator model name [%s] is not recognized' % netG)
-    return init_net(net, init_type, init_gain, gpu_ids)
+    return net
+
+
+def load_state_dict_file(path, map_location='cpu', mmap=True):
+    """
+    Load a checkpoint state dict, memory-mapping the file when its format
+    allows it and stripping a DataParallel `module.` prefix.
+    """
+    try:
+        state_dict = torch.load(path, map_location=map_location, mmap=mmap, weights_only=True)
+    except RuntimeError:
+        # Legacy (non-zipfile) checkpoints cannot be memory-mapped
+        state_dict = torch.load(path, map_location=map_location, weights_only=True)
+    if list(state_dict.keys())[0].startswith('module.'):
+        state_dict = {k[7:]: v for k, v in state_dict.items()}
+    return state_dict
+
+
+def load_G(state_dict, input_nc, output_nc, ngf, netG, norm='batch', use_dropout=False, device='cpu', use_attention=False):
+    """
+    Inference construction path for define_G generators.
+
+    The modules are built on the meta device, so no parameter storage is
+    allocated and init_weights never runs, and are then materialized by
+    assigning the checkpoint tensors directly. `state_dict` may be a dict or
+    a checkpoint path, which is memory-mapped when possible.
+    """
+    if not isinstance(state_dict, dict):
+        state_dict = load_state_dict_file(state_dict, map_location=device)
+    with torch.device('meta'):
+        net = build_G(input_nc, output_nc, ngf, netG, norm=norm, use_dropout=use_dropout, use_attention=use_attention)
+    net.load_state_dict(state_dict, assign=True)
+    return net.to(device)
 
 
 def define_D(
@@ -133,6 +191,81 @@ def define_D(
     return init_net(net, init_type, init_gain, gpu_ids)
 
 
+class Pointwise(nn.Module):
+    """
+    A 1x1, stride-1, ungrouped convolution expressed as a Linear over the
+    channel dimension, so dynamic quantization can pick it up.
+    """
+    def __init__(self, conv):
+        super(Pointwise, self).__init__()
+        self.linear = nn.Linear(conv.in_channels, conv.out_channels, bias=conv.bias is not None)
+        with torch.no_grad():
+            self.linear.weight.copy_(conv.weight[:, :, 0, 0])
+            if conv.bias is not None:
+                self.linear.bias.copy_(conv.bias)
+
+    def forward(self, x):
+        return self.linear(x.permute(0, 2, 3, 1)).permute(0, 3, 1, 2)
+
+
+def convert_pointwise(net):
+    """Replace every 1x1 convolution in `net` with an equivalent Pointwise module."""
+    for name, child in net.named_children():
+        if (isinstance(child, nn.Conv2d) and child.kernel_size == (1, 1) and child.stride == (1, 1)
+                and child.padding == (0, 0) and child.groups == 1 and child.dilation == (1, 1)):
+            setattr(net, name, Pointwise(child))
+        else:
+            convert_pointwise(child)
+    return net
+
+
+def quantize_G(net, dtype=torch.qint8):
+    """
+    Dynamic int8 quantization of a generator for CPU serving.
+
+    The HPB blocks are dominated by 1x1 convolutions (to_qkv, to_out,
+    attn_parallel_combine_out and the ff expansion), which are rewritten as
+    Linear layers and quantized with per-tensor int8 weights and dynamically
+    quantized activations. Spatial and depthwise convolutions stay fp32.
+    """
+    net = convert_pointwise(net.eval())
+    return torch.ao.quantization.quantize_dynamic(net, {nn.Linear}, dtype=dtype)
+
+
+def load_quantized_G(path, input_nc, output_nc, ngf, netG, norm='batch', use_dropout=False, use_attention=False):
+    """
+    Rebuild a quantize_G generator and load its saved int8 state dict. The
+    modules come from quantize_G, so the file only holds tensors, packed
+    params and dtypes and is read with weights_only=True like checkpoints.
+    """
+    net = quantize_G(build_G(input_nc, output_nc, ngf, netG, norm=norm, use_dropout=use_dropout, use_attention=use_attention))
+    net.load_state_dict(torch.load(path, map_location='cpu', weights_only=True))
+    return net.eval()
+
+
+def export_G_onnx(net, path, netG, input_nc=3, opset_version=17, size=256):
+    """
+    Export a generator to ONNX with a dynamic batch axis. ResNet and U-Net
+    generators also get dynamic height/width; HPB does not, since DPSA ties
+    the attention layout to the 64x64 feature map of a 256x256 input.
+    """
+    dynamic_axes = {'input': {0: 'batch'}, 'output': {0: 'batch'}}
+    if netG != 'HPB':
+        dynamic_axes = {
+            'input': {0: 'batch', 2: 'height', 3: 'width'},
+            'output': {0: 'batch', 2: 'height', 3: 'width'},
+        }
+    sample = torch.zeros(1, input_nc, size, size)
+    with torch.no_grad():
+        torch.onnx.export(
+            net.eval(), (sample,), path,
+            input_names=['input'], output_names=['output'],
+            dynamic_axes=dynamic_axes, opset_version=opset_version,
+            dynamo=False,
+        )
+    return path
+
+
 ##############################################################################
 # Classes
 ##############################################################################
@@ -141,22 +274,37 @@ def define_D(
 # Defines the GAN loss which uses either LSGAN or the regular GAN.
 # When LSGAN is used, it is basically same as MSELoss,
 # but it abstracts away the need to create the target label tensor
-# that has the same size as the input
+# that has the same size as the input.
+# With use_logits the discriminator has no final Sigmoid and the regular
+# GAN loss is BCEWithLogits, which fuses the sigmoid into the log terms
+# (one kernel, and stable for large logits).
 class GANLoss(nn.Module):
-    def __init__(self, use_lsgan=True, target_real_label=1.0, target_fake_label=0.0):
+    def __init__(self, use_lsgan=True, target_real_label=1.0, target_fake_label=0.0, use_logits=False):
         super(GANLoss, self).__init__()
         self.register_buffer('real_label', torch.tensor(target_real_label))
         self.register_buffer('fake_label', torch.tensor(target_fake_label))
         if use_lsgan:
             self.loss = nn.MSELoss()
+        elif use_logits:
+            self.loss = nn.BCEWithLogitsLoss()
         else:
             self.loss = nn.BCELoss()
+        # Expanded label views per (real, shape, dtype, device): built once
+        # per discriminator output shape instead of on every call
+        self._targets = {}
+
     def get_target_tensor(self, input, target_is_real):
-        if target_is_real:
-            target_tensor = self.real_label
-        else:
-            target_tensor = self.fake_label
-        return target_tensor.expand_as(input)
+        key = (target_is_real, input.shape, input.dtype, input.device)
+        target_tensor = self._targets.get(key)
+        if target_tensor is None:
+            label = self.real_label if target_is_real else self.fake_label
+            target_tensor = self._targets[key] = label.to(input.device, input.dtype).expand_as(input)
+        return target_tensor
+
+    def _apply(self, fn, *args, **kwargs):
+        # .to()/.cuda() replace the label buffers
+        self._targets = {}
+        return super(GANLoss, self)._apply(fn, *args, **kwargs)
 
     def __call__(self, input, target_is_real):
         target_tensor = self.get_target_tensor(input, target_is_real)
@@ -165,31 +313,57 @@ class GANLoss(nn.Module):
 #################################################################################
 #                    Critic Loss for Wassertein Gan GP                          #
 #################################################################################
+# mode='wgangp': ((||grad D(x_hat)|| - 1)^2) at random interpolates x_hat of
+# real and fake data. mode='r1': ||grad D(real)||^2 (fake_data is unused).
+# With interval=k the penalty is a lazy regularizer: the caller only adds it
+# on steps where due(step) is true, and it comes back multiplied by k so
+# the average regularization strength is the same as every step.
 class GradPenalty(nn.Module):
-    def __init__(self, use_cuda):
+    MODES = ('wgangp', 'r1')
+
+    def __init__(self, use_cuda=False, mode='wgangp', interval=1):
         super(GradPenalty, self).__init__()
+        if mode not in self.MODES:
+            raise NotImplementedError('Gradient penalty [%s] is not recognized' % mode)
         self.use_cuda = use_cuda
-    def forward(self, critic, real_data, fake_data):
-        alpha = torch.rand_like(real_data)
-
-        assignGPU = lambda x: x.cuda() if self.use_cuda else x
-        alpha = assignGPU(alpha)
-
-        interpolates = alpha*real_data + (1-alpha)*fake_data.detach()
-        interpolates = assignGPU(interpolates)
-        interpolates = torch.autograd.Variable(interpolates, requires_grad = True)
-
-        critic_interpolates = critic(interpolates)
+        self.mode = mode
+        self.interval = max(1, interval)
+        self._grad_outputs = {}
+
+    def due(self, step):
+        return step % self.interval == 0
+
+    def get_grad_outputs(self, output):
+        key = (output.shape, output.dtype, output.device)
+        grad_outputs = self._grad_outputs.get(key)
+        if grad_outputs is None:
+            grad_outputs = self._grad_outputs[key] = torch.ones_like(output)
+        return grad_outputs
+
+    def forward(self, critic, real_data, fake_data=None):
+        if self.use_cuda:
+            real_data = real_data.cuda()
+            fake_data = fake_data.cuda() if fake_data is not None else None
+
+        if self.mode == 'r1':
+            inputs = real_data.detach().requires_grad_(True)
+        else:
+            alpha = torch.rand_like(real_data)
+            inputs = torch.lerp(fake_data.detach(), real_data.detach(), alpha).requires_grad_(True)
 
+        critic_outputs = critic(inputs)
         gradients = torch.autograd.grad(
-            outputs=critic_interpolates, 
-            inputs=interpolates,
-            grad_outputs=assignGPU(torch.ones(critic_interpolates.size())),
-            create_graph=True, retain_graph=True, only_inputs=True
+            outputs=critic_outputs,
+            inputs=inputs,
+            grad_outputs=self.get_grad_outputs(critic_outputs),
+            create_graph=True, only_inputs=True
         )[0]
-        gradients = gradients.view(gradients.size(0), -1)
-        gradient_penalty = ((gradients.norm(2, dim=1)-1)**2).mean()
-        return gradient_penalty
+        gradients = gradients.reshape(gradients.size(0), -1)
+        if self.mode == 'r1':
+            penalty = gradients.pow(2).sum(dim=1).mean()
+        else:
+            penalty = ((gradients.norm(2, dim=1) - 1) ** 2).mean()
+        return penalty * self.interval
 
 #####
 #####
@@ -382,6 +556,189 @@ class DPSA(nn.Module):
         out = rearrange(out, '(b h) (x y) d -> b (h d) x y', x = h, y = w, h = self.heads)
         return self.to_out(out)
 
+class FusedDPSA(DPSA):
+    """
+    DPSA with the same parameters and outputs, computed with less transient
+    memory: heads stay a separate batch dimension instead of being folded
+    out with copies, the top-k gathers use broadcast (expanded) index views
+    rather than repeated index tensors, and attention runs through
+    scaled_dot_product_attention, which never materializes the full
+    similarity matrix. The scale stays 1, like DPSA.
+    """
+
+    def forward(self, x):
+        b, c, h, w = x.shape
+
+        x = self.norm(x)
+
+        # (b, heads, dim_head, x, y) views of the projection
+        qkv = self.to_qkv(x)
+        q, k, v = qkv.view(b, 3, self.heads, -1, *qkv.shape[-2:]).unbind(dim = 1)
+
+        q, k = map(l2norm, (q, k))
+
+        need_height_select_and_rank = self.height_top_k < h
+        need_width_select_and_rank = self.width_top_k < w
+
+        if need_width_select_and_rank or need_height_select_and_rank:
+            q_probe = q.sum(dim = (2, 3))
+
+        if need_height_select_and_rank:
+            k_height = k.sum(dim = 3)
+
+            top_h_indices = einsum('... d, ... h d -> ... h', q_probe, k_height).topk(k = self.height_top_k, dim = -1).indices
+
+            top_h_indices = top_h_indices[..., None, None].expand(-1, -1, -1, *k.shape[-2:])
+
+            k, v = map(lambda t: t.gather(2, top_h_indices), (k, v))
+
+        if need_width_select_and_rank:
+            k_width = k.sum(dim = 2)
+
+            top_w_indices = einsum('... d, ... w d -> ... w', q_probe, k_width).topk(k = self.width_top_k, dim = -1).indices
+
+            top_w_indices = top_w_indices[..., None, :, None].expand(-1, -1, k.shape[2], -1, k.shape[-1])
+
+            k, v = map(lambda t: t.gather(3, top_w_indices), (k, v))
+
+        q, k, v = (t.flatten(2, 3) for t in (q, k, v))
+
+        dropout_p = self.dropout.p if self.training else 0.
+        out = F.scaled_dot_product_attention(q, k, v, dropout_p = dropout_p, scale = 1.)
+
+        out = out.view(b, self.heads, h, w, -1).permute(0, 1, 4, 2, 3).reshape(b, -1, h, w)
+        return self.to_out(out)
+
+def fuse_attention(net):
+    """
+    Switch every DPSA in `net` to FusedDPSA in place. The two share their
+    parameters, so checkpoints load either way.
+    """
+    for module in net.modules():
+        if type(module) is DPSA:
+            module.__class__ = FusedDPSA
+    return net
+
+# inference-only rewrite of a loaded generator
+
+class FrozenChanNorm(nn.Module):
+    """ChanLayerNorm without the affine part, mean and variance in one pass."""
+
+    def __init__(self, eps = 1e-5):
+        super().__init__()
+        self.eps = eps
+
+    def forward(self, x):
+        var, mean = torch.var_mean(x, dim = 1, unbiased = False, keepdim = True)
+        return (x - mean) * (var + self.eps).rsqrt()
+
+class FrozenHPB(nn.Module):
+    """
+    HPB rewritten for inference, built from a loaded HPB:
+
+    - the ChanLayerNorm gain and bias are folded into to_qkv;
+    - to_out is folded into the attention half of attn_parallel_combine_out,
+      and the depthwise-conv half becomes its own 1x1 conv, so the two
+      branches are summed instead of concatenated;
+    - conv biases that an InstanceNorm removes again are dropped.
+    """
+
+    def __init__(self, hpb):
+        super().__init__()
+        attn = hpb.attn
+        dim = hpb.dwconv.in_channels
+
+        self.attn = FusedDPSA(
+            dim = dim,
+            height_top_k = attn.height_top_k,
+            width_top_k = attn.width_top_k,
+            dim_head = attn.dim_head,
+            heads = attn.heads
+        )
+        self.attn.norm = FrozenChanNorm(attn.norm.eps)
+
+        w_qkv = attn.to_qkv.weight.flatten(1)
+        gain, shift = attn.norm.g.flatten(), attn.norm.b.flatten()
+        self.attn.to_qkv = _pointwise_conv(w_qkv * gain, w_qkv @ shift)
+
+        w_combine = hpb.attn_parallel_combine_out.weight.flatten(1)
+        w_attn, w_conv = w_combine[:, :dim], w_combine[:, dim:]
+        w_out = attn.to_out.weight.flatten(1)
+        self.attn.to_out = _pointwise_conv(
+            w_attn @ w_out,
+            w_attn @ attn.to_out.bias + hpb.attn_parallel_combine_out.bias
+        )
+
+        self.dwconv = copy.deepcopy(hpb.dwconv)
+        self.conv_out = _pointwise_conv(w_conv, None)
+        self.ff = fold_norms(copy.deepcopy(hpb.ff))
+
+    def forward(self, x):
+        out = self.attn(x)
+        out += self.conv_out(self.dwconv(x))
+        out += x
+        return self.ff(out)
+
+def _pointwise_conv(weight, bias):
+    conv = nn.Conv2d(weight.shape[1], weight.shape[0], 1, bias = bias is not None)
+    conv.weight.data = weight.detach().reshape(*weight.shape, 1, 1).contiguous()
+    if bias is not None:
+        conv.bias.data = bias.detach().clone()
+    return conv
+
+def _fold_conv_norm(conv, norm):
+    """Fold `norm` into the preceding `conv` if possible; returns the replacement for `norm`."""
+    if isinstance(norm, nn.InstanceNorm2d) and not norm.track_running_stats:
+        # per-sample, per-channel mean subtraction cancels any conv bias
+        conv.bias = None
+        return norm
+    if isinstance(norm, nn.BatchNorm2d) and norm.track_running_stats and not norm.training:
+        scale = (norm.running_var + norm.eps).rsqrt()
+        shift = -norm.running_mean * scale
+        if norm.affine:
+            scale = scale * norm.weight
+            shift = shift * norm.weight + norm.bias
+        # Conv2d weights are (out, in, kh, kw); ConvTranspose2d (in, out, kh, kw)
+        channel_dim = 1 if isinstance(conv, nn.ConvTranspose2d) else 0
+        view = [1] * conv.weight.dim()
+        view[channel_dim] = -1
+        bias = conv.bias if conv.bias is not None else torch.zeros_like(scale)
+        conv.weight = nn.Parameter(conv.weight * scale.view(view), requires_grad = False)
+        conv.bias = nn.Parameter(bias * scale + shift, requires_grad = False)
+        return nn.Identity()
+    return norm
+
+def fold_norms(module):
+    """Fold norms into the convs right before them in every nn.Sequential of `module`."""
+    for child in module.children():
+        fold_norms(child)
+    if isinstance(module, nn.Sequential):
+        for i in range(len(module) - 1):
+            conv, norm = module[i], module[i + 1]
+            if isinstance(conv, (nn.Conv2d, nn.ConvTranspose2d)) and isinstance(norm, (nn.InstanceNorm2d, nn.BatchNorm2d)):
+                module[i + 1] = _fold_conv_norm(conv, norm)
+    return module
+
+def _freeze_hpb(module):
+    for name, child in module.named_children():
+        if isinstance(child, HPB):
+            setattr(module, name, FrozenHPB(child))
+        else:
+            _freeze_hpb(child)
+
+@torch.no_grad()
+def freeze_G(net):
+    """
+    Inference-only copy of a loaded generator: HPB blocks become FrozenHPB,
+    eval-mode BatchNorms are folded into the preceding convolutions and conv
+    biases followed by an InstanceNorm are dropped. The result has no
+    trainable state and must not be used for training.
+    """
+    net = copy.deepcopy(net).eval()
+    _freeze_hpb(net)
+    fold_norms(net)
+    return net.requires_grad_(False)
+
 #####
 #####
 
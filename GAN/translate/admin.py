@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import MedicalImage, ImageAnalysis
+from .models import MedicalImage, ImageAnalysis, SeriesTranslationJob
 
 # Register your models here.
 admin.site.register(MedicalImage)
 admin.site.register(ImageAnalysis)
+admin.site.register(SeriesTranslationJob)
@@ -1,5 +1,46 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
+# Process names (argv[0]) that serve requests; `python -m <server>` runs
+# .../<server>/__main__.py, which contains the name too
+SERVER_PROGRAMS = ('gunicorn', 'uwsgi', 'daphne', 'uvicorn', 'hypercorn')
+
+
+def serves_translations(argv=None, environ=None):
+    """
+    True for the processes that translate: WSGI/ASGI servers, Celery
+    workers and runserver (its autoreloader child, or with --noreload).
+    Other manage.py commands such as migrate or shell do not load generators.
+    """
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+    if not argv:
+        return False
+    program = argv[0]
+    if any(name in program for name in SERVER_PROGRAMS):
+        return True
+    if 'celery' in program:
+        return 'worker' in argv[1:]
+    if len(argv) > 1 and argv[1] == 'runserver':
+        # The autoreloader's parent only watches files; its child serves
+        return environ.get('RUN_MAIN') == 'true' or '--noreload' in argv
+    return False
+
 
 class TranslateConfig(AppConfig):
     name = 'translate'
+
+    def ready(self):
+        from django.conf import settings
+
+        if not serves_translations():
+            return
+        if settings.GAN_INFERENCE_BACKEND == 'pool':
+            # Before the server forks, so every child's pool maps these weights
+            from .worker_pool import preload_pool_weights
+            preload_pool_weights()
+        if settings.GAN_WARMUP_MODALITIES:
+            from .services import warm_up_generators
+            warm_up_generators()
@@ -0,0 +1,176 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+from django.conf import settings
+
+
+class _Request:
+    __slots__ = ('tensor', 'future')
+
+    def __init__(self, tensor, future):
+        self.tensor = tensor
+        self.future = future
+
+
+class _ModelWorker:
+    """Queue and thread serving one generator."""
+
+    def __init__(self, model):
+        self.model = model
+        self.queue = queue.Queue()
+        self.thread = None
+
+
+class BatchScheduler:
+    """
+    Dynamic micro-batching in front of the generators.
+
+    Callers submit preprocessed tensors of one or more images and get a
+    Future back. A worker thread per generator (i.e. per target modality)
+    collects pending requests for up to `max_wait_ms` or until
+    `max_batch_size` images are queued, runs them through the model as one batch and resolves each
+    caller's future with its slice of the output. A request that finds
+    nothing else queued is run at once, so a lone caller never pays
+    `max_wait_ms`; under load, requests queue up behind the running batch
+    and are coalesced.
+    """
+
+    def __init__(self, max_batch_size=8, max_wait_ms=10, idle_timeout=60.0):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._workers = {}
+        self.batches = 0
+        self.images = 0
+
+    def submit(self, model, tensor):
+        """
+        Queue an (N, C, H, W) or (C, H, W) tensor for `model` and return a
+        Future resolving to its (N, C', H', W') output.
+        """
+        if tensor.dim() == 3:
+            tensor = tensor.unsqueeze(0)
+        future = Future()
+        with self._lock:
+            worker = self._workers.get(id(model))
+            if worker is None:
+                worker = _ModelWorker(model)
+                worker.thread = threading.Thread(
+                    target=self._run, args=(worker,),
+                    name='gan-batch-worker', daemon=True
+                )
+                self._workers[id(model)] = worker
+                worker.thread.start()
+            worker.queue.put(_Request(tensor, future))
+        return future
+
+    def run(self, model, tensor, timeout=None):
+        return self.submit(model, tensor).result(timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'images': self.images,
+                'mean_batch_size': self.images / self.batches if self.batches else 0.0,
+                'workers': len(self._workers),
+            }
+
+    def _collect(self, worker):
+        try:
+            first = worker.queue.get(timeout=self.idle_timeout)
+        except queue.Empty:
+            return None
+
+        batch = [first]
+        images = first.tensor.shape[0]
+        if worker.queue.empty():
+            return batch
+        deadline = time.monotonic() + self.max_wait
+        while images < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    request = worker.queue.get(timeout=remaining)
+                else:
+                    request = worker.queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            images += request.tensor.shape[0]
+        return batch
+
+    def _run(self, worker):
+        while True:
+            batch = self._collect(worker)
+            if batch is None:
+                # Idle: retire the worker unless something was queued meanwhile
+                with self._lock:
+                    if worker.queue.empty():
+                        self._workers.pop(id(worker.model), None)
+                        return
+                continue
+
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+
+            # Requests can only share a forward pass when their shapes match
+            groups = {}
+            for request in batch:
+                groups.setdefault(tuple(request.tensor.shape[1:]), []).append(request)
+
+            for requests in groups.values():
+                self._forward(worker.model, requests)
+
+    def _forward(self, model, requests):
+        try:
+            inputs = torch.cat([r.tensor for r in requests])
+            with torch.no_grad():
+                outputs = model(inputs)
+        except Exception as e:
+            for r in requests:
+                r.future.set_exception(e)
+            return
+
+        with self._lock:
+            self.batches += 1
+            self.images += outputs.shape[0]
+        start = 0
+        for r in requests:
+            end = start + r.tensor.shape[0]
+            r.future.set_result(outputs[start:end])
+            start = end
+
+    def _after_fork(self):
+        # Worker threads do not survive fork(); start from a clean slate
+        self._lock = threading.Lock()
+        self._workers = {}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_batch_scheduler():
+    """Process-wide scheduler configured from GAN_BATCH_* settings."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = BatchScheduler(
+                    max_batch_size=getattr(settings, 'GAN_BATCH_MAX_SIZE', 8),
+                    max_wait_ms=getattr(settings, 'GAN_BATCH_MAX_WAIT_MS', 10),
+                )
+    return _scheduler
+
+
+def _reset_after_fork():
+    if _scheduler is not None:
+        _scheduler._after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
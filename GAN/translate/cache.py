@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+def translation_cache_key(input_sha256, target_modality, weights_digest, config):
+    """
+    Content address of a translation: the input bytes (by their SHA-256 hex
+    digest), the target modality, the generator weights and every
+    preprocessing option that changes the output.
+    """
+    h = hashlib.sha256()
+    h.update(bytes.fromhex(input_sha256))
+    h.update(target_modality.upper().encode())
+    h.update(weights_digest.encode())
+    h.update(json.dumps(config, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class TranslationCache:
+    """
+    Two-tier cache of translated PNGs keyed by translation_cache_key.
+
+    The memory tier is an LRU bounded by total bytes. The disk tier stores
+    one file per key under `directory` (sharded by the first two hex digits)
+    and is pruned oldest-first once it grows past `disk_max_bytes`; reads
+    refresh a file's mtime so pruning approximates LRU as well.
+    """
+
+    def __init__(self, directory, memory_max_bytes=64 * 1024 * 1024, disk_max_bytes=1024 * 1024 * 1024):
+        self.directory = directory
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.png')
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+        self._remember(key, data)
+        return data
+
+    def set(self, key, data):
+        self._remember(key, data)
+
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see partial files
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(data)
+            over = self._disk_bytes is None or self._disk_bytes > self.disk_max_bytes
+        if over:
+            self.prune()
+
+    def _remember(self, key, data):
+        if len(data) > self.memory_max_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.memory_max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _disk_entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def prune(self, max_bytes=None):
+        """
+        Delete the least recently used disk entries until the disk tier fits
+        in `max_bytes` (default: disk_max_bytes). Returns (files, bytes) removed.
+        """
+        max_bytes = self.disk_max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, size, _ in entries)
+
+        removed_files = removed_bytes = 0
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed_files += 1
+            removed_bytes += size
+
+        with self._lock:
+            self._disk_bytes = total
+            self.disk_evictions += removed_files
+        return removed_files, removed_bytes
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        return self.prune(max_bytes=0)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'disk_evictions': self.disk_evictions,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_bytes': self._disk_bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_translation_cache():
+    """Process-wide cache configured from GAN_TRANSLATION_CACHE_* settings."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TranslationCache(
+                    settings.GAN_TRANSLATION_CACHE_DIR,
+                    memory_max_bytes=settings.GAN_TRANSLATION_CACHE_MEMORY_BYTES,
+                    disk_max_bytes=settings.GAN_TRANSLATION_CACHE_DISK_BYTES,
+                )
+    return _cache
@@ -0,0 +1,286 @@
+import copy
+import io
+
+import numpy as np
+import pydicom
+import torch
+import torch.nn.functional as F
+from pydicom.dataset import FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+# Tags copied into DICOMData.dicom_metadata, besides the dedicated columns
+METADATA_TAGS = [
+    'StudyInstanceUID', 'SeriesInstanceUID', 'SOPInstanceUID', 'SOPClassUID',
+    'InstanceNumber', 'SeriesNumber', 'AcquisitionNumber',
+    'Rows', 'Columns', 'NumberOfFrames', 'SamplesPerPixel',
+    'BitsAllocated', 'BitsStored', 'PixelRepresentation', 'PhotometricInterpretation',
+    'RescaleSlope', 'RescaleIntercept', 'WindowCenter', 'WindowWidth',
+    'PixelSpacing', 'SliceThickness', 'SliceLocation',
+    'ImagePositionPatient', 'ImageOrientationPatient',
+    'Manufacturer', 'ManufacturerModelName', 'StudyDescription',
+]
+
+# DICOM Modality values mapped to the ones MedicalImage knows about
+MODALITY_MAP = {'CT': 'CT', 'MR': 'MRI'}
+
+# Translated DICOM output, per target modality: Modality value, storage
+# SOP class, and the value range the generator's [-1, 1] is mapped onto
+OUTPUT_MODALITY = {'CT': 'CT', 'MRI': 'MR'}
+OUTPUT_SOP_CLASS = {'CT': '1.2.840.10008.5.1.4.1.1.2', 'MRI': '1.2.840.10008.5.1.4.1.1.4'}
+OUTPUT_RANGE = {'CT': (-1024.0, 3071.0), 'MRI': (0.0, 4095.0)}
+OUTPUT_BITS = 12
+
+# Header elements that describe the source pixels and are dropped on output
+SOURCE_PIXEL_TAGS = [
+    'PixelData', 'FloatPixelData', 'DoubleFloatPixelData',
+    'SmallestImagePixelValue', 'LargestImagePixelValue', 'PixelPaddingValue',
+    'PixelPaddingRangeLimit', 'RedPaletteColorLookupTableData', 'VOILUTSequence',
+    'ModalityLUTSequence', 'LossyImageCompression', 'LossyImageCompressionRatio',
+    'LossyImageCompressionMethod', 'IconImageSequence', 'WindowCenterWidthExplanation',
+]
+
+
+def _header(source, size):
+    if hasattr(source, 'read'):
+        position = source.tell()
+        source.seek(0)
+        header = source.read(size)
+        source.seek(position)
+        return header
+    with open(source, 'rb') as f:
+        return f.read(size)
+
+
+def is_dicom(source, header=None):
+    """
+    Whether a file (path or file object) is DICOM: the 'DICM' magic after
+    the 128-byte preamble, or, for files written without the preamble, a
+    data set that starts with a group 0002/0008 element and parses into an
+    image instance (SOPClassUID or Rows). Uploads are classified and
+    inputs decoded with this same check.
+    """
+    header = header if header is not None else _header(source, 132)
+    if header[128:132] == b'DICM':
+        return True
+    if header[:2] not in (b'\x02\x00', b'\x08\x00'):
+        return False
+
+    position = source.tell() if hasattr(source, 'read') else None
+    try:
+        if position is not None:
+            source.seek(0)
+        # force=True parses almost anything, hence the instance check
+        ds = read_dicom(source, stop_before_pixels=True)
+        return 'SOPClassUID' in ds or 'Rows' in ds
+    except Exception:
+        return False
+    finally:
+        if position is not None:
+            source.seek(position)
+
+
+def read_dicom(source, stop_before_pixels=False):
+    return pydicom.dcmread(source, stop_before_pixels=stop_before_pixels, force=True)
+
+
+def _json_value(value):
+    if isinstance(value, pydicom.multival.MultiValue) or isinstance(value, (list, tuple)):
+        return [_json_value(v) for v in value]
+    if isinstance(value, float):
+        return float(value)
+    if isinstance(value, int):
+        return int(value)
+    if value is None:
+        return value
+    return str(value)
+
+
+def extract_tags(ds):
+    """
+    Map a dataset onto the DICOMData columns; everything else of interest
+    goes into `dicom_metadata`.
+    """
+    metadata = {}
+    for keyword in METADATA_TAGS:
+        if keyword in ds:
+            metadata[keyword] = _json_value(ds.data_element(keyword).value)
+
+    return {
+        'patient_id': str(ds.get('PatientID', '')) or None,
+        'study_date': str(ds.get('StudyDate', '')) or None,
+        'modality': str(ds.get('Modality', '')) or None,
+        'institution_name': str(ds.get('InstitutionName', '')) or None,
+        'series_description': str(ds.get('SeriesDescription', '')) or None,
+        'body_part_examined': str(ds.get('BodyPartExamined', '')) or None,
+        'series_instance_uid': str(ds.get('SeriesInstanceUID', '')) or None,
+        'instance_number': int(ds.InstanceNumber) if ds.get('InstanceNumber') not in (None, '') else None,
+        'dicom_metadata': metadata,
+    }
+
+
+def _first(value, default=None):
+    if value is None:
+        return default
+    if isinstance(value, pydicom.multival.MultiValue) or isinstance(value, (list, tuple)):
+        return float(value[0]) if len(value) else default
+    return float(value)
+
+
+def modality_pixels(ds):
+    """
+    Pixel data as float32 (frames, H, W) with the modality LUT (rescale
+    slope/intercept) applied. Single-frame files come back with one frame;
+    colour data is reduced to luminance.
+    """
+    pixels = ds.pixel_array
+    if int(ds.get('SamplesPerPixel', 1) or 1) > 1:
+        pixels = pixels.mean(axis=-1)
+    if pixels.ndim == 2:
+        pixels = pixels[np.newaxis]
+
+    # Always a fresh array: the scaling below works in place and must not
+    # touch the dataset's cached pixel_array
+    pixels = pixels.astype(np.float32)
+    slope = _first(ds.get('RescaleSlope'), 1.0)
+    intercept = _first(ds.get('RescaleIntercept'), 0.0)
+    if slope != 1.0:
+        pixels *= np.float32(slope)
+    if intercept != 0.0:
+        pixels += np.float32(intercept)
+    return pixels
+
+
+def window_bounds(ds, pixels):
+    """
+    The VOI window as (lower, upper). Uses WindowCenter/WindowWidth when the
+    file has them, the full pixel range otherwise.
+    """
+    center = _first(ds.get('WindowCenter'))
+    width = _first(ds.get('WindowWidth'))
+    if center is not None and width is not None and width > 1:
+        return center - width / 2.0, center + width / 2.0
+    return float(pixels.min()), float(pixels.max())
+
+
+def normalize_pixels(pixels, lower, upper, invert=False):
+    """Window float pixels into [-1, 1] in place, without an 8-bit step."""
+    scale = 2.0 / max(upper - lower, 1e-6)
+    np.clip(pixels, lower, upper, out=pixels)
+    pixels -= np.float32(lower)
+    pixels *= np.float32(scale)
+    pixels -= np.float32(1.0)
+    if invert:
+        np.negative(pixels, out=pixels)
+    return pixels
+
+
+def pixels_to_tensor(pixels, size=256, channels=3):
+    """
+    (N, H, W) float array in [-1, 1] -> (N, channels, size, size) tensor,
+    resized with bicubic interpolation like GANTranslator.preprocess.
+    `size=None` keeps the native resolution.
+    """
+    tensor = torch.from_numpy(np.ascontiguousarray(pixels)).unsqueeze(1)
+    if size is not None and tuple(tensor.shape[-2:]) != (size, size):
+        tensor = F.interpolate(tensor, size=(size, size), mode='bicubic', align_corners=False)
+        tensor = tensor.clamp_(-1.0, 1.0)
+    return tensor.expand(-1, channels, -1, -1)
+
+
+def dicom_to_tensor(ds, size=256, channels=3):
+    """
+    Decode a dataset straight to a normalized float batch: modality LUT,
+    VOI window, [-1, 1] scaling and resize, one batch entry per frame.
+    """
+    pixels = modality_pixels(ds)
+    lower, upper = window_bounds(ds, pixels)
+    invert = str(ds.get('PhotometricInterpretation', '')) == 'MONOCHROME1'
+    pixels = normalize_pixels(pixels, lower, upper, invert=invert)
+    return pixels_to_tensor(pixels, size=size, channels=channels)
+
+
+def encode_pixels(outputs, target_modality):
+    """
+    Generator outputs in [-1, 1], any shape (a whole series at once), to
+    12-bit stored values in uint16. Returns (stored, slope, intercept) with
+    value = stored * slope + intercept spanning OUTPUT_RANGE.
+    """
+    lower, upper = OUTPUT_RANGE[target_modality.upper()]
+    levels = (1 << OUTPUT_BITS) - 1
+    scaled = np.clip(outputs, -1.0, 1.0, dtype=np.float32)
+    scaled += 1.0
+    scaled *= levels / 2.0
+    np.rint(scaled, out=scaled)
+    return scaled.astype(np.uint16), (upper - lower) / levels, lower
+
+
+def translated_dataset(source, stored, target_modality, slope, intercept,
+                       series_instance_uid=None, instance_number=None):
+    """
+    A new DICOM instance for translated pixels: the source header (without
+    its pixel data) with new SOP/Series UIDs, the target Modality and SOP
+    class, and `stored` ((frames, H, W) or (H, W) uint16 from encode_pixels)
+    as MONOCHROME2 pixel data. Pass the same `series_instance_uid` for every
+    slice of a translated series.
+    """
+    target_modality = target_modality.upper()
+    stored = stored if stored.ndim == 3 else stored[np.newaxis]
+    frames, rows, columns = stored.shape
+
+    ds = pydicom.Dataset()
+    for element in source:
+        if element.keyword not in SOURCE_PIXEL_TAGS:
+            ds.add(copy.deepcopy(element))
+
+    source_rows = int(source.get('Rows', rows) or rows)
+    source_columns = int(source.get('Columns', columns) or columns)
+    if 'PixelSpacing' in source and (source_rows, source_columns) != (rows, columns):
+        spacing = [float(v) for v in source.PixelSpacing]
+        ds.PixelSpacing = [spacing[0] * source_rows / rows, spacing[1] * source_columns / columns]
+
+    ds.SOPClassUID = OUTPUT_SOP_CLASS[target_modality]
+    ds.SOPInstanceUID = generate_uid()
+    ds.SeriesInstanceUID = series_instance_uid or generate_uid()
+    ds.Modality = OUTPUT_MODALITY[target_modality]
+    ds.ImageType = ['DERIVED', 'SECONDARY']
+    ds.SeriesDescription = f"Translated to {target_modality}: {source.get('SeriesDescription', '')}".strip(': ')
+    ds.DerivationDescription = f"GAN translation from {source.get('Modality', 'unknown')} to {ds.Modality}"
+    if instance_number is not None:
+        ds.InstanceNumber = instance_number
+
+    source_reference = pydicom.Dataset()
+    source_reference.ReferencedSOPClassUID = source.get('SOPClassUID', '')
+    source_reference.ReferencedSOPInstanceUID = source.get('SOPInstanceUID', '')
+    ds.SourceImageSequence = [source_reference]
+
+    ds.Rows, ds.Columns = rows, columns
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.BitsAllocated = 16
+    ds.BitsStored = OUTPUT_BITS
+    ds.HighBit = OUTPUT_BITS - 1
+    ds.PixelRepresentation = 0
+    ds.RescaleSlope = f'{slope:.6g}'
+    ds.RescaleIntercept = f'{intercept:.6g}'
+    ds.RescaleType = 'HU' if target_modality == 'CT' else 'US'
+    lower, upper = OUTPUT_RANGE[target_modality]
+    ds.WindowCenter = f'{(lower + upper) / 2:.6g}'
+    ds.WindowWidth = f'{upper - lower:.6g}'
+    if frames > 1:
+        ds.NumberOfFrames = frames
+    elif 'NumberOfFrames' in ds:
+        del ds.NumberOfFrames
+    ds.PixelData = np.ascontiguousarray(stored).tobytes()
+
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.MediaStorageSOPClassUID = ds.SOPClassUID
+    ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    return ds
+
+
+def dataset_bytes(ds):
+    """Serialize a dataset as a DICOM Part 10 file."""
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+    return buffer.getvalue()
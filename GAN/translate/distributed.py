@@ -0,0 +1,58 @@
+import datetime
+import os
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+
+def launch(fn, args=(), nproc_per_node=1, nnodes=1, node_rank=0, master_addr='127.0.0.1', master_port=29500,
+           backend='gloo', threads=0, timeout=1800):
+    """
+    Run fn(*args) in every process of a torch.distributed process group.
+
+    Started by torchrun (RANK and WORLD_SIZE in the environment), this
+    process joins torchrun's group. Otherwise `nproc_per_node` processes are
+    spawned here, with global ranks node_rank * nproc_per_node + local rank
+    out of nnodes * nproc_per_node, and meet at master_addr:master_port. For
+    several machines run the same command on each with its own node_rank;
+    node 0 must be reachable at master_addr (gloo picks the network
+    interface from GLOO_SOCKET_IFNAME when the default one is wrong).
+
+    Each process runs `threads` torch threads; 0 splits this machine's CPUs
+    evenly between the local processes.
+    """
+    if 'RANK' in os.environ and 'WORLD_SIZE' in os.environ:
+        local_size = int(os.environ.get('LOCAL_WORLD_SIZE', 1))
+        return _run(fn, args, backend, threads or _cpus_per_process(local_size), timeout)
+    mp.start_processes(
+        _spawned, nprocs=nproc_per_node, join=True, start_method='spawn',
+        args=(fn, args, nproc_per_node, nnodes, node_rank, master_addr, master_port, backend,
+              threads or _cpus_per_process(nproc_per_node), timeout),
+    )
+
+
+def _cpus_per_process(processes):
+    return max(1, len(os.sched_getaffinity(0)) // processes)
+
+
+def _spawned(local_rank, fn, args, nproc_per_node, nnodes, node_rank, master_addr, master_port, backend, threads,
+             timeout):
+    os.environ.update({
+        'MASTER_ADDR': master_addr,
+        'MASTER_PORT': str(master_port),
+        'RANK': str(node_rank * nproc_per_node + local_rank),
+        'WORLD_SIZE': str(nnodes * nproc_per_node),
+        'LOCAL_RANK': str(local_rank),
+        'LOCAL_WORLD_SIZE': str(nproc_per_node),
+    })
+    _run(fn, args, backend, threads, timeout)
+
+
+def _run(fn, args, backend, threads, timeout):
+    torch.set_num_threads(threads)
+    dist.init_process_group(backend, init_method='env://', timeout=datetime.timedelta(seconds=timeout))
+    try:
+        return fn(*args)
+    finally:
+        dist.destroy_process_group()
@@ -0,0 +1,125 @@
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+class ExecutorSaturated(Exception):
+    """Every worker is busy and the queue is full; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Inference queue is full, retry after {retry_after}s.')
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Bounded pool for blocking inference calls made from async views.
+
+    At most `max_workers` calls run at once and `max_queue` more wait for a
+    worker; past that, submit raises ExecutorSaturated instead of queueing,
+    so a burst of uploads is turned away early rather than piling up behind
+    each other. A call that times out keeps its slot until the worker
+    actually finishes it, so the limits track the real load.
+
+    Threads are enough here: the generator forward pass releases the GIL,
+    and they share the process's loaded generators and micro-batching queue.
+    """
+
+    def __init__(self, max_workers=2, max_queue=8):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gan-inference')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._mean_seconds = None
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _retry_after(self):
+        # Called with the lock held: time for the queue ahead to drain
+        mean = self._mean_seconds or 1.0
+        waiting = max(self._pending - self.max_workers + 1, 1)
+        return max(1, math.ceil(mean * waiting / self.max_workers))
+
+    def _finished(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _timed(self, fn, args, kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.completed += 1
+                # Exponential moving average of the call duration
+                if self._mean_seconds is None:
+                    self._mean_seconds = elapsed
+                else:
+                    self._mean_seconds += 0.2 * (elapsed - self._mean_seconds)
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn(*args, **kwargs); returns a concurrent.futures.Future."""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(self._retry_after())
+            self._pending += 1
+        try:
+            future = self._executor.submit(self._timed, fn, args, kwargs)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._finished)
+        return future
+
+    async def run(self, fn, *args, timeout=None, **kwargs):
+        """
+        Await fn(*args, **kwargs) on the pool. Raises ExecutorSaturated when
+        full and TimeoutError after `timeout` seconds; a timed-out call that
+        has not started yet is dropped from the queue.
+        """
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except TimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'pending': self._pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'mean_seconds': self._mean_seconds,
+            }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_inference_executor():
+    """Process-wide executor configured from GAN_ASYNC_* settings."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = InferenceExecutor(
+                    max_workers=settings.GAN_ASYNC_WORKERS,
+                    max_queue=settings.GAN_ASYNC_QUEUE_DEPTH,
+                )
+    return _executor
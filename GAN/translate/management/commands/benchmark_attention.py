@@ -0,0 +1,74 @@
+import multiprocessing
+import time
+
+import torch
+from django.core.management.base import BaseCommand
+
+from models.networks import DPSA, FusedDPSA
+
+IMPLEMENTATIONS = {'dpsa': DPSA, 'fused': FusedDPSA}
+
+
+def _status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return 0
+
+
+def _measure(name, options, queue):
+    # Runs in a fresh process so the peak RSS belongs to this implementation
+    torch.set_num_threads(options['threads'] or torch.get_num_threads())
+    torch.manual_seed(0)
+    module = IMPLEMENTATIONS[name](options['dim'], dim_head=options['dim_head'], heads=options['heads']).eval()
+    x = torch.randn(options['batch_size'], options['dim'], options['size'], options['dim_head'])
+
+    with torch.no_grad():
+        module(x)  # warm-up
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        baseline = _status_kb('VmRSS')
+        timings = []
+        for _ in range(options['runs']):
+            start = time.perf_counter()
+            output = module(x)
+            timings.append(time.perf_counter() - start)
+    queue.put((timings, (_status_kb('VmHWM') - baseline) / 1024.0, output.numpy()))
+
+
+class Command(BaseCommand):
+    help = 'Latency and peak RSS of one DPSA attention block against FusedDPSA.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=4)
+        parser.add_argument('--dim', type=int, default=256, help='Block channels (ngf * 4 in HPBGenerator).')
+        parser.add_argument('--dim-head', type=int, default=64, help='Head size; also the feature map width DPSA expects (ngf).')
+        parser.add_argument('--heads', type=int, default=8)
+        parser.add_argument('--size', type=int, default=64, help='Feature map height.')
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--threads', type=int, default=0)
+
+    def handle(self, *args, **options):
+        ctx = multiprocessing.get_context('spawn')
+
+        self.stdout.write(
+            f"input: {options['batch_size']}x{options['dim']}x{options['size']}x{options['dim_head']}, "
+            f"{options['heads']} heads"
+        )
+        self.stdout.write(f"{'impl':<8}{'mean (ms)':>12}{'min (ms)':>12}{'peak RSS (MB)':>16}{'max abs':>12}")
+        reference = None
+        for name in IMPLEMENTATIONS:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_measure, args=(name, options, queue))
+            proc.start()
+            timings, peak, output = queue.get()
+            proc.join()
+
+            if reference is None:
+                reference = output
+            max_abs = float(abs(output - reference).max())
+            self.stdout.write(
+                f"{name:<8}{sum(timings) / len(timings) * 1000:>12.1f}{min(timings) * 1000:>12.1f}"
+                f"{peak:>16.1f}{max_abs:>12.2e}"
+            )
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import numpy as np
+import torch
+from django.core.management.base import BaseCommand
+
+from translate.batching import BatchScheduler
+from translate.services import GANTranslator
+
+
+class Command(BaseCommand):
+    help = 'Load-test the micro-batching scheduler: throughput and latency percentiles per concurrency level.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-modality', default='MRI', choices=['MRI', 'CT'])
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+        parser.add_argument('--requests', type=int, default=32, help='Requests per concurrency level.')
+        parser.add_argument('--max-batch', type=int, default=8)
+        parser.add_argument('--max-wait-ms', type=float, default=10)
+        parser.add_argument('--no-baseline', action='store_true', help='Skip the unbatched runs.')
+
+    def handle(self, *args, **options):
+        translator = GANTranslator(options['target_modality'], device='cpu')
+        model = translator.model
+        sample = torch.rand(1, 3, 256, 256) * 2 - 1
+
+        modes = ['unbatched', 'batched'] if not options['no_baseline'] else ['batched']
+
+        self.stdout.write(
+            f"{'mode':<10}{'concurrency':>12}{'req/s':>10}{'p50 (ms)':>12}{'p99 (ms)':>12}{'mean batch':>12}"
+        )
+        for name in modes:
+            for concurrency in options['concurrency']:
+                scheduler = None
+                if name == 'batched':
+                    scheduler = BatchScheduler(options['max_batch'], options['max_wait_ms'])
+                latencies, elapsed = self._run(model, sample, scheduler, concurrency, options['requests'])
+                stats = scheduler.stats() if scheduler else {'mean_batch_size': 1.0}
+                self.stdout.write(
+                    f"{name:<10}{concurrency:>12}{len(latencies) / elapsed:>10.2f}"
+                    f"{np.percentile(latencies, 50) * 1000:>12.1f}"
+                    f"{np.percentile(latencies, 99) * 1000:>12.1f}"
+                    f"{stats['mean_batch_size']:>12.2f}"
+                )
+
+    def _run(self, model, sample, scheduler, concurrency, n_requests):
+        latencies = []
+        lock = threading.Lock()
+        remaining = [n_requests]
+
+        def client():
+            while True:
+                with lock:
+                    if remaining[0] == 0:
+                        return
+                    remaining[0] -= 1
+                start = time.perf_counter()
+                if scheduler is None:
+                    with torch.no_grad():
+                        model(sample)
+                else:
+                    scheduler.run(model, sample)
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return latencies, time.perf_counter() - start
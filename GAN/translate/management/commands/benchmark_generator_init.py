@@ -0,0 +1,82 @@
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import torch
+from django.core.management.base import BaseCommand
+
+from models.networks import define_G, load_G, load_state_dict_file
+
+NET_G_OPTIONS = ['HPB', 'resnet_6blocks', 'resnet_9blocks', 'resnet_15blocks', 'unet_128', 'unet_256']
+
+
+def _construct(mode, netG, checkpoint):
+    if mode == 'define_G':
+        # What GANTranslator used to do: random init, then overwrite it
+        net = define_G(3, 3, 64, netG, norm='instance', init_type='normal', init_gain=0.02, gpu_ids=[])
+        state_dict = torch.load(checkpoint, map_location='cpu')
+        net.load_state_dict(state_dict)
+    else:
+        net = load_G(checkpoint, 3, 3, 64, netG, norm='instance')
+    return net
+
+
+def _status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return 0
+
+
+def _measure(mode, netG, checkpoint, queue):
+    # Runs in a fresh process. Importing torch peaks higher than building a
+    # generator, so the high-water mark is reset before construction.
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        baseline = _status_kb('VmRSS')
+        read_peak = lambda: _status_kb('VmHWM')
+    except OSError:
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        read_peak = lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    _construct(mode, netG, checkpoint)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, (read_peak() - baseline) / 1024.0))
+
+
+class Command(BaseCommand):
+    help = 'Compare generator construction time and peak RSS of define_G + load_state_dict against load_G.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--netG', nargs='+', default=NET_G_OPTIONS, choices=NET_G_OPTIONS)
+        parser.add_argument('--repeats', type=int, default=3)
+
+    def handle(self, *args, **options):
+        ctx = multiprocessing.get_context('spawn')
+
+        self.stdout.write(f"{'netG':<16}{'mode':<10}{'time (s)':>10}{'peak RSS (MB)':>16}")
+        with tempfile.TemporaryDirectory() as tmp:
+            for netG in options['netG']:
+                checkpoint = os.path.join(tmp, f'{netG}.pth')
+                net = define_G(3, 3, 64, netG, norm='instance', gpu_ids=[])
+                torch.save(net.state_dict(), checkpoint)
+                del net
+
+                for mode in ('define_G', 'load_G'):
+                    times, peaks = [], []
+                    for _ in range(options['repeats']):
+                        queue = ctx.Queue()
+                        proc = ctx.Process(target=_measure, args=(mode, netG, checkpoint, queue))
+                        proc.start()
+                        elapsed, peak = queue.get()
+                        proc.join()
+                        times.append(elapsed)
+                        peaks.append(peak)
+                    self.stdout.write(
+                        f"{netG:<16}{mode:<10}{min(times):>10.3f}{min(peaks):>16.1f}"
+                    )
@@ -0,0 +1,66 @@
+import copy
+import time
+
+import torch
+from django.core.management.base import BaseCommand
+
+from models.networks import fuse_attention
+from translate.services import InferenceOptions, compare_outputs, configure_threads, load_generator, optimize_generator
+
+MODES = {
+    'fp32': InferenceOptions(),
+    'fused_attention': InferenceOptions(fused_attention=True),
+    'frozen': InferenceOptions(freeze=True),
+    'frozen+trace': InferenceOptions(freeze=True, compile='trace'),
+    'channels_last': InferenceOptions(channels_last=True),
+    'bf16': InferenceOptions(bf16=True),
+    'channels_last+bf16': InferenceOptions(channels_last=True, bf16=True),
+    'trace': InferenceOptions(compile='trace'),
+    'compile': InferenceOptions(compile='compile'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Latency and accuracy (against fp32 eager) of each CPU inference mode.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-modality', default='MRI', choices=['MRI', 'CT'])
+        parser.add_argument('--netG', default='HPB')
+        parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+        parser.add_argument('--batch-size', type=int, default=1)
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--threads', type=int, default=0)
+
+    def handle(self, *args, **options):
+        configure_threads(options['threads'])
+        model, _ = load_generator(options['target_modality'], options['netG'])
+        generator = torch.Generator().manual_seed(0)
+        sample = torch.rand(options['batch_size'], 3, 256, 256, generator=generator) * 2 - 1
+
+        with torch.no_grad():
+            reference = model(sample)
+
+        self.stdout.write(f"threads: {torch.get_num_threads()}, batch size: {options['batch_size']}")
+        self.stdout.write(f"{'mode':<22}{'mean (ms)':>12}{'min (ms)':>12}{'PSNR (dB)':>12}{'max abs':>10}")
+        for name in options['modes']:
+            try:
+                runner = copy.deepcopy(model)
+                if MODES[name].fused_attention:
+                    fuse_attention(runner)
+                runner = optimize_generator(runner, MODES[name], guard=False)
+                with torch.no_grad():
+                    output = runner(sample)  # warm-up (and compilation)
+                    timings = []
+                    for _ in range(options['runs']):
+                        start = time.perf_counter()
+                        runner(sample)
+                        timings.append(time.perf_counter() - start)
+            except Exception as e:
+                self.stdout.write(f"{name:<22}failed: {e}")
+                continue
+
+            psnr, max_abs = compare_outputs(reference, output)
+            self.stdout.write(
+                f"{name:<22}{sum(timings) / len(timings) * 1000:>12.1f}{min(timings) * 1000:>12.1f}"
+                f"{psnr:>12.1f}{max_abs:>10.4f}"
+            )
@@ -0,0 +1,67 @@
+import time
+
+import torch
+from django.core.management.base import BaseCommand
+
+from models.networks import GANLoss, GradPenalty, define_D
+
+
+class Command(BaseCommand):
+    help = (
+        'Time discriminator training steps (forward, GAN loss, gradient penalty, '
+        'backward, Adam step) with the loss variants GANLoss and GradPenalty offer: '
+        'BCE on a Sigmoid output against fused BCEWithLogits, and a penalty on '
+        'every step against lazy regularization every --reg-every steps.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=8)
+        parser.add_argument('--size', type=int, default=128)
+        parser.add_argument('--ndf', type=int, default=64)
+        parser.add_argument('--steps', type=int, default=32)
+        parser.add_argument('--reg-every', type=int, default=16)
+        parser.add_argument('--penalty', choices=GradPenalty.MODES, default='r1')
+        parser.add_argument('--threads', type=int, default=0)
+
+    def _time(self, use_logits, interval, options):
+        torch.manual_seed(0)
+        netD = define_D(3, options['ndf'], 'basic', norm='instance', use_sigmoid=not use_logits)
+        criterion = GANLoss(use_lsgan=False, use_logits=use_logits)
+        penalty = GradPenalty(mode=options['penalty'], interval=interval)
+        optimizer = torch.optim.Adam(netD.parameters(), lr=2e-4, betas=(0.5, 0.999))
+        shape = (options['batch_size'], 3, options['size'], options['size'])
+        real, fake = torch.rand(shape) * 2 - 1, torch.rand(shape) * 2 - 1
+
+        def step(i):
+            loss = (criterion(netD(real), True) + criterion(netD(fake), False)) * 0.5
+            if penalty.due(i):
+                loss = loss + penalty(netD, real, fake) * 10.0
+            loss.backward()
+            optimizer.step()
+            optimizer.zero_grad(set_to_none=True)
+
+        # Warm-up covers one penalty step
+        step(0)
+        start = time.perf_counter()
+        for i in range(1, options['steps'] + 1):
+            step(i)
+        return (time.perf_counter() - start) / options['steps']
+
+    def handle(self, *args, **options):
+        if options['threads']:
+            torch.set_num_threads(options['threads'])
+        variants = [
+            ('Sigmoid + BCELoss, penalty every step', False, 1),
+            ('BCEWithLogits, penalty every step', True, 1),
+            (f"BCEWithLogits, penalty every {options['reg_every']} steps", True, options['reg_every']),
+        ]
+        self.stdout.write(
+            f"{options['penalty']} penalty, batch {options['batch_size']} x {options['size']}px, "
+            f"{options['steps']} steps"
+        )
+        self.stdout.write(f"{'variant':<44}{'ms/step':>10}{'speedup':>10}")
+        baseline = None
+        for name, use_logits, interval in variants:
+            seconds = self._time(use_logits, interval, options)
+            baseline = baseline or seconds
+            self.stdout.write(f"{name:<44}{seconds * 1000:>10.1f}{baseline / seconds:>9.2f}x")
@@ -0,0 +1,60 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from django.core.management.base import BaseCommand
+
+from translate.worker_pool import InferencePool
+
+
+def _memory_kb(pid, field):
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return 0
+
+
+class Command(BaseCommand):
+    help = (
+        'Memory and throughput of the shared-weight inference pool for several '
+        'worker counts. PSS splits shared pages between the processes mapping '
+        'them, so its total is the real footprint; the RSS total counts the '
+        'shared weights once per process, like separate worker processes would.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+        parser.add_argument('--threads-per-worker', type=int, default=1)
+        parser.add_argument('--affinity', default='')
+        parser.add_argument('--batch-size', type=int, default=1)
+        parser.add_argument('--batches', type=int, default=4, help='Batches per worker.')
+        parser.add_argument('--netG', default='HPB')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'workers':>8}{'PSS total (MB)':>16}{'RSS total (MB)':>16}{'img/s':>10}"
+        )
+        x = torch.rand(options['batch_size'], 3, 256, 256) * 2 - 1
+        for workers in options['workers']:
+            pool = InferencePool(
+                workers=workers, threads_per_worker=options['threads_per_worker'], affinity=options['affinity'],
+                buffer_images=options['batch_size'], netG=options['netG'], modalities=('MRI',),
+            ).start()
+            try:
+                with ThreadPoolExecutor(workers) as executor:
+                    # Warm-up: one batch per worker so activations are allocated
+                    list(executor.map(lambda _: pool.run('MRI', x), range(workers)))
+
+                    start = time.perf_counter()
+                    list(executor.map(lambda _: pool.run('MRI', x), range(workers * options['batches'])))
+                    elapsed = time.perf_counter() - start
+
+                pids = [os.getpid()] + pool.pids
+                pss = sum(_memory_kb(pid, 'Pss') for pid in pids) / 1024.0
+                rss = sum(_memory_kb(pid, 'Rss') for pid in pids) / 1024.0
+                images = workers * options['batches'] * options['batch_size']
+                self.stdout.write(f"{workers:>8}{pss:>16.1f}{rss:>16.1f}{images / elapsed:>10.2f}")
+            finally:
+                pool.close()
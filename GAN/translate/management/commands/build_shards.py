@@ -0,0 +1,46 @@
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from translate.models import MedicalImage
+from translate.shards import ShardStore, medical_image_source
+
+
+class Command(BaseCommand):
+    help = (
+        'Preprocess uploads into the memory-mapped shard store read by train_gan --shards '
+        'and translate_stored. Only images not in the store yet are added.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modality', choices=['CT', 'MRI'], help='Only add images of this modality.')
+        parser.add_argument('--workers', type=int, default=4, help='Decoding processes.')
+        parser.add_argument('--rebuild', action='store_true', help='Delete the store and build it from scratch.')
+
+    def handle(self, *args, **options):
+        directory = settings.GAN_SHARD_DIR
+        if options['rebuild']:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        store = ShardStore(directory, size=settings.GAN_SHARD_IMAGE_SIZE, capacity=settings.GAN_SHARD_CAPACITY)
+        if store.size != settings.GAN_SHARD_IMAGE_SIZE:
+            raise CommandError(
+                f"The store holds {store.size}px images but GAN_SHARD_IMAGE_SIZE is "
+                f"{settings.GAN_SHARD_IMAGE_SIZE}; run with --rebuild."
+            )
+
+        images = MedicalImage.objects.exclude(modality__isnull=True).exclude(modality='').select_related('dicom_data')
+        if options['modality']:
+            images = images.filter(modality=options['modality'])
+        images = images.order_by('uploaded_at')
+
+        new = (
+            (image.id, medical_image_source(image), image.modality, image.sha256)
+            for image in images.iterator() if image.id not in store and medical_image_source(image)
+        )
+        added, reused, failed = store.append(new, workers=options['workers'], log=self.stderr.write)
+        self.stdout.write(self.style.SUCCESS(
+            f"{added} images added, {reused} duplicates reusing stored rows, {failed} failed; "
+            f"{len(store)} images in {len(store.index['shards'])} shards under {directory}"
+        ))
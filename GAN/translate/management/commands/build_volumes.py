@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+
+from translate.models import DICOMData
+from translate.volume import build_series_volume
+
+
+class Command(BaseCommand):
+    help = 'Stack uploaded DICOM series into memory-mapped volumes for series-level processing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--series', nargs='+', help='SeriesInstanceUIDs to build (default: every series).')
+        parser.add_argument('--rebuild', action='store_true', help='Rebuild volumes that already exist.')
+        parser.add_argument('--min-slices', type=int, default=2, help='Skip series with fewer files.')
+
+    def handle(self, *args, **options):
+        series = (
+            DICOMData.objects.exclude(series_instance_uid__isnull=True).exclude(series_instance_uid='')
+            .values('series_instance_uid')
+            .annotate(files=Count('id'), missing=Count('id', filter=Q(volume={})))
+        )
+        if options['series']:
+            series = series.filter(series_instance_uid__in=options['series'])
+
+        for entry in series:
+            uid = entry['series_instance_uid']
+            if entry['files'] < options['min_slices']:
+                continue
+            if not entry['missing'] and not options['rebuild']:
+                continue
+            try:
+                volume = build_series_volume(uid)
+            except Exception as e:
+                self.stderr.write(f"{uid}: {e}")
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f"{uid}: {len(volume)} slices {volume.shape[1]}x{volume.shape[2]} {volume.array.dtype} -> {volume.path}"
+            ))
@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+import torch
+from django.core.management.base import BaseCommand, CommandError
+
+from translate.onnx_backend import OnnxGenerator
+from translate.services import _weights_path, export_onnx_artifact, load_generator
+
+NET_G_OPTIONS = ['HPB', 'resnet_6blocks', 'resnet_9blocks', 'resnet_15blocks', 'unet_128', 'unet_256']
+
+
+class Command(BaseCommand):
+    help = 'Export the generators with their loaded weights to ONNX and check ONNX Runtime against PyTorch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-modality', nargs='+', default=['MRI', 'CT'], choices=['MRI', 'CT'])
+        parser.add_argument('--netG', nargs='+', default=['HPB'], choices=NET_G_OPTIONS)
+        parser.add_argument('--opset', type=int, default=17)
+        parser.add_argument('--allow-random', action='store_true', help='Export even when no checkpoint exists.')
+
+    def handle(self, *args, **options):
+        for target_modality in options['target_modality']:
+            for netG in options['netG']:
+                weights_path = _weights_path(target_modality, netG)
+                if not os.path.exists(weights_path) and not options['allow_random']:
+                    raise CommandError(f'No {netG} checkpoint for {target_modality} at {weights_path}.')
+
+                model, _ = load_generator(target_modality, netG)
+                path = export_onnx_artifact(model, weights_path, netG, opset_version=options['opset'])
+
+                sample = torch.rand(2, 3, 256, 256) * 2 - 1
+                with torch.no_grad():
+                    reference = model(sample).numpy()
+                output = OnnxGenerator(path).run(sample.numpy())
+                max_abs = float(np.abs(reference - output).max())
+
+                self.stdout.write(self.style.SUCCESS(
+                    f'{target_modality} {netG}: wrote {path} '
+                    f'({os.path.getsize(path) / 1e6:.1f} MB, max abs diff vs PyTorch {max_abs:.2e})'
+                ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from translate.cache import get_translation_cache
+
+
+class Command(BaseCommand):
+    help = 'Prune the on-disk translation cache down to a size budget, oldest entries first.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-bytes', type=int, default=None,
+            help='Size budget for the disk tier (default: GAN_TRANSLATION_CACHE_DISK_BYTES).'
+        )
+        parser.add_argument('--clear', action='store_true', help='Remove every cached translation.')
+
+    def handle(self, *args, **options):
+        cache = get_translation_cache()
+        if options['clear']:
+            files, freed = cache.clear()
+        else:
+            files, freed = cache.prune(max_bytes=options['max_bytes'])
+
+        stats = cache.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {files} cached translations ({freed / (1024 * 1024):.1f} MB); "
+            f"{stats['disk_bytes'] / (1024 * 1024):.1f} MB left in {cache.directory}"
+        ))
@@ -0,0 +1,65 @@
+import copy
+import glob
+import os
+import time
+
+import torch
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from models.networks import quantize_G
+from translate.services import (
+    _weights_path, compare_outputs, image_to_tensor, load_generator, save_quantized_artifact
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Quantize the generators to int8 (dynamic quantization of the 1x1 convolutions), '
+        'save the artifacts next to the fp32 checkpoints and report size, latency and '
+        'image-quality deltas on sample images from medical_images/.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-modality', nargs='+', default=['MRI', 'CT'], choices=['MRI', 'CT'])
+        parser.add_argument('--netG', default='HPB')
+        parser.add_argument('--samples', type=int, default=8, help='Images drawn from medical_images/ for evaluation.')
+
+    def handle(self, *args, **options):
+        paths = sorted(
+            glob.glob(os.path.join(settings.MEDIA_ROOT, 'medical_images', '**', '*.png'), recursive=True)
+            + glob.glob(os.path.join(settings.MEDIA_ROOT, 'medical_images', '**', '*.jpg'), recursive=True)
+        )[:options['samples']]
+        if not paths:
+            raise CommandError('No sample images found under medical_images/.')
+        batch = torch.cat([image_to_tensor(Image.open(path)) for path in paths])
+
+        for target_modality in options['target_modality']:
+            weights_path = _weights_path(target_modality, options['netG'])
+            if not os.path.exists(weights_path):
+                raise CommandError(f'No checkpoint for {target_modality} at {weights_path}.')
+
+            model, _ = load_generator(target_modality, options['netG'])
+            quantized = quantize_G(copy.deepcopy(model))
+
+            artifact = save_quantized_artifact(quantized, weights_path)
+
+            fp32_ms, reference = self._run(model, batch)
+            int8_ms, output = self._run(quantized, batch)
+            psnr, max_abs = compare_outputs(reference, output)
+
+            self.stdout.write(self.style.SUCCESS(f'{target_modality}: saved {artifact}'))
+            self.stdout.write(f"  size     fp32 {os.path.getsize(weights_path) / 1e6:8.1f} MB   int8 {os.path.getsize(artifact) / 1e6:8.1f} MB")
+            self.stdout.write(f"  latency  fp32 {fp32_ms:8.1f} ms   int8 {int8_ms:8.1f} ms   (per image, {len(paths)} images)")
+            self.stdout.write(f"  quality  PSNR {psnr:.2f} dB, max abs diff {max_abs:.4f} against fp32")
+
+    def _run(self, model, batch):
+        outputs = []
+        with torch.no_grad():
+            model(batch[:1])  # warm-up
+            start = time.perf_counter()
+            for i in range(batch.shape[0]):
+                outputs.append(model(batch[i:i + 1]))
+            elapsed = time.perf_counter() - start
+        return elapsed / batch.shape[0] * 1000, torch.cat(outputs)
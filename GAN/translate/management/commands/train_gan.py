@@ -0,0 +1,127 @@
+import os
+
+import torch
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from translate.models import MedicalImage
+from translate.services import _weights_path
+from translate.shards import ShardDataset, ShardStore, medical_image_source
+from translate.distributed import launch
+from translate.training import SliceDataset, UnpairedDataset, train
+
+
+def training_sources(modality):
+    """SliceDataset sources for every upload of a modality."""
+    images = MedicalImage.objects.filter(modality=modality).select_related('dicom_data')
+    return [source for source in map(medical_image_source, images) if source is not None]
+
+
+class Command(BaseCommand):
+    help = (
+        'Train the CT <-> MRI CycleGAN on the uploaded images and write '
+        'latest_net_G_A.pth (CT -> MRI) and latest_net_G_B.pth (MRI -> CT), with a .<netG> suffix for '
+        'architectures other than HPB.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--netG', default='HPB')
+        parser.add_argument('--ngf', type=int, default=64)
+        parser.add_argument('--netD', default='basic')
+        parser.add_argument('--ndf', type=int, default=64)
+        parser.add_argument('--n-layers-D', type=int, default=3)
+        parser.add_argument('--size', type=int, default=256, help='Training image size (HPB needs 256).')
+        parser.add_argument('--batch-size', type=int, default=1)
+        parser.add_argument('--accumulate', type=int, default=1, help='Batches per optimizer step.')
+        parser.add_argument('--niter', type=int, default=100, help='Epochs at the initial learning rate.')
+        parser.add_argument('--niter-decay', type=int, default=100, help='Epochs of linear decay to zero.')
+        parser.add_argument('--lr', type=float, default=2e-4)
+        parser.add_argument('--lambda-cycle', type=float, default=10.0)
+        parser.add_argument('--lambda-identity', type=float, default=0.5)
+        parser.add_argument('--pool-size', type=int, default=50)
+        parser.add_argument('--gan-mode', choices=['lsgan', 'vanilla'], default='lsgan')
+        parser.add_argument('--r1-gamma', type=float, default=0.0, help='R1 penalty weight on the discriminators (0: off).')
+        parser.add_argument('--reg-every', type=int, default=16, help='Batches between lazy R1 penalty steps.')
+        parser.add_argument('--amp', action='store_true', help='bfloat16 autocast on the CPU.')
+        parser.add_argument('--workers', type=int, default=4, help='DataLoader worker processes.')
+        parser.add_argument('--prefetch', type=int, default=2, help='Batches prefetched per worker.')
+        parser.add_argument('--threads', type=int, default=0, help='torch intra-op threads (0: default).')
+        parser.add_argument('--device', default='cpu')
+        parser.add_argument('--output-dir', help='Checkpoint directory (default: the directory GANTranslator loads from).')
+        parser.add_argument('--save-every', type=int, default=5, help='Epochs between checkpoints.')
+        parser.add_argument('--log-every', type=int, default=50, help='Batches between throughput logs.')
+        parser.add_argument('--resume', action='store_true', help='Continue from latest_train_state.pth.')
+        parser.add_argument('--nproc-per-node', type=int, default=1, help='Training processes on this machine.')
+        parser.add_argument('--nnodes', type=int, default=1, help='Machines taking part in the training.')
+        parser.add_argument('--node-rank', type=int, default=0, help='Index of this machine (0 hosts the rendezvous).')
+        parser.add_argument('--master-addr', default=settings.GAN_DDP_MASTER_ADDR)
+        parser.add_argument('--master-port', type=int, default=settings.GAN_DDP_MASTER_PORT)
+        parser.add_argument('--bucket-cap-mb', type=int, default=settings.GAN_DDP_BUCKET_CAP_MB,
+                            help='DistributedDataParallel gradient bucket size.')
+        parser.add_argument('--find-unused-parameters', action='store_true',
+                            help='For generators with parameters a forward pass does not use.')
+        parser.add_argument(
+            '--shards', action='store_true',
+            help='Read preprocessed images from the shard store (manage.py build_shards) instead of decoding uploads.'
+        )
+
+    def handle(self, *args, **options):
+        if options['shards']:
+            store = ShardStore(settings.GAN_SHARD_DIR)
+            if store.size != options['size']:
+                raise CommandError(f"The shard store holds {store.size}px images, not {options['size']}px.")
+            sources_a, sources_b = store.ids('CT'), store.ids('MRI')
+            dataset_a = ShardDataset(settings.GAN_SHARD_DIR, sources_a)
+            dataset_b = ShardDataset(settings.GAN_SHARD_DIR, sources_b)
+        else:
+            sources_a, sources_b = training_sources('CT'), training_sources('MRI')
+            dataset_a = SliceDataset(sources_a, size=options['size'])
+            dataset_b = SliceDataset(sources_b, size=options['size'])
+        if not sources_a or not sources_b:
+            raise CommandError(f"Need CT and MRI images; found {len(sources_a)} CT and {len(sources_b)} MRI.")
+        dataset = UnpairedDataset(dataset_a, dataset_b)
+        world_size = int(os.environ.get('WORLD_SIZE', options['nproc_per_node'] * options['nnodes']))
+        batches = len(dataset) // world_size // options['batch_size']
+        if not batches:
+            raise CommandError(
+                f"{len(dataset)} images are fewer than one batch of {options['batch_size']} "
+                f"for each of {world_size} processes."
+            )
+
+        trainer_options = dict(
+            netG=options['netG'], ngf=options['ngf'], netD=options['netD'], ndf=options['ndf'],
+            n_layers_D=options['n_layers_D'], lr=options['lr'], lambda_cycle=options['lambda_cycle'],
+            lambda_identity=options['lambda_identity'], pool_size=options['pool_size'], amp=options['amp'],
+            accumulate=options['accumulate'], device=options['device'],
+            niter=options['niter'], niter_decay=options['niter_decay'],
+            gan_mode=options['gan_mode'], r1_gamma=options['r1_gamma'], reg_every=options['reg_every'],
+            bucket_cap_mb=options['bucket_cap_mb'], find_unused_parameters=options['find_unused_parameters'],
+        )
+        loader_options = dict(
+            batch_size=options['batch_size'], num_workers=options['workers'], prefetch_factor=options['prefetch'],
+            pin_memory=options['device'].startswith('cuda'),
+        )
+        fit_options = dict(save_every=options['save_every'], log_every=options['log_every'])
+        output_dir = options['output_dir'] or os.path.dirname(_weights_path('MRI'))
+
+        self.stdout.write(
+            f"{len(sources_a)} CT / {len(sources_b)} MRI images, {batches} batches of "
+            f"{options['batch_size']} per epoch and process, {world_size} processes, "
+            f"{options['workers']} loader workers each"
+        )
+        args = (dataset, trainer_options, loader_options, output_dir,
+                options['niter'] + options['niter_decay'], fit_options, options['resume'])
+        if world_size > 1 or 'WORLD_SIZE' in os.environ:
+            # Spawned processes log with print; Django's stdout wrapper
+            # does not cross the process boundary
+            launch(
+                train, args, nproc_per_node=options['nproc_per_node'], nnodes=options['nnodes'],
+                node_rank=options['node_rank'], master_addr=options['master_addr'],
+                master_port=options['master_port'], backend=settings.GAN_DDP_BACKEND, threads=options['threads'],
+            )
+        else:
+            if options['threads']:
+                torch.set_num_threads(options['threads'])
+            train(*args, log=self.stdout.write)
+        if options['node_rank'] == 0:
+            self.stdout.write(self.style.SUCCESS(f"Generators written to {output_dir}"))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from translate.models import MedicalImage
+from translate.tasks import translate_stored
+
+
+class Command(BaseCommand):
+    help = (
+        'Translate uploads in batches straight from the shard store built by build_shards. '
+        'Only images without a translation are picked up unless --retranslate is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modality', choices=['CT', 'MRI'], help='Only translate images of this modality.')
+        parser.add_argument('--retranslate', action='store_true', help='Also redo images that are already translated.')
+        parser.add_argument('--queue', action='store_true', help='Hand the batch to a Celery worker instead.')
+
+    def handle(self, *args, **options):
+        images = MedicalImage.objects.filter(modality__in=['CT', 'MRI'])
+        if options['modality']:
+            images = images.filter(modality=options['modality'])
+        if not options['retranslate']:
+            images = images.exclude(translation_status='COMPLETED')
+        image_ids = [str(pk) for pk in images.order_by('uploaded_at').values_list('pk', flat=True)]
+
+        if options['queue']:
+            result = translate_stored.delay(image_ids)
+            self.stdout.write(self.style.SUCCESS(f"Queued {len(image_ids)} images as task {result.id}"))
+            return
+
+        results = translate_stored(image_ids)
+        completed = sum(status == 'COMPLETED' for status in results.values())
+        for pk, status in results.items():
+            if status != 'COMPLETED':
+                self.stderr.write(f"{pk}: {status}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{completed} images translated, {len(results) - completed} failed, "
+            f"{len(image_ids) - len(results)} not in the shard store"
+        ))
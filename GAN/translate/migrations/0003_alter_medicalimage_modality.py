@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('translate', '0002_medicalimage_translated_image_dicomdata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='medicalimage',
+            name='modality',
+            field=models.CharField(blank=True, choices=[('CT', 'CT'), ('MRI', 'MRI')], max_length=10, null=True),
+        ),
+    ]
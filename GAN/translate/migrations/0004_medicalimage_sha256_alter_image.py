@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('translate', '0003_alter_medicalimage_modality'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalimage',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='medicalimage',
+            name='image',
+            field=models.FileField(upload_to='medical_images/%Y/%m/%d/'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('translate', '0004_medicalimage_sha256_alter_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dicomdata',
+            name='instance_number',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dicomdata',
+            name='series_instance_uid',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='dicomdata',
+            name='volume',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
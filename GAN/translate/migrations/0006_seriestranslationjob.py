@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:22
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('translate', '0005_dicomdata_series_volume'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeriesTranslationJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('series_instance_uid', models.CharField(db_index=True, max_length=64)),
+                ('target_modality', models.CharField(choices=[('CT', 'CT'), ('MRI', 'MRI')], max_length=10)),
+                ('batch_size', models.PositiveIntegerField(default=8)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('total_slices', models.PositiveIntegerField(default=0)),
+                ('completed_slices', models.PositiveIntegerField(default=0)),
+                ('slices_per_second', models.FloatField(blank=True, null=True)),
+                ('output_dir', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('translate', '0006_seriestranslationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalimage',
+            name='translated_dicom',
+            field=models.FileField(blank=True, null=True, upload_to='translated_dicom/%Y/%m/%d/'),
+        ),
+        migrations.AddField(
+            model_name='seriestranslationjob',
+            name='output_format',
+            field=models.CharField(choices=[('png', 'PNG'), ('dicom', 'DICOM')], default='png', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='seriestranslationjob',
+            name='output_series_uid',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('translate', '0007_translated_dicom_output'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageanalysis',
+            name='model_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='imageanalysis',
+            name='prompt_version',
+            field=models.CharField(blank=True, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='imageanalysis',
+            name='reused_from',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reuses', to='translate.imageanalysis'),
+        ),
+        migrations.AddField(
+            model_name='medicalimage',
+            name='perceptual_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='imageanalysis',
+            index=models.Index(fields=['model_name', 'prompt_version', 'created_at'], name='translate_i_model_n_39f389_idx'),
+        ),
+    ]
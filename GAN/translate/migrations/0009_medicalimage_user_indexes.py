@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('translate', '0008_analysis_dedup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalimage',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='medical_images', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='medicalimage',
+            index=models.Index(fields=['user', '-uploaded_at'], name='medimage_user_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalimage',
+            index=models.Index(fields=['-uploaded_at'], name='medimage_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalimage',
+            index=models.Index(fields=['translation_status', '-uploaded_at'], name='medimage_status_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalimage',
+            index=models.Index(fields=['modality', '-uploaded_at'], name='medimage_modality_uploaded_idx'),
+        ),
+    ]
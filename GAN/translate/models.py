@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 import uuid
 
@@ -8,16 +9,33 @@ class MedicalImage(models.Model):
     ]
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    image = models.ImageField(upload_to='medical_images/%Y/%m/%d/')
+    # Uploader; null for anonymous and older uploads
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='medical_images'
+    )
+    # FileField: DICOM uploads are not images PIL can validate
+    image = models.FileField(upload_to='medical_images/%Y/%m/%d/')
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    # 64-bit difference hash (hex) of the pixels, set when the image is analyzed
+    perceptual_hash = models.CharField(max_length=16, blank=True, db_index=True)
     image_type = models.CharField(max_length=20, choices=INPUT_TYPE_CHOICES, blank=True)
     modality = models.CharField(max_length=10, choices=[('CT', 'CT'), ('MRI', 'MRI')], blank=True, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     translation_status = models.CharField(max_length=50, default='PENDING')
     analyzed_at = models.DateTimeField(null=True, blank=True)
     translated_image = models.ImageField(upload_to='translated_images/%Y/%m/%d/', blank=True, null=True)
+    translated_dicom = models.FileField(upload_to='translated_dicom/%Y/%m/%d/', blank=True, null=True)
     
     class Meta:
         ordering = ['-uploaded_at']
+        # The list endpoint pages by -uploaded_at, per user or after a
+        # status/modality filter; each index serves one of those scans
+        indexes = [
+            models.Index(fields=['user', '-uploaded_at'], name='medimage_user_uploaded_idx'),
+            models.Index(fields=['-uploaded_at'], name='medimage_uploaded_idx'),
+            models.Index(fields=['translation_status', '-uploaded_at'], name='medimage_status_uploaded_idx'),
+            models.Index(fields=['modality', '-uploaded_at'], name='medimage_modality_uploaded_idx'),
+        ]
     
     def __str__(self):
         return f"{self.image_type} - {self.uploaded_at.strftime('%Y-%m-%d %H:%M')}"
@@ -37,10 +55,18 @@ class ImageAnalysis(models.Model):
     confidence_score = models.FloatField(null=True, blank=True)
     raw_analysis = models.TextField()
     disclaimer = models.TextField()
+    # What produced the report; analyses are only reused for the same pair
+    model_name = models.CharField(max_length=100, blank=True)
+    prompt_version = models.CharField(max_length=16, blank=True)
+    # The analysis of identical (or near-identical) content this one was copied from
+    reused_from = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='reuses'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         verbose_name_plural = "Image Analyses"
+        indexes = [models.Index(fields=['model_name', 'prompt_version', 'created_at'])]
     
     def __str__(self):
         return f"Analysis for {self.medical_image}"
@@ -59,8 +85,60 @@ class DICOMData(models.Model):
     institution_name = models.CharField(max_length=256, blank=True, null=True)
     series_description = models.CharField(max_length=256, blank=True, null=True)
     body_part_examined = models.CharField(max_length=128, blank=True, null=True)
+    series_instance_uid = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    instance_number = models.IntegerField(blank=True, null=True)
     dicom_metadata = models.JSONField(default=dict, blank=True)
+    # {'path': <.npy relative to GAN_VOLUME_DIR>, 'index': <slice>} once the
+    # series has been stacked by translate.volume.build_series_volume
+    volume = models.JSONField(default=dict, blank=True)
     
 
     def __str__(self):
-        return f"{self.patient_id} | {self.modality}"
\ No newline at end of file
+        return f"{self.patient_id} | {self.modality}"
+
+class SeriesTranslationJob(models.Model):
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('PROCESSING', 'Processing'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Requester; jobs are only visible to them (and staff)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='series_translation_jobs'
+    )
+    series_instance_uid = models.CharField(max_length=64, db_index=True)
+    target_modality = models.CharField(max_length=10, choices=[('CT', 'CT'), ('MRI', 'MRI')])
+    batch_size = models.PositiveIntegerField(default=8)
+    output_format = models.CharField(max_length=10, choices=[('png', 'PNG'), ('dicom', 'DICOM')], default='png')
+    # Fixed on the first run so resumed DICOM output stays one series
+    output_series_uid = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    error = models.TextField(blank=True)
+
+    # Progress, saved after every finished batch; a restarted job resumes
+    # from completed_slices
+    total_slices = models.PositiveIntegerField(default=0)
+    completed_slices = models.PositiveIntegerField(default=0)
+    slices_per_second = models.FloatField(null=True, blank=True)
+    output_dir = models.CharField(max_length=255, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def eta_seconds(self):
+        if self.status != 'PROCESSING' or not self.slices_per_second:
+            return None
+        return (self.total_slices - self.completed_slices) / self.slices_per_second
+
+    def __str__(self):
+        return f"{self.series_instance_uid} -> {self.target_modality} ({self.status})"
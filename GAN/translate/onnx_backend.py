@@ -0,0 +1,54 @@
+"""
+ONNX Runtime execution of exported generators.
+
+An alternative runtime for the generator inside GANTranslator
+(GAN_INFERENCE_BACKEND=onnx): preprocessing, batching and tiling still run
+on torch tensors, so serving processes import PyTorch either way.
+"""
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:  # optional dependency
+    ort = None
+
+
+def onnx_path(weights_path):
+    """Where manage.py export_onnx writes the model for a checkpoint."""
+    root = weights_path[:-len('.pth')] if weights_path.endswith('.pth') else weights_path
+    return f'{root}.onnx'
+
+
+class OnnxGenerator:
+    """
+    Runs an exported generator with the ONNX Runtime CPU provider.
+
+    Accepts numpy arrays, or torch tensors so it can stand in for the torch
+    module inside GANTranslator (batching, tiling and translate_tensor).
+    """
+
+    def __init__(self, path, num_threads=0):
+        if ort is None:
+            raise ImportError('onnxruntime is required for the ONNX backend')
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def run(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run(None, {self.input_name: batch})[0]
+
+    def __call__(self, batch):
+        if hasattr(batch, 'detach'):
+            import torch
+            output = self.run(batch.detach().cpu().float().numpy())
+            return torch.from_numpy(output)
+        return self.run(batch)
+
+    def eval(self):
+        return self
+
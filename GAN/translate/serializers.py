@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import MedicalImage, ImageAnalysis
+from django.conf import settings
+from .models import MedicalImage, ImageAnalysis, DICOMData, SeriesTranslationJob
+from .uploads import classify_upload, file_sha256
 
 class ImageAnalysisSerializer(serializers.ModelSerializer):
     class Meta:
@@ -7,20 +9,37 @@ class ImageAnalysisSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'image_type_detected', 'observations', 
             'potential_conditions', 'recommendations', 
-            'confidence_score', 'disclaimer', 'created_at'
+            'confidence_score', 'disclaimer', 'model_name', 'prompt_version',
+            'reused_from', 'created_at'
+        ]
+
+class DICOMDataSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DICOMData
+        # The header summary; the full dicom_metadata is left out of listings
+        fields = [
+            'patient_id', 'study_date', 'modality', 'institution_name', 'series_description',
+            'body_part_examined', 'series_instance_uid', 'instance_number'
         ]
 
 class MedicalImageSerializer(serializers.ModelSerializer):
     analysis = ImageAnalysisSerializer(read_only=True)
+    dicom_data = DICOMDataSerializer(read_only=True)
     image_url = serializers.SerializerMethodField()
+    # Plain FileField: validation reads headers only, no full PIL decode
+    image = serializers.FileField()
+    # Format of the translation the upload task writes; not a model field
+    output_format = serializers.CharField(write_only=True, required=False)
     
     class Meta:
         model = MedicalImage
         fields = [
-            'id', 'image', 'image_url', 'image_type',
-            'uploaded_at', 'analyzed_at', 'analysis'
+            'id', 'user', 'image', 'image_url', 'image_type', 'modality', 'translation_status', 'sha256',
+            'translated_dicom', 'uploaded_at', 'analyzed_at', 'analysis', 'dicom_data', 'output_format'
+        ]
+        read_only_fields = [
+            'id', 'user', 'modality', 'translation_status', 'sha256', 'translated_dicom', 'uploaded_at', 'analyzed_at'
         ]
-        read_only_fields = ['id', 'uploaded_at', 'analyzed_at']
     
     def get_image_url(self, obj):
         request = self.context.get('request')
@@ -28,26 +47,88 @@ class MedicalImageSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.image.url)
         return None
 
+    def validate_output_format(self, value):
+        value = value.lower()
+        if value not in ('png', 'dicom'):
+            raise serializers.ValidationError("output_format must be either 'png' or 'dicom'.")
+        return value
+
+    def create(self, validated_data):
+        validated_data.pop('output_format', None)
+        return super().create(validated_data)
+
     def validate(self, data):
         """
-        Custom validation to check the file extension and set the image_type.
+        Custom validation to check the file header and set the image_type.
+        Streamed uploads (StreamingUploadHandler) arrive classified and hashed.
         """
         uploaded_file = data.get('image')
         if not uploaded_file:
             raise serializers.ValidationError("An image file must be provided.")
         
-        file_name = uploaded_file.name.lower()
-        
-        if file_name.endswith(('.dcm', '.dicom')):
-            data['image_type'] = 'DICOM'
-        elif file_name.endswith(('.jpg', '.jpeg', '.png')):
-            data['image_type'] = 'IMAGE'
+        if hasattr(uploaded_file, 'image_type'):
+            image_type = uploaded_file.image_type
         else:
+            image_type = classify_upload(uploaded_file)
+
+        if image_type is None:
             raise serializers.ValidationError(
                 "Unsupported file type. Only DICOM (.dcm), JPEG (.jpg), or PNG (.png) are accepted."
             )
+        data['image_type'] = image_type
+        data['sha256'] = getattr(uploaded_file, 'sha256', None) or file_sha256(uploaded_file)
             
         return data
 
 
+class SeriesTranslationJobSerializer(serializers.ModelSerializer):
+    target_modality = serializers.ChoiceField(choices=['CT', 'MRI'], required=False)
+    batch_size = serializers.IntegerField(min_value=1, max_value=64, required=False)
+    progress = serializers.SerializerMethodField()
+    eta_seconds = serializers.FloatField(read_only=True)
+    manifest_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SeriesTranslationJob
+        fields = [
+            'id', 'series_instance_uid', 'target_modality', 'batch_size', 'output_format',
+            'output_series_uid', 'status', 'error',
+            'total_slices', 'completed_slices', 'progress', 'slices_per_second', 'eta_seconds',
+            'output_dir', 'manifest_url', 'created_at', 'started_at', 'updated_at', 'finished_at'
+        ]
+        read_only_fields = [
+            'id', 'output_series_uid', 'status', 'error', 'total_slices', 'completed_slices', 'slices_per_second',
+            'output_dir', 'created_at', 'started_at', 'updated_at', 'finished_at'
+        ]
+
+    def get_progress(self, obj):
+        return obj.completed_slices / obj.total_slices if obj.total_slices else 0.0
+
+    def get_manifest_url(self, obj):
+        request = self.context.get('request')
+        if obj.status == 'COMPLETED' and request:
+            return request.build_absolute_uri(f"{settings.MEDIA_URL}{obj.output_dir}/manifest.json")
+        return None
+
+    def validate(self, data):
+        """
+        The series must have uploaded DICOM files, all of them the
+        requester's own unless they are staff. Without a target modality
+        the series is translated to the other one, like single images.
+        """
+        rows = DICOMData.objects.filter(series_instance_uid=data['series_instance_uid'])
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+        # The job translates every file of the series, so another user's
+        # slice in it is as good as not uploaded
+        if not rows.exists() or (
+            user is not None and not user.is_staff and rows.exclude(medical_image__user=user).exists()
+        ):
+            raise serializers.ValidationError("No DICOM files have been uploaded for this series.")
+        modality = rows.values_list('modality', flat=True).first()
 
+        if not data.get('target_modality'):
+            data['target_modality'] = 'CT' if modality == 'MR' else 'MRI'
+        data.setdefault('batch_size', settings.GAN_BATCH_MAX_SIZE)
+        data.setdefault('output_format', settings.GAN_OUTPUT_FORMAT)
+        return data
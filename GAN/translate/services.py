@@ -1,23 +1,46 @@
-import google.genai as genai
+import asyncio
+import copy
+import hashlib
+import io
 import json
+import os
 import re
+import tarfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+
+import google.genai as genai
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from asgiref.sync import async_to_sync, sync_to_async
 from django.conf import settings
 from django.utils import timezone
-from .models import ImageAnalysis
+from google.genai import types as genai_types
 from PIL import Image
-import io
 
-class MedicalImageAnalyzer:
-    def __init__(self):
-        self.client = genai.Client(api_key=settings.GEMINI_API_KEY)
-    
-    def analyze_image(self, medical_image):
-        """Analyze medical image using Gemini API"""
-        
-        image_path = medical_image.image.path
-        
-        # Create analysis prompt
-        prompt = """Analyze this medical image and provide a detailed report in JSON format.
+from .batching import get_batch_scheduler
+from .cache import get_translation_cache, translation_cache_key
+from .dicom import dataset_bytes, dicom_to_tensor, encode_pixels, is_dicom, read_dicom, translated_dataset
+from .models import DICOMData, ImageAnalysis
+from .onnx_backend import OnnxGenerator, onnx_path
+from .tiling import tiled_forward
+from .training import generator_filename
+from .worker_pool import PooledGenerator, get_inference_pool
+
+# Import network definitions
+try:
+    from models.networks import define_G, export_G_onnx, freeze_G, fuse_attention, load_G, load_quantized_G, quantize_G
+except ImportError:
+    try:
+        from GAN.models.networks import define_G, export_G_onnx, freeze_G, fuse_attention, load_G, load_quantized_G, quantize_G
+    except ImportError:
+         # Fallback for relative import if run as package
+        from ..models.networks import define_G, export_G_onnx, freeze_G, fuse_attention, load_G, load_quantized_G, quantize_G
+
+ANALYSIS_PROMPT = """Analyze this medical image and provide a detailed report in JSON format.
 
 Your response must be ONLY valid JSON with these exact keys:
 {
@@ -39,144 +62,854 @@ Important guidelines:
 
 Return ONLY the JSON object, no markdown formatting."""
 
+# Stored on every ImageAnalysis; editing the prompt stops older reports
+# from being reused
+ANALYSIS_PROMPT_VERSION = hashlib.sha256(ANALYSIS_PROMPT.encode()).hexdigest()[:12]
+
+_genai_client = None
+_genai_client_lock = threading.Lock()
+
+
+def get_genai_client():
+    """
+    Process-wide Gemini client. It keeps its HTTP connection pool, so
+    analyses reuse connections instead of opening a client per request.
+    """
+    global _genai_client
+    if _genai_client is None:
+        with _genai_client_lock:
+            if _genai_client is None:
+                _genai_client = genai.Client(api_key=settings.GEMINI_API_KEY)
+    return _genai_client
+
+
+def _reset_genai_client_after_fork():
+    # Connections of the parent's pool must not be shared with a child
+    global _genai_client
+    _genai_client = None
+
+
+os.register_at_fork(after_in_child=_reset_genai_client_after_fork)
+
+
+def _to_8bit(image):
+    if image.mode in ('I', 'I;16', 'F'):
+        # 16-bit and float images: stretch to 8 bits instead of clipping
+        pixels = np.asarray(image, dtype=np.float32)
+        low, high = float(pixels.min()), float(pixels.max())
+        pixels = (pixels - low) * (255.0 / (high - low)) if high > low else np.zeros_like(pixels)
+        image = Image.fromarray(pixels.astype(np.uint8), mode='L')
+    return image.convert('L' if image.mode in ('L', '1') else 'RGB')
+
+
+def perceptual_hash(image):
+    """
+    64-bit difference hash as 16 hex digits: the image shrunk to 9x8 gray
+    pixels, one bit per horizontally adjacent pair. Re-encoded, rescaled or
+    slightly different copies of a scan land a few bits apart.
+    """
+    pixels = np.asarray(_to_8bit(image).convert('L').resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = np.packbits(pixels[:, 1:] > pixels[:, :-1])
+    return bits.tobytes().hex()
+
+
+def hash_distance(a, b):
+    """Number of differing bits between two perceptual_hash values."""
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def find_reusable_analysis(medical_image, model_name):
+    """
+    The most recent analysis, made with `model_name` and the current prompt
+    within GEMINI_ANALYSIS_CACHE_TTL seconds, of another image with the same
+    bytes (sha256). With GEMINI_ANALYSIS_NEAR_DUPLICATES, images whose
+    perceptual hash is within GEMINI_ANALYSIS_PHASH_DISTANCE bits also
+    count, the closest first. None when there is nothing to reuse.
+    """
+    ttl = getattr(settings, 'GEMINI_ANALYSIS_CACHE_TTL', 0)
+    if ttl <= 0:
+        return None
+    candidates = ImageAnalysis.objects.filter(
+        model_name=model_name,
+        prompt_version=ANALYSIS_PROMPT_VERSION,
+        created_at__gte=timezone.now() - timedelta(seconds=ttl),
+    ).exclude(medical_image=medical_image).order_by('-created_at')
+
+    if medical_image.sha256:
+        match = candidates.filter(medical_image__sha256=medical_image.sha256).first()
+        if match is not None:
+            return match
+
+    if not (getattr(settings, 'GEMINI_ANALYSIS_NEAR_DUPLICATES', False) and medical_image.perceptual_hash):
+        return None
+    max_distance = getattr(settings, 'GEMINI_ANALYSIS_PHASH_DISTANCE', 4)
+    best = None
+    for pk, phash in candidates.exclude(medical_image__perceptual_hash='').values_list(
+        'pk', 'medical_image__perceptual_hash'
+    ):
+        distance = hash_distance(phash, medical_image.perceptual_hash)
+        if distance <= max_distance and (best is None or distance < best[0]):
+            best = (distance, pk)
+    return ImageAnalysis.objects.get(pk=best[1]) if best else None
+
+
+def encode_for_analysis(image):
+    """
+    Downscale an image to GEMINI_IMAGE_MAX_SIZE on its longest side and
+    re-encode it as JPEG (quality GEMINI_IMAGE_QUALITY). Returns the request
+    part; full-resolution PNG and DICOM slices are many times larger than
+    the model needs.
+    """
+    max_size = getattr(settings, 'GEMINI_IMAGE_MAX_SIZE', 1024)
+    image = _to_8bit(image)
+    if max(image.size) > max_size:
+        image.thumbnail((max_size, max_size), Image.BICUBIC)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=getattr(settings, 'GEMINI_IMAGE_QUALITY', 90))
+    return genai_types.Part.from_bytes(data=buffer.getvalue(), mime_type='image/jpeg')
+
+
+def parse_analysis(response_text):
+    """The JSON report in a model response, or a fallback report around the raw text."""
+    # Sometimes the model returns ```json ... ``` blocks
+    json_match = re.search(r'\{[\s\S]*\}', response_text)
+    if json_match:
+        return json.loads(json_match.group())
+    # Fallback if no JSON found
+    return {
+        "imageType": "Unknown",
+        "observations": [response_text],
+        "potentialConditions": [],
+        "recommendations": ["Consult with a healthcare professional"],
+        "confidenceScore": 0.5,
+        "disclaimer": "This analysis is for educational purposes only."
+    }
+
+
+class MedicalImageAnalyzer:
+    """
+    Gemini analysis of MedicalImages. analyze_image handles one image;
+    analyze_many sends up to GEMINI_CONCURRENCY requests at once through
+    the client's async API. `client` defaults to the process-wide one.
+
+    Before calling the API, the image's content hashes are stored and an
+    existing analysis of the same content is copied instead when there is
+    one (find_reusable_analysis).
+    """
+
+    def __init__(self, client=None):
+        self.client = client if client is not None else get_genai_client()
+        self.model = getattr(settings, 'GEMINI_MODEL', 'gemini-2.0-flash')
+
+    def _load_image(self, medical_image):
+        """The slice from the series volume when there is one, else the file."""
+        from .volume import open_volume
+
+        dicom_data = DICOMData.objects.filter(medical_image=medical_image).only('volume').first()
+        if dicom_data is not None and dicom_data.volume:
+            return open_volume(dicom_data.volume['path']).slice_image(dicom_data.volume['index'])
+        return Image.open(medical_image.image.path)
+
+    def _lookup(self, medical_image, phash):
+        """Store the content hashes on the image; returns an analysis to reuse, or None."""
+        from .uploads import file_sha256
+
+        update_fields = []
+        if not medical_image.sha256:
+            with medical_image.image.open('rb') as f:
+                medical_image.sha256 = file_sha256(f)
+            update_fields.append('sha256')
+        if medical_image.perceptual_hash != phash:
+            medical_image.perceptual_hash = phash
+            update_fields.append('perceptual_hash')
+        if update_fields:
+            medical_image.save(update_fields=update_fields)
+        return find_reusable_analysis(medical_image, self.model)
+
+    @staticmethod
+    def _encode(image):
+        try:
+            return [ANALYSIS_PROMPT, encode_for_analysis(image)]
+        finally:
+            image.close()
+
+    def _save(self, medical_image, response_text, reused_from=None):
+        analysis_data = parse_analysis(response_text)
+
+        # Create ImageAnalysis record
+        analysis = ImageAnalysis.objects.create(
+            medical_image=medical_image,
+            image_type_detected=analysis_data.get('imageType', 'Unknown'),
+            observations=analysis_data.get('observations', []),
+            potential_conditions=analysis_data.get('potentialConditions', []),
+            recommendations=analysis_data.get('recommendations', []),
+            confidence_score=analysis_data.get('confidenceScore', 0.5),
+            raw_analysis=response_text,
+            disclaimer=analysis_data.get('disclaimer', 'For educational purposes only.'),
+            model_name=self.model,
+            prompt_version=ANALYSIS_PROMPT_VERSION,
+            # Always point at the analysis that came from the API
+            reused_from=(reused_from.reused_from or reused_from) if reused_from else None,
+        )
+
+        # Update medical_image
+        medical_image.analyzed_at = timezone.now()
+        medical_image.image_type = analysis_data.get('imageType', '')[:20]
+        medical_image.save()
+
+        return analysis
+
+    def analyze_image(self, medical_image):
+        """Analyze medical image using Gemini API"""
         try:
-            img = Image.open(image_path)
-            
+            image = self._load_image(medical_image)
+            reusable = self._lookup(medical_image, perceptual_hash(image))
+            if reusable is not None:
+                image.close()
+                return self._save(medical_image, reusable.raw_analysis, reused_from=reusable)
+
             response = self.client.models.generate_content(
-                model='gemini-2.0-flash', 
-                contents=[prompt, img]
+                model=self.model,
+                contents=self._encode(image)
             )
-            
-            # Extract response
-            response_text = response.text
-            
-            # Try to parse JSON from response
-            # Sometimes the model returns ```json ... ``` blocks
-            json_match = re.search(r'\{[\s\S]*\}', response_text)
-            if json_match:
-                analysis_data = json.loads(json_match.group())
-            else:
-                # Fallback if no JSON found
-                analysis_data = {
-                    "imageType": "Unknown",
-                    "observations": [response_text],
-                    "potentialConditions": [],
-                    "recommendations": ["Consult with a healthcare professional"],
-                    "confidenceScore": 0.5,
-                    "disclaimer": "This analysis is for educational purposes only."
-                }
-            
-            # Create ImageAnalysis record
-            analysis = ImageAnalysis.objects.create(
-                medical_image=medical_image,
-                image_type_detected=analysis_data.get('imageType', 'Unknown'),
-                observations=analysis_data.get('observations', []),
-                potential_conditions=analysis_data.get('potentialConditions', []),
-                recommendations=analysis_data.get('recommendations', []),
-                confidence_score=analysis_data.get('confidenceScore', 0.5),
-                raw_analysis=response_text,
-                disclaimer=analysis_data.get('disclaimer', 'For educational purposes only.')
-            )
-            
-            # Update medical_image
-            medical_image.analyzed_at = timezone.now()
-            medical_image.image_type = analysis_data.get('imageType', '')[:20]
-            medical_image.save()
-            
-            return analysis
-            
+            return self._save(medical_image, response.text)
+
         except Exception as e:
             raise Exception(f"Analysis failed: {str(e)}")
 
+    async def analyze_image_async(self, medical_image):
+        """
+        analyze_image on the client's async API. The database lookup runs on
+        Django's sync thread; decoding and re-encoding run on a worker
+        thread so several images can be prepared at once.
+        """
+        try:
+            image = await sync_to_async(self._load_image)(medical_image)
+            phash = await sync_to_async(perceptual_hash, thread_sensitive=False)(image)
+            reusable = await sync_to_async(self._lookup)(medical_image, phash)
+            if reusable is not None:
+                image.close()
+                return await sync_to_async(self._save)(medical_image, reusable.raw_analysis, reused_from=reusable)
 
-import torch
-import torchvision.transforms as transforms
-from PIL import Image
-import numpy as np
-import io
-import os
+            contents = await sync_to_async(self._encode, thread_sensitive=False)(image)
+            response = await self.client.aio.models.generate_content(model=self.model, contents=contents)
+            return await sync_to_async(self._save)(medical_image, response.text)
 
-# Import network definitions
-try:
-    from models.networks import define_G
-except ImportError:
+        except Exception as e:
+            raise Exception(f"Analysis failed: {str(e)}")
+
+    async def analyze_many_async(self, medical_images, concurrency=None):
+        concurrency = concurrency or getattr(settings, 'GEMINI_CONCURRENCY', 4)
+        semaphore = asyncio.Semaphore(concurrency)
+        # Copies of one upload in the same batch run one after the other, so
+        # all but the first reuse its analysis
+        content_locks = {}
+
+        async def analyze(medical_image):
+            key = medical_image.sha256 or medical_image.pk
+            async with content_locks.setdefault(key, asyncio.Lock()), semaphore:
+                return await self.analyze_image_async(medical_image)
+
+        return await asyncio.gather(
+            *(analyze(medical_image) for medical_image in medical_images), return_exceptions=True
+        )
+
+    def analyze_many(self, medical_images, concurrency=None):
+        """
+        Analyze many images with at most `concurrency` (default
+        GEMINI_CONCURRENCY) requests in flight. Returns one entry per image,
+        in order: its ImageAnalysis, or the exception it failed with.
+        """
+        return async_to_sync(self.analyze_many_async)(list(medical_images), concurrency)
+
+
+def _weights_path(target_modality, netG='HPB'):
+    """
+    Resolve the checkpoint for a target modality and generator architecture.
+    User specified:
+    - G_A: CT -> MRI (Target: MRI)
+    - G_B: MRI -> CT (Target: CT)
+    Architectures other than HPB have their own files (generator_filename).
+    """
+    base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # .../GAN
+    models_dir = os.path.join(base_path, 'models')
+
+    if target_modality == 'MRI':
+        weights_name = generator_filename('G_A', netG)
+    elif target_modality == 'CT':
+        weights_name = generator_filename('G_B', netG)
+    else:
+        raise ValueError(f"Unsupported target modality: {target_modality}")
+
+    weights_path = os.path.join(models_dir, weights_name)
+
+    if not os.path.exists(weights_path):
+         # Try Django settings base dir as fallback
+        try:
+            weights_path = os.path.join(settings.BASE_DIR, 'GAN', 'models', weights_name)
+        except:
+            pass
+    return weights_path
+
+
+def quantized_weights_path(weights_path):
+    """Where the int8 artifact for a checkpoint is saved by quantize_generators."""
+    root, _ = os.path.splitext(weights_path)
+    return f'{root}.int8.pth'
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_artifact_info(artifact, weights_path):
+    """
+    Record which checkpoint a derived artifact (int8 weights, ONNX model)
+    was built from, in `<artifact>.json`: its mtime and sha256.
+    """
+    info = {'source': None, 'source_mtime': None, 'source_sha256': None}
+    if weights_path and os.path.exists(weights_path):
+        info = {
+            'source': os.path.basename(weights_path),
+            'source_mtime': os.path.getmtime(weights_path),
+            'source_sha256': _file_digest(weights_path),
+        }
+    tmp_path = artifact + '.json.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(info, f)
+    os.replace(tmp_path, artifact + '.json')
+
+
+def artifact_is_fresh(artifact, weights_path):
+    """
+    Whether `artifact` was built from the current `weights_path`: its
+    recorded checkpoint mtime matches, or, when only the mtime changed
+    (a copy, a touch), the checkpoint's sha256 does. Artifacts without a
+    record are treated as stale.
+    """
     try:
-        from GAN.models.networks import define_G
-    except ImportError:
-         # Fallback for relative import if run as package
-        from ..models.networks import define_G
+        with open(artifact + '.json') as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if not os.path.exists(artifact):
+        return False
+    if not (weights_path and os.path.exists(weights_path)):
+        return info.get('source_sha256') is None
+    if info.get('source_mtime') == os.path.getmtime(weights_path):
+        return True
+    if info.get('source_sha256') != _file_digest(weights_path):
+        return False
+    # Same content: record the new mtime so the next check is cheap again
+    write_artifact_info(artifact, weights_path)
+    return True
+
+
+def save_quantized_artifact(model, weights_path):
+    """Save a quantize_G generator as the int8 artifact of `weights_path`, atomically."""
+    artifact = quantized_weights_path(weights_path)
+    tmp_path = artifact + '.tmp'
+    torch.save(model.state_dict(), tmp_path)
+    os.replace(tmp_path, artifact)
+    write_artifact_info(artifact, weights_path)
+    return artifact
+
+
+def load_generator(target_modality, netG='HPB', device='cpu', dtype=torch.float32, quantize=False):
+    """
+    Build a generator and load its checkpoint.
+    Returns (model, weights_path); weights_path is None when no checkpoint
+    was found and the model keeps its random initialization.
+    With `quantize`, the saved int8 artifact is loaded instead (CPU only)
+    if it was built from the current checkpoint; a stale or missing
+    artifact is rebuilt from the checkpoint and saved again.
+    """
+    # Configuration
+    input_nc = 3 # RGB
+    output_nc = 3 # RGB
+    ngf = 64
+    norm = 'instance'
+
+    weights_path = _weights_path(target_modality, netG)
+    artifact = quantized_weights_path(weights_path)
+
+    if quantize and os.path.exists(weights_path) and artifact_is_fresh(artifact, weights_path):
+        model = load_quantized_G(artifact, input_nc, output_nc, ngf, netG, norm=norm)
+        print(f"Loaded int8 weights from {artifact}")
+        model.requires_grad_(False)
+        return model, weights_path
+
+    if os.path.exists(weights_path):
+        # Built on the meta device and materialized from the (memory-mapped)
+        # checkpoint, so no time is spent on a random init that is discarded.
+        # A DataParallel `module.` prefix in saved weights is stripped.
+        model = load_G(weights_path, input_nc, output_nc, ngf, netG, norm=norm, device=device)
+        print(f"Loaded weights from {weights_path}")
+    else:
+        print(f"WARNING: Weights not found at {weights_path}. Using random initialization.")
+        model = define_G(input_nc, output_nc, ngf, netG, norm=norm, init_type='normal', init_gain=0.02, gpu_ids=[])
+        weights_path = None
+
+    model.to(device=device, dtype=dtype)
+    model.eval()
+    model.requires_grad_(False)
+
+    if quantize:
+        model = quantize_G(model)
+        if weights_path is not None:
+            if os.path.exists(artifact):
+                print(f"WARNING: {artifact} was not built from {weights_path}; rebuilding it.")
+            save_quantized_artifact(model, weights_path)
+    return model, weights_path
+
+
+def image_to_tensor(image, resize=True):
+    """
+    PIL image -> (1, 3, H, W) float tensor in [-1, 1], resized to 256x256
+    unless resize=False.
+    """
+    # Ensure image is RGB
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    steps = [transforms.Resize((256, 256), Image.BICUBIC)] if resize else []
+    transform = transforms.Compose(steps + [
+        transforms.ToTensor(),
+        transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5))
+    ])
+    return transform(image).unsqueeze(0)
+
+
+def export_onnx_artifact(model, weights_path, netG='HPB', opset_version=17):
+    """
+    Export `model` to the ONNX file of `weights_path` (written atomically)
+    and record the checkpoint it was built from. Returns the path.
+    """
+    path = onnx_path(weights_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    export_G_onnx(model, tmp_path, netG, opset_version=opset_version)
+    os.replace(tmp_path, path)
+    write_artifact_info(path, weights_path)
+    return path
+
+
+def load_onnx_generator(target_modality, netG='HPB', num_threads=0):
+    """
+    ONNX Runtime session for the model written by manage.py export_onnx.
+    Returns (generator, weights_path) like load_generator. A model exported
+    from an older checkpoint is exported again from the current one first.
+    """
+    weights_path = _weights_path(target_modality, netG)
+    path = onnx_path(weights_path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No ONNX model at {path}. Run manage.py export_onnx first.")
+    if not artifact_is_fresh(path, weights_path):
+        print(f"WARNING: {path} was not exported from {weights_path}; exporting it again.")
+        model, _ = load_generator(target_modality, netG)
+        export_onnx_artifact(model, weights_path, netG)
+    print(f"Loaded ONNX model from {path}")
+    return OnnxGenerator(path, num_threads=num_threads), weights_path if os.path.exists(weights_path) else None
+
+
+class InferenceOptions:
+    """
+    CPU inference optimizations applied on top of a loaded fp32 generator:
+    channels_last memory format, bfloat16 autocast, and torch.compile or
+    torch.jit.trace of the forward pass. `quantize='int8'` serves the
+    dynamically quantized generator instead, and `backend='onnx'` runs the
+    exported ONNX model with ONNX Runtime. `backend='pool'` runs the
+    generators in the shared-weight InferencePool (translate.worker_pool)
+    instead of this process. `fused_attention` swaps the HPB
+    attention blocks for FusedDPSA; `freeze` rewrites the generator with
+    freeze_G (folded norms and projections, fused attention included). `num_threads` sets the process-wide
+    intra-op thread count (0 keeps the torch default).
+    """
+
+    COMPILE_MODES = ('none', 'compile', 'trace')
+    QUANTIZE_MODES = ('none', 'int8')
+    BACKENDS = ('torch', 'onnx', 'pool')
+
+    def __init__(self, channels_last=False, bf16=False, compile='none', num_threads=0, quantize='none', backend='torch',
+                 fused_attention=False, freeze=False):
+        if compile not in self.COMPILE_MODES:
+            raise ValueError(f"Unsupported compile mode: {compile}")
+        if quantize not in self.QUANTIZE_MODES:
+            raise ValueError(f"Unsupported quantization: {quantize}")
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unsupported inference backend: {backend}")
+        self.channels_last = channels_last
+        self.bf16 = bf16
+        self.compile = compile
+        self.num_threads = num_threads
+        self.quantize = quantize
+        self.backend = backend
+        self.fused_attention = fused_attention
+        self.freeze = freeze
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            channels_last=getattr(settings, 'GAN_CHANNELS_LAST', False),
+            bf16=getattr(settings, 'GAN_AUTOCAST_BF16', False),
+            compile=getattr(settings, 'GAN_COMPILE', 'none'),
+            num_threads=getattr(settings, 'GAN_NUM_THREADS', 0),
+            quantize=getattr(settings, 'GAN_QUANTIZATION', 'none'),
+            backend=getattr(settings, 'GAN_INFERENCE_BACKEND', 'torch'),
+            fused_attention=getattr(settings, 'GAN_FUSED_ATTENTION', False),
+            freeze=getattr(settings, 'GAN_FREEZE_GENERATOR', False),
+        )
+
+    @property
+    def is_default(self):
+        return not (self.freeze or self.channels_last or self.bf16 or self.compile != 'none')
+
+    def _key(self):
+        return (self.channels_last, self.bf16, self.compile, self.quantize, self.backend, self.fused_attention, self.freeze)
+
+    def __eq__(self, other):
+        return isinstance(other, InferenceOptions) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __str__(self):
+        if self.backend == 'onnx':
+            return 'onnx'
+        if self.backend == 'pool':
+            return 'pool+int8' if self.quantize == 'int8' else 'pool'
+        parts = [name for name, on in (
+            ('int8', self.quantize == 'int8'), ('fused_attention', self.fused_attention), ('frozen', self.freeze),
+            ('channels_last', self.channels_last), ('bf16', self.bf16),
+        ) if on]
+        if self.compile != 'none':
+            parts.append(self.compile)
+        return '+'.join(parts) or 'fp32'
+
+
+class OptimizedGenerator(torch.nn.Module):
+    """Runs a generator with the memory format and autocast from InferenceOptions."""
+
+    def __init__(self, model, options):
+        super().__init__()
+        self.model = model
+        self.channels_last = options.channels_last
+        self.bf16 = options.bf16
+
+    def forward(self, x):
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        with torch.autocast('cpu', dtype=torch.bfloat16, enabled=self.bf16):
+            out = self.model(x)
+        return out.float().contiguous()
+
+
+def compare_outputs(reference, candidate):
+    """
+    PSNR (dB) and max absolute difference between two generator outputs in
+    [-1, 1]; the peak-to-peak range is 2.
+    """
+    diff = (reference.float() - candidate.float())
+    mse = diff.pow(2).mean().item()
+    psnr = float('inf') if mse == 0 else 10 * np.log10(4.0 / mse)
+    return psnr, diff.abs().max().item()
+
+
+def _accuracy_sample():
+    generator = torch.Generator().manual_seed(0)
+    return torch.rand(1, 3, 256, 256, generator=generator) * 2 - 1
+
+
+def optimize_generator(model, options, guard=True):
+    """
+    Apply InferenceOptions to an eval-mode fp32 generator. With `guard`, the
+    optimized model is checked against the fp32 output on a fixed input and
+    the fp32 model is returned if it misses GAN_ACCURACY_MIN_PSNR or
+    GAN_ACCURACY_MAX_ABS_DIFF (or fails to build).
+    """
+    if options.is_default:
+        return model
+
+    sample = _accuracy_sample()
+    try:
+        if options.freeze:
+            optimized = freeze_G(model)
+        else:
+            optimized = copy.deepcopy(model) if guard else model
+        if options.channels_last:
+            optimized = optimized.to(memory_format=torch.channels_last)
+        optimized = OptimizedGenerator(optimized, options).eval()
+
+        if options.compile == 'trace':
+            with torch.no_grad():
+                optimized = torch.jit.freeze(torch.jit.trace(optimized, sample))
+        elif options.compile == 'compile':
+            optimized = torch.compile(optimized)
+
+        if not guard:
+            return optimized
+
+        with torch.no_grad():
+            reference = model(sample)
+            candidate = optimized(sample)
+    except Exception as e:
+        print(f"WARNING: Inference optimization '{options}' failed ({e}). Using fp32 eager.")
+        return model
+
+    psnr, max_abs = compare_outputs(reference, candidate)
+    min_psnr = getattr(settings, 'GAN_ACCURACY_MIN_PSNR', 30.0)
+    max_abs_allowed = getattr(settings, 'GAN_ACCURACY_MAX_ABS_DIFF', 0.25)
+    if psnr < min_psnr or max_abs > max_abs_allowed:
+        print(
+            f"WARNING: Inference optimization '{options}' rejected: PSNR {psnr:.1f} dB, "
+            f"max abs diff {max_abs:.4f} against fp32. Using fp32 eager."
+        )
+        return model
+
+    print(f"Using '{options}' inference (PSNR {psnr:.1f} dB, max abs diff {max_abs:.4f} against fp32)")
+    return optimized
+
+
+# Generator weights and inputs; int8 goes through GAN_QUANTIZATION instead
+SUPPORTED_DTYPES = (torch.float32, torch.bfloat16, torch.float16)
+
+
+def check_dtype(dtype):
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported generator dtype: {dtype}")
+
+
+_threads_configured = False
+
+
+def configure_threads(num_threads):
+    """Set torch intra-op threads for this worker process (once)."""
+    global _threads_configured
+    if num_threads and not _threads_configured:
+        torch.set_num_threads(num_threads)
+        _threads_configured = True
+
+
+class GeneratorRegistry:
+    """
+    Process-wide cache of loaded generators, keyed by
+    (target modality, netG, device, dtype, inference options).
+
+    Each generator is built and loaded once per process and shared by every
+    GANTranslator afterwards. When GAN_RELOAD_ON_CHANGE is on, a lookup
+    compares the checkpoint mtime with the one seen at load time and reloads
+    the generator if the file was replaced.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.load_seconds = 0.0
+        # Bumped whenever cached generators are dropped or reloaded
+        self.generation = 0
+
+    @staticmethod
+    def make_key(target_modality, netG='HPB', device='cpu', dtype=torch.float32, options=None):
+        check_dtype(dtype)
+        if options is None:
+            options = InferenceOptions.from_settings()
+        return (target_modality.upper(), netG, str(device), dtype, options)
+
+    def get(self, target_modality, netG='HPB', device='cpu', dtype=torch.float32, options=None):
+        key = self.make_key(target_modality, netG, device, dtype, options)
+
+        entry = self._entries.get(key)
+        if entry is not None and not self._is_stale(entry):
+            with self._lock:
+                self.hits += 1
+            return entry['model']
+
+        # Only one thread loads a given key; the others wait and then hit.
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is not None and not self._is_stale(entry):
+                with self._lock:
+                    self.hits += 1
+                return entry['model']
+
+            options = key[4]
+            configure_threads(options.num_threads)
+            if entry is not None:
+                # The checkpoint changed: state built from the old weights,
+                # such as the inference pool, is rebuilt
+                with self._lock:
+                    self.generation += 1
+
+            start = time.perf_counter()
+            if options.backend == 'onnx':
+                model, weights_path = load_onnx_generator(key[0], key[1], num_threads=options.num_threads)
+            elif options.backend == 'pool':
+                pool = get_inference_pool(self.generation)
+                model, weights_path = PooledGenerator(key[0]), pool.weights_paths[key[0]]
+            else:
+                quantize = options.quantize == 'int8' and str(key[2]) == 'cpu'
+                model, weights_path = load_generator(*key[:4], quantize=quantize)
+                if options.fused_attention:
+                    # Same parameters and outputs, so no accuracy guard needed
+                    fuse_attention(model)
+                if str(key[2]) == 'cpu':
+                    model = optimize_generator(model, options, guard=getattr(settings, 'GAN_ACCURACY_GUARD', True))
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self.reloads += 1
+                self.load_seconds += elapsed
+                self._entries[key] = {
+                    'model': model,
+                    'weights_path': weights_path,
+                    'mtime': self._mtime(weights_path),
+                    'load_seconds': elapsed,
+                }
+            return model
+
+    def weights_digest(self, target_modality, netG='HPB', device='cpu', dtype=torch.float32, options=None):
+        """
+        sha256 of the checkpoint behind a cached generator, computed once per
+        load. None when the generator runs on random weights.
+        """
+        key = self.make_key(target_modality, netG, device, dtype, options)
+        self.get(*key)
+        entry = self._entries[key]
+        if entry['weights_path'] is None:
+            return None
+        if entry.get('digest') is None:
+            entry['digest'] = _file_digest(entry['weights_path'])
+        return entry['digest']
+
+    def reload(self, target_modality=None):
+        """
+        Drop cached generators (all of them, or those for one modality) so
+        the next lookup loads the weights from disk again.
+        """
+        with self._lock:
+            self.generation += 1
+            for key in list(self._entries):
+                if target_modality is None or key[0] == target_modality.upper():
+                    del self._entries[key]
+
+    def warm_up(self, modalities, netG='HPB', device='cpu', dtype=torch.float32):
+        for modality in modalities:
+            self.get(modality, netG, device, dtype)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'reloads': self.reloads,
+                'generation': self.generation,
+                'load_seconds': self.load_seconds,
+                'loaded': [
+                    {
+                        'target_modality': key[0],
+                        'netG': key[1],
+                        'device': key[2],
+                        'dtype': str(key[3]),
+                        'optimizations': str(key[4]),
+                        'weights_path': entry['weights_path'],
+                        'load_seconds': entry['load_seconds'],
+                    }
+                    for key, entry in self._entries.items()
+                ],
+            }
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _is_stale(self, entry):
+        if not getattr(settings, 'GAN_RELOAD_ON_CHANGE', True):
+            return False
+        return self._mtime(entry['weights_path']) != entry['mtime']
+
+    @staticmethod
+    def _mtime(path):
+        if path is None:
+            return None
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+
+generator_registry = GeneratorRegistry()
+
+
+def warm_up_generators(modalities=None):
+    """
+    Load the generators listed in GAN_WARMUP_MODALITIES (or `modalities`)
+    so the first request does not pay for it.
+    """
+    if modalities is None:
+        modalities = getattr(settings, 'GAN_WARMUP_MODALITIES', [])
+    generator_registry.warm_up(modalities)
+
 
 class GANTranslator:
-    def __init__(self, target_modality, device=None):
+    def __init__(self, target_modality, device=None, netG='HPB', dtype=torch.float32,
+                 tiled=None, tile_size=None, tile_overlap=None, options=None):
         self.device = device if device else ('cuda' if torch.cuda.is_available() else 'cpu')
         self.target_modality = target_modality.upper()
+        self.netG = netG
+        check_dtype(dtype)
+        self.dtype = dtype
+        self.options = options if options is not None else InferenceOptions.from_settings()
+        # Tiled mode keeps the input resolution and runs the generator over
+        # overlapping tiles instead of resizing everything to 256x256
+        self.tiled = settings.GAN_TILED_INFERENCE if tiled is None else tiled
+        self.tile_size = tile_size or settings.GAN_TILE_SIZE
+        self.tile_overlap = settings.GAN_TILE_OVERLAP if tile_overlap is None else tile_overlap
         self.model = self._load_model()
 
+    def cache_key(self, input_sha256):
+        """
+        Content address of translating the input with SHA-256 hex digest
+        `input_sha256` with this translator, or None when results must not
+        be cached (cache disabled, random weights).
+        """
+        if not getattr(settings, 'GAN_TRANSLATION_CACHE_ENABLED', False):
+            return None
+        digest = generator_registry.weights_digest(self.target_modality, self.netG, self.device, self.dtype, self.options)
+        if digest is None:
+            return None
+        config = {
+            'netG': self.netG,
+            'dtype': str(self.dtype),
+            'optimizations': str(self.options),
+            'tiled': self.tiled,
+            'tile_size': self.tile_size if self.tiled else None,
+            'tile_overlap': self.tile_overlap if self.tiled else None,
+        }
+        return translation_cache_key(input_sha256, self.target_modality, digest, config)
+
     def _load_model(self):
         """
-        Load the generator model based on target modality.
-        User specified:
-        - G_A: CT -> MRI (Target: MRI)
-        - G_B: MRI -> CT (Target: CT)
-        """
-        # Configuration
-        input_nc = 3 # RGB
-        output_nc = 3 # RGB
-        ngf = 64
-        netG = 'HPB'
-        norm = 'instance'
-        
-        # Initialize model
-        model = define_G(input_nc, output_nc, ngf, netG, norm=norm, init_type='normal', init_gain=0.02, gpu_ids=[])
-        
-        # Determine weights path
-        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # .../GAN
-        models_dir = os.path.join(base_path, 'models')
-        
-        if self.target_modality == 'MRI':
-            weights_name = 'latest_net_G_A.pth' 
-        elif self.target_modality == 'CT':
-            weights_name = 'latest_net_G_B.pth'
-        else:
-            raise ValueError(f"Unsupported target modality: {self.target_modality}")
-            
-        weights_path = os.path.join(models_dir, weights_name)
-        
-        if not os.path.exists(weights_path):
-             # Try Django settings base dir as fallback
-            try:
-                weights_path = os.path.join(settings.BASE_DIR, 'GAN', 'models', weights_name)
-            except:
-                pass
-
-        if os.path.exists(weights_path):
-            state_dict = torch.load(weights_path, map_location=self.device)
-            # Handle DataParallel wrapping if present in saved weights
-            if list(state_dict.keys())[0].startswith('module.'):
-                state_dict = {k[7:]: v for k, v in state_dict.items()}
-            model.load_state_dict(state_dict)
-            print(f"Loaded weights from {weights_path}")
-        else:
-            print(f"WARNING: Weights not found at {weights_path}. Using random initialization.")
-        
-        model.to(self.device)
-        model.eval()
-        return model
+        Fetch the generator for the target modality from the process-wide
+        registry; it is only built and loaded on the first request.
+        """
+        return generator_registry.get(self.target_modality, self.netG, self.device, self.dtype, self.options)
 
-    def preprocess(self, image):
+    def preprocess(self, image, resize=True):
         """
-        Resize to 256x256, convert to RGB, normalize to [-1, 1]
+        Resize to 256x256 (unless resize=False), convert to RGB, normalize to [-1, 1]
         """
-        # Ensure image is RGB
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-            
-        transform = transforms.Compose([
-            transforms.Resize((256, 256), Image.BICUBIC),
-            transforms.ToTensor(),
-            transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5))
-        ])
-        return transform(image).unsqueeze(0).to(self.device)
+        return image_to_tensor(image, resize=resize).to(self.device, self.dtype)
 
     def postprocess(self, tensor):
         """
@@ -188,38 +921,367 @@ class GANTranslator:
         image = image[0, ..., 0]  # Remove batch and channel dims for grayscale
         return Image.fromarray(image)
 
-    def translate(self, image):
-        img_tensor = self.preprocess(image)
+    def forward(self, img_tensor):
+        """
+        Run the generator. With GAN_BATCHING_ENABLED the tensor goes through
+        the shared micro-batching scheduler, so concurrent requests and
+        tasks for the same modality share one forward pass.
+        """
+        if getattr(settings, 'GAN_BATCHING_ENABLED', False):
+            return get_batch_scheduler().run(self.model, img_tensor)
         with torch.no_grad():
-            output_tensor = self.model(img_tensor)
+            return self.model(img_tensor)
+
+    def forward_tiled(self, img_tensor):
+        """
+        Run the generator over overlapping tiles of a full-resolution batch
+        and blend them back, keeping peak memory bounded by the tile batch.
+        """
+        def run(tiles):
+            with torch.no_grad():
+                return self.model(tiles)
+
+        return tiled_forward(
+            run, img_tensor,
+            tile_size=self.tile_size,
+            overlap=self.tile_overlap,
+            tile_batch_size=settings.GAN_TILE_BATCH_SIZE,
+        )
+
+    def translate(self, image):
+        if self.tiled:
+            img_tensor = self.preprocess(image, resize=False)
+            output_tensor = self.forward_tiled(img_tensor)
+        else:
+            img_tensor = self.preprocess(image)
+            output_tensor = self.forward(img_tensor)
         return self.postprocess(output_tensor)
 
+    def translate_batch(self, images):
+        """
+        Translate a list of images with a single batched forward pass.
+        """
+        if self.tiled:
+            # Full-resolution images rarely share a shape; tile each one
+            return [self.translate(image) for image in images]
+        batch = torch.cat([self.preprocess(image) for image in images])
+        return self.translate_tensor(batch)
 
-def gan_translate_image(image_file, target_modality):
+    def generate(self, batch, batch_size=None):
+        """
+        Run an already normalized (N, C, H, W) batch in [-1, 1], e.g. the
+        frames of a DICOM file, in chunks of `batch_size`; untiled chunks go
+        through forward and so through the micro-batching scheduler. Returns
+        the raw float32 generator output on the CPU.
+        """
+        batch_size = batch_size or getattr(settings, 'GAN_BATCH_MAX_SIZE', 8)
+        outputs = []
+        for start in range(0, batch.shape[0], batch_size):
+            chunk = batch[start:start + batch_size].to(self.device, self.dtype)
+            if self.tiled:
+                output_tensor = self.forward_tiled(chunk)
+            else:
+                output_tensor = self.forward(chunk)
+            outputs.append(output_tensor.detach().float().cpu())
+        return torch.cat(outputs)
+
+    def translate_tensor(self, batch, batch_size=None):
+        """Like generate, but returns one grayscale PIL image per entry."""
+        output = self.generate(batch, batch_size)
+        return [self.postprocess(output[i:i + 1]) for i in range(output.shape[0])]
+
+
+def translate_dicom(ds, target_modality, tiled=None):
     """
-    Main entry point for GAN translation.
+    Translate every frame of a DICOM dataset. Pixels go from the raw array
+    to a normalized tensor (rescale, VOI window) without an 8-bit PIL step.
+    Returns one PIL image per frame.
     """
-    # Load input image
-    try:
-        input_image = Image.open(image_file)
-    except Exception:
-        # If it's bytes, wrap in BytesIO
-        if isinstance(image_file, (bytes, bytearray)):
-             input_image = Image.open(io.BytesIO(image_file))
+    translator = GANTranslator(target_modality, tiled=tiled)
+    size = None if translator.tiled else 256
+    return translator.translate_tensor(dicom_to_tensor(ds, size=size))
+
+
+def translate_volume(volume, target_modality, tiled=None, batch_size=None, start=0, raw=False):
+    """
+    Translate the slices of a translate.volume.Volume from `start` on,
+    batch by batch straight from the memmap. Yields (first index, PIL
+    images) per batch, in slice order; with `raw`, the images are a float32
+    (n, H, W) array in [-1, 1] instead.
+    """
+    translator = GANTranslator(target_modality, tiled=tiled)
+    batch_size = batch_size or getattr(settings, 'GAN_BATCH_MAX_SIZE', 8)
+    size = None if translator.tiled else 256
+    for index, batch in volume.batches(batch_size, size=size, start=start):
+        if raw:
+            yield index, translator.generate(batch, batch_size=batch_size)[:, 0].clamp_(-1, 1).numpy()
         else:
-            raise
+            yield index, translator.translate_tensor(batch, batch_size=batch_size)
 
-    # Initialize translator
-    translator = GANTranslator(target_modality)
-    
-    # Run inference
-    output_image = translator.translate(input_image)
+
+def translate_stored_images(image_ids, target_modality, batch_size=None):
+    """
+    Translate MedicalImages from the preprocessed shard store (manage.py
+    build_shards) without decoding or resizing them again. Yields
+    (image ids, PIL images) per batch, in the order of `image_ids`.
+    """
+    from .shards import ShardStore
+
+    store = ShardStore(settings.GAN_SHARD_DIR)
+    translator = GANTranslator(target_modality, tiled=False)
+    batch_size = batch_size or getattr(settings, 'GAN_BATCH_MAX_SIZE', 8)
+    for ids, batch in store.batches(image_ids, batch_size=batch_size):
+        yield ids, translator.translate_tensor(batch, batch_size=batch_size)
+
+
+def gan_translate_dicom(image_file, target_modality, tiled=None, dataset=None):
+    """
+    Translate a DICOM file into a DICOM file: the source header with new
+    UIDs and the target Modality, and 16-bit pixel data with a rescale
+    (see dicom.encode_pixels) instead of an 8-bit PNG. All frames are
+    encoded in one pass. Returns (dicom bytes, filename, PNG preview of the
+    first frame). `dataset` is `image_file` already read with read_dicom.
+    """
+    ds = dataset
+    if ds is None:
+        source, _ = _input_source(image_file)
+        if not is_dicom(source):
+            raise ValueError("DICOM output needs a DICOM input.")
+        ds = read_dicom(source)
+
+    translator = GANTranslator(target_modality, tiled=tiled)
+    output = translator.generate(dicom_to_tensor(ds, size=None if translator.tiled else 256))
+
+    stored, slope, intercept = encode_pixels(output[:, 0].clamp_(-1, 1).numpy(), target_modality)
+    translated = translated_dataset(ds, stored, target_modality, slope, intercept)
+    preview = translator.postprocess(output[:1])
+    return dataset_bytes(translated), f"translated_{target_modality.lower()}.dcm", preview
+
+
+def _read_bytes(image_file):
+    if isinstance(image_file, (bytes, bytearray)):
+        return bytes(image_file)
+    if hasattr(image_file, 'read'):
+        image_file.seek(0)
+        return image_file.read()
+    with open(image_file, 'rb') as f:
+        return f.read()
+
+
+def _input_source(image_file, sha256=None):
+    """
+    (source, sha256) for an input. Files already on disk whose digest is
+    known (streamed uploads, stored MedicalImages) are opened by path
+    instead of being read into memory.
+    """
+    sha256 = sha256 or getattr(image_file, 'sha256', None)
+    path = image_file if isinstance(image_file, (str, os.PathLike)) else None
+    if hasattr(image_file, 'temporary_file_path'):
+        path = image_file.temporary_file_path()
+    if sha256 and path:
+        return path, sha256
+
+    data = _read_bytes(image_file)
+    return io.BytesIO(data), hashlib.sha256(data).hexdigest()
+
+
+def gan_translate_image(image_file, target_modality, tiled=None, sha256=None, dataset=None):
+    """
+    Main entry point for GAN translation.
+    `tiled` overrides GAN_TILED_INFERENCE for this call. Results are looked
+    up in (and added to) the content-addressed translation cache. Pass the
+    input's `sha256` when it is known so a path is not read twice, and the
+    DICOM `dataset` when the caller already read it.
+    """
+    source, sha256 = _input_source(image_file, sha256)
+    output_filename = f"translated_{target_modality.lower()}.png"
+
+    # Generators are cached per process, so this is cheap after the first call
+    translator = GANTranslator(target_modality, tiled=tiled)
+
+    cache_key = translator.cache_key(sha256)
+    if cache_key:
+        cached = get_translation_cache().get(cache_key)
+        if cached is not None:
+            return cached, output_filename
+
+    # DICOM goes through the native pixel pipeline; only the first frame is
+    # returned here
+    if dataset is not None:
+        output_image = translate_dicom(dataset, target_modality, tiled=tiled)[0]
+    elif is_dicom(source):
+        output_image = translate_dicom(read_dicom(source), target_modality, tiled=tiled)[0]
+    else:
+        input_image = Image.open(source)
+
+        # Run inference
+        output_image = translator.translate(input_image)
     
     # Save to buffer
     buffer = io.BytesIO()
     output_image.save(buffer, format='PNG')
-    buffer.seek(0)
-    
-    output_filename = f"translated_{target_modality.lower()}.png"
-    
-    return buffer.getvalue(), output_filename
+    output_bytes = buffer.getvalue()
+
+    if cache_key:
+        get_translation_cache().set(cache_key, output_bytes)
+
+    return output_bytes, output_filename
+
+
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+
+def _slice_order(name, open_member):
+    # DICOM members sort by InstanceNumber (filenames of exported series
+    # are often UIDs), everything else by natural filename
+    try:
+        with open_member(name) as member:
+            if is_dicom(member):
+                number = read_dicom(member, stop_before_pixels=True).get('InstanceNumber')
+                if number is not None:
+                    return (0, int(number), _natural_key(name))
+    except Exception:
+        pass
+    return (1, _natural_key(name))
+
+
+def archive_slices(archive):
+    """
+    Return (name, read) pairs for the image members of a zip or tar upload,
+    DICOM slices in InstanceNumber order and other images in natural
+    filename order (slice2 before slice10). `read` returns the member
+    bytes, so members are only decompressed when translated; ordering only
+    reads the DICOM headers.
+    """
+    max_slices = getattr(settings, 'GAN_BATCH_MAX_SLICES', 1000)
+
+    if zipfile.is_zipfile(archive):
+        archive.seek(0)
+        zf = zipfile.ZipFile(archive)
+        names = [
+            info.filename for info in zf.infolist()
+            if not info.is_dir() and not os.path.basename(info.filename).startswith('.')
+            and not info.filename.startswith('__MACOSX/')
+        ]
+        read = zf.read
+        open_member = zf.open
+    else:
+        archive.seek(0)
+        try:
+            tf = tarfile.open(fileobj=archive, mode='r:*')
+        except tarfile.TarError:
+            raise ValueError("archive must be a zip or tar file.")
+        members = {
+            m.name: m for m in tf.getmembers()
+            if m.isfile() and not os.path.basename(m.name).startswith('.')
+        }
+        names = list(members)
+        read = lambda name: tf.extractfile(members[name]).read()
+        open_member = lambda name: tf.extractfile(members[name])
+
+    if len(names) > max_slices:
+        raise ValueError(f"archive contains {len(names)} files; at most {max_slices} are accepted.")
+
+    names.sort(key=lambda name: _slice_order(name, open_member))
+    return [(name, (lambda name=name: read(name))) for name in names]
+
+
+def uploaded_slices(files):
+    """Return (name, read) pairs for a multipart list, in upload order."""
+    max_slices = getattr(settings, 'GAN_BATCH_MAX_SLICES', 1000)
+    if len(files) > max_slices:
+        raise ValueError(f"{len(files)} images uploaded; at most {max_slices} are accepted.")
+    return [(f.name, (lambda f=f: f.read())) for f in files]
+
+
+class _ZipStream:
+    """Write-only file object collecting the bytes zipfile produces."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_translated_zip(slices, target_modality, batch_size=8):
+    """
+    Translate (name, read) slices in batches and yield a zip archive of the
+    translated PNGs as it is produced. Outputs are numbered in slice order;
+    slices that cannot be decoded or translated are recorded in
+    manifest.json instead of aborting the job.
+    """
+    translator = GANTranslator(target_modality)
+    size = None if translator.tiled else 256
+    stream = _ZipStream()
+    manifest = []
+
+    def decode(data):
+        # (1, 3, H, W) input: DICOM through the native pixel pipeline (first
+        # frame), like gan_translate_image, other images through PIL
+        source = io.BytesIO(data)
+        if is_dicom(source):
+            return dicom_to_tensor(read_dicom(source), size=size)[:1]
+        image = Image.open(source)
+        image.load()
+        return image_to_tensor(image, resize=size is not None)
+
+    with zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_STORED) as zf:
+        def flush(pending):
+            try:
+                outputs = translator.translate_tensor(torch.cat([tensor for _, _, tensor in pending]))
+            except Exception:
+                # Retry one by one so a single bad slice (or, tiled, one of
+                # another size) does not fail the batch
+                outputs = []
+                for index, name, tensor in pending:
+                    try:
+                        outputs.append(translator.translate_tensor(tensor)[0])
+                    except Exception as e:
+                        outputs.append(e)
+
+            for (index, name, _), output in zip(pending, outputs):
+                stem = os.path.splitext(os.path.basename(name))[0]
+                if isinstance(output, Exception):
+                    manifest.append({'index': index, 'source': name, 'error': str(output)})
+                    continue
+                buffer = io.BytesIO()
+                output.save(buffer, format='PNG')
+                output_name = f"{index:04d}_{stem}.png"
+                zf.writestr(output_name, buffer.getvalue())
+                manifest.append({'index': index, 'source': name, 'output': output_name})
+
+        pending = []
+        for index, (name, read) in enumerate(slices):
+            try:
+                pending.append((index, name, decode(read())))
+            except Exception as e:
+                manifest.append({'index': index, 'source': name, 'error': f"Could not decode image: {e}"})
+
+            if len(pending) >= batch_size:
+                flush(pending)
+                pending = []
+                yield stream.pop()
+
+        if pending:
+            flush(pending)
+
+        manifest.sort(key=lambda entry: entry['index'])
+        zf.writestr('manifest.json', json.dumps({
+            'target_modality': target_modality.upper(),
+            'total': len(manifest),
+            'failed': sum('error' in entry for entry in manifest),
+            'slices': manifest,
+        }, indent=2))
+
+    yield stream.pop()
@@ -0,0 +1,230 @@
+import json
+import os
+import random
+from multiprocessing import get_context
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from .training import load_slice
+
+INDEX_NAME = 'index.json'
+SHARD_DTYPE = np.float16
+
+
+def medical_image_source(image):
+    """
+    The load_slice source of a MedicalImage: its slice in the series volume
+    when it has one, otherwise the uploaded file. None without a file.
+    """
+    from .volume import resolve_volume_path
+
+    volume = getattr(getattr(image, 'dicom_data', None), 'volume', None)
+    if volume:
+        return ('volume', resolve_volume_path(volume['path']), volume['index'])
+    if image.image:
+        return ('file', image.image.path)
+    return None
+
+
+def _write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _preprocess(args):
+    # Pool worker: decode and resize one image to a float16 (size, size) array
+    source, size = args
+    try:
+        return load_slice(source, size=size)[0].numpy().astype(SHARD_DTYPE), None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+
+
+class ShardStore:
+    """
+    Preprocessed images in memory-mappable shards: shard_XXXXX.npy files of
+    `capacity` float16 (size, size) slices, already decoded, windowed,
+    scaled to [-1, 1] and resized, plus index.json mapping each image UUID
+    to its shard, row, modality and sha256.
+
+    Shards are allocated at full capacity and filled in place, so appending
+    only writes the new rows and then replaces the index; readers only see
+    rows the index lists. Reads are memmap views, no decode and no copy.
+    """
+
+    def __init__(self, directory, size=256, capacity=1024):
+        self.directory = directory
+        self._shards = {}
+        path = os.path.join(directory, INDEX_NAME)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {'size': size, 'capacity': capacity, 'dtype': np.dtype(SHARD_DTYPE).name,
+                          'shards': [], 'images': {}}
+        self._by_sha256 = {
+            entry['sha256']: (entry['shard'], entry['row'])
+            for entry in self.index['images'].values() if entry.get('sha256')
+        }
+
+    @property
+    def size(self):
+        return self.index['size']
+
+    def __len__(self):
+        return len(self.index['images'])
+
+    def __contains__(self, image_id):
+        return str(image_id) in self.index['images']
+
+    def ids(self, modality=None):
+        return [
+            image_id for image_id, entry in self.index['images'].items()
+            if modality is None or entry['modality'] == modality
+        ]
+
+    def _shard_path(self, shard):
+        return os.path.join(self.directory, self.index['shards'][shard]['file'])
+
+    def shard(self, shard):
+        """Memmap of a whole shard (copy-on-write, so torch can wrap it without a copy)."""
+        array = self._shards.get(shard)
+        if array is None:
+            array = self._shards[shard] = np.load(self._shard_path(shard), mmap_mode='c')
+        return array
+
+    def get(self, image_id):
+        """(size, size) float16 view of one image."""
+        entry = self.index['images'][str(image_id)]
+        return self.shard(entry['shard'])[entry['row']]
+
+    def tensor(self, image_id, channels=3):
+        """(channels, size, size) float32 generator input for one image."""
+        return torch.from_numpy(self.get(image_id)).float().expand(channels, -1, -1)
+
+    def batches(self, image_ids, batch_size=8, channels=3):
+        """
+        Yield (ids, (n, channels, size, size) float32 tensor) batches. Runs
+        of consecutive rows in one shard are sliced out in a single view.
+        """
+        image_ids = [str(image_id) for image_id in image_ids]
+        for start in range(0, len(image_ids), batch_size):
+            chunk = image_ids[start:start + batch_size]
+            entries = [self.index['images'][image_id] for image_id in chunk]
+            first = entries[0]
+            contiguous = all(
+                entry['shard'] == first['shard'] and entry['row'] == first['row'] + i
+                for i, entry in enumerate(entries)
+            )
+            if contiguous:
+                block = self.shard(first['shard'])[first['row']:first['row'] + len(chunk)]
+            else:
+                block = np.stack([self.shard(entry['shard'])[entry['row']] for entry in entries])
+            yield chunk, torch.from_numpy(block).float().unsqueeze(1).expand(-1, channels, -1, -1)
+
+    def _new_shard(self):
+        shard = len(self.index['shards'])
+        name = f'shard_{shard:05d}.npy'
+        np.lib.format.open_memmap(
+            os.path.join(self.directory, name), mode='w+', dtype=SHARD_DTYPE,
+            shape=(self.index['capacity'], self.size, self.size)
+        ).flush()
+        self.index['shards'].append({'file': name, 'count': 0})
+        return shard
+
+    def _save_index(self):
+        _write_json(os.path.join(self.directory, INDEX_NAME), self.index)
+
+    def append(self, images, workers=1, log=None):
+        """
+        Preprocess and store `images`: (image_id, source, modality, sha256)
+        tuples, skipping ids already stored. An image whose sha256 is
+        already stored points at the existing row instead of a new one.
+        Decoding runs on `workers` processes. The index is saved after each
+        shard fills and at the end, so an interrupted build keeps what it
+        wrote. Returns (added, reused, failed).
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        pending = []
+        added = reused = failed = 0
+        for image_id, source, modality, sha256 in images:
+            image_id = str(image_id)
+            if image_id in self.index['images']:
+                continue
+            if sha256 and sha256 in self._by_sha256:
+                shard, row = self._by_sha256[sha256]
+                self.index['images'][image_id] = {'shard': shard, 'row': row, 'modality': modality, 'sha256': sha256}
+                reused += 1
+                continue
+            pending.append((image_id, source, modality, sha256))
+
+        pool = get_context('fork').Pool(workers) if workers > 1 and pending else None
+        try:
+            jobs = [(source, self.size) for _, source, _, _ in pending]
+            results = pool.imap(_preprocess, jobs, chunksize=8) if pool else map(_preprocess, jobs)
+            writer = None
+            for (image_id, _, modality, sha256), (pixels, error) in zip(pending, results):
+                if pixels is None:
+                    failed += 1
+                    if log:
+                        log(f'{image_id}: {error}')
+                    continue
+                if sha256 and sha256 in self._by_sha256:
+                    # Same content twice in this batch of uploads
+                    shard, row = self._by_sha256[sha256]
+                    self.index['images'][image_id] = {'shard': shard, 'row': row, 'modality': modality, 'sha256': sha256}
+                    reused += 1
+                    continue
+
+                shards = self.index['shards']
+                if not shards or shards[-1]['count'] >= self.index['capacity']:
+                    if writer is not None:
+                        writer.flush()
+                        self._save_index()
+                    self._new_shard()
+                    writer = None
+                shard = len(shards) - 1
+                if writer is None:
+                    writer = np.load(self._shard_path(shard), mmap_mode='r+')
+                row = shards[shard]['count']
+                writer[row] = pixels
+                shards[shard]['count'] += 1
+                self.index['images'][image_id] = {'shard': shard, 'row': row, 'modality': modality, 'sha256': sha256}
+                if sha256:
+                    self._by_sha256[sha256] = (shard, row)
+                added += 1
+            if writer is not None:
+                writer.flush()
+        finally:
+            if pool:
+                pool.terminate()
+            self._save_index()
+            # Rows were written through a separate mapping
+            self._shards.clear()
+        return added, reused, failed
+
+
+class ShardDataset(Dataset):
+    """Training slices straight from a ShardStore; items like SliceDataset's."""
+
+    def __init__(self, directory, image_ids, flip=True):
+        self.directory = directory
+        self.image_ids = list(image_ids)
+        self.flip = flip
+        self._store = None
+
+    def __len__(self):
+        return len(self.image_ids)
+
+    def __getitem__(self, index):
+        if self._store is None:
+            # Opened in each loader worker, so the memmaps are per process
+            self._store = ShardStore(self.directory)
+        tensor = self._store.tensor(self.image_ids[index])
+        if self.flip and random.random() < 0.5:
+            tensor = tensor.flip(-1)
+        return tensor.contiguous()
@@ -1,43 +1,255 @@
+import io
+import json
 import os
-import pydicom
-import numpy as np
-from .models import MedicalImage
+import time
+from .models import MedicalImage, DICOMData, ImageAnalysis, SeriesTranslationJob
 from celery import shared_task
+from celery.signals import worker_process_init
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from pydicom.uid import generate_uid
+
+@worker_process_init.connect
+def warm_up_worker(**kwargs):
+    """Load the configured generators once per Celery worker process."""
+    from .services import warm_up_generators
+    warm_up_generators()
+
+
+def _png_bytes(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _replace_file(name, data):
+    """Save under exactly `name`, replacing a partial file from an earlier attempt."""
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(data))
 
-from PIL import Image
 
 @shared_task
-def process_dicom_for_translation(image_id):
+def process_dicom_for_translation(image_id, output_format=None):
+    """
+    Translate one upload. With output_format='dicom' (DICOM uploads only)
+    the result is also written as a 16-bit DICOM to translated_dicom;
+    translated_image always gets a PNG preview.
+    """
+    from django.conf import settings
+    output_format = output_format or settings.GAN_OUTPUT_FORMAT
     image_instance = MedicalImage.objects.get(pk=image_id)
     image_instance.translation_status = 'PROCESSING'
     image_instance.save()
-    
-    input_path = image_instance.original_file.path
 
     try:
+        from .services import gan_translate_dicom, gan_translate_image, translate_dicom
+        from .dicom import MODALITY_MAP, extract_tags, read_dicom
+
+        ds = None
+        if image_instance.image_type == 'DICOM':
+            # Parsed once: the tags go to DICOMData and the same dataset is
+            # handed to the translation pipeline
+            ds = read_dicom(image_instance.image.path)
+            tags = extract_tags(ds)
+            if not image_instance.modality:
+                image_instance.modality = MODALITY_MAP.get(tags['modality'])
+
         # Determine target modality (Simple heuristic: Swap modality)
         # If uploaded is CT, target is MRI. If MRI, target is CT.
         # This assumes the user wants the 'other' modality.
-        
+
         target_modality = 'MRI'
         if image_instance.modality == 'MRI':
             target_modality = 'CT'
-            
-        from .services import gan_translate_image
-        
+
         # We need the direct file path or file object
         # Since gan_translate_image takes a file path or bytes, passing the path is easiest.
         input_path = image_instance.image.path
-        
-        translated_bytes, filename = gan_translate_image(input_path, target_modality)
-        
+
+        if image_instance.image_type == 'DICOM' and output_format == 'dicom':
+            # One DICOM with every frame; the first frame doubles as preview
+            dicom_bytes, dicom_filename, preview = gan_translate_dicom(input_path, target_modality, dataset=ds)
+            image_instance.translated_dicom.save(dicom_filename, ContentFile(dicom_bytes), save=False)
+            translated_bytes = _png_bytes(preview)
+            filename = f"translated_{target_modality.lower()}.png"
+        elif ds is not None and int(ds.get('NumberOfFrames', 1) or 1) > 1:
+            # Multi-frame files: all frames run as one batch and every frame
+            # is kept next to the first one, under fixed names so a retry
+            # replaces them
+            frames = translate_dicom(ds, target_modality)
+            filename = f"translated_{target_modality.lower()}.png"
+            translated_bytes = _png_bytes(frames[0])
+            tags['dicom_metadata']['translated_frames'] = [
+                _replace_file(
+                    f"translated_images/{image_instance.id}/frame_{i:04d}.png",
+                    _png_bytes(frame)
+                )
+                for i, frame in enumerate(frames)
+            ]
+        else:
+            # Single images and single-frame DICOM go through the translation cache
+            translated_bytes, filename = gan_translate_image(
+                input_path, target_modality, sha256=image_instance.sha256, dataset=ds
+            )
+
+        if image_instance.image_type == 'DICOM':
+            DICOMData.objects.update_or_create(medical_image=image_instance, defaults=tags)
+
         # Save the result to translated_image field
-        from django.core.files.base import ContentFile
         image_instance.translated_image.save(filename, ContentFile(translated_bytes), save=False)
-        
+
         image_instance.translation_status = 'COMPLETED'
         image_instance.save()
 
     except Exception as e:
         image_instance.translation_status = f'FAILED: {e}'
         image_instance.save()
+
+
+@shared_task
+def analyze_images(image_ids, concurrency=None):
+    """
+    Gemini analysis of many uploads, at most `concurrency` (default
+    GEMINI_CONCURRENCY) requests in flight. Images that already have an
+    analysis are skipped. Returns {image id: {'analysis': id} or {'error': message}}.
+    """
+    from .services import MedicalImageAnalyzer
+
+    images = list(MedicalImage.objects.filter(pk__in=image_ids, analysis__isnull=True))
+    results = MedicalImageAnalyzer().analyze_many(images, concurrency)
+    return {
+        str(image.pk): {'analysis': str(result.pk)} if isinstance(result, ImageAnalysis) else {'error': str(result)}
+        for image, result in zip(images, results)
+    }
+
+
+@shared_task
+def translate_stored(image_ids):
+    """
+    Batch translation of uploads from the shard store (manage.py
+    build_shards): batches are read from the memory-mapped shards without
+    decoding or resizing each file again, and every image gets a PNG of the
+    other modality at GAN_SHARD_IMAGE_SIZE. Images not in the store are
+    skipped. Returns {image id: translation status}.
+    """
+    from django.conf import settings
+    from .services import translate_stored_images
+    from .shards import ShardStore
+
+    store = ShardStore(settings.GAN_SHARD_DIR)
+    images = {str(image.pk): image for image in MedicalImage.objects.filter(pk__in=image_ids) if image.pk in store}
+    results = {}
+    for source, target_modality in (('CT', 'MRI'), ('MRI', 'CT')):
+        pending = [pk for pk, image in images.items() if image.modality == source]
+        if not pending:
+            continue
+        MedicalImage.objects.filter(pk__in=pending).update(translation_status='PROCESSING')
+        try:
+            for ids, translated in translate_stored_images(pending, target_modality):
+                for pk, output in zip(ids, translated):
+                    image = images[pk]
+                    image.translated_image.save(
+                        f"translated_{target_modality.lower()}.png", ContentFile(_png_bytes(output)), save=False
+                    )
+                    image.translation_status = results[pk] = 'COMPLETED'
+                    image.save()
+        except Exception as e:
+            failed = [pk for pk in pending if pk not in results]
+            MedicalImage.objects.filter(pk__in=failed).update(translation_status=f'FAILED: {e}')
+            results.update((pk, f'FAILED: {e}') for pk in failed)
+    return results
+
+
+def _series_volume(job):
+    """The job's volume: the stored one while resuming, otherwise (re)built."""
+    from .volume import build_series_volume, open_volume, volume_path
+
+    path = volume_path(job.series_instance_uid)
+    rows = DICOMData.objects.filter(series_instance_uid=job.series_instance_uid)
+    if os.path.exists(path) and not rows.filter(volume={}).exists():
+        return open_volume(path)
+    return build_series_volume(job.series_instance_uid)
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def translate_series(job_id):
+    """
+    Translate every slice of a series in order, `batch_size` slices at a
+    time, from the series volume. Each batch is written to
+    translated_series/<job id>/slice_XXXX.png before completed_slices moves
+    past it, so a job re-run after a crash (acks_late redelivers it) or
+    resumed through the API picks up at the last finished batch.
+    """
+    job = SeriesTranslationJob.objects.get(pk=job_id)
+    if job.status == 'COMPLETED':
+        return
+
+    try:
+        from .dicom import dataset_bytes, encode_pixels, translated_dataset
+        from .services import translate_volume
+        from .volume import volume_headers
+
+        volume = _series_volume(job)
+        if job.total_slices != len(volume):
+            # The series changed since the last attempt: start over
+            job.completed_slices = 0
+        job.total_slices = len(volume)
+        job.output_dir = f"translated_series/{job.id}"
+        if job.output_format == 'dicom':
+            headers = volume_headers(job.series_instance_uid, volume)
+            if not job.output_series_uid:
+                job.output_series_uid = generate_uid()
+        job.status = 'PROCESSING'
+        job.error = ''
+        job.started_at = job.started_at or timezone.now()
+        job.save()
+
+        start = time.perf_counter()
+        done = 0
+        dicom_output = job.output_format == 'dicom'
+        batches = translate_volume(
+            volume, job.target_modality, batch_size=job.batch_size, start=job.completed_slices,
+            raw=dicom_output
+        )
+        for index, images in batches:
+            if dicom_output:
+                # One vectorized encode per batch; the scaling is fixed per
+                # target modality, so it is the same for the whole series
+                stored, slope, intercept = encode_pixels(images, job.target_modality)
+                for offset in range(len(images)):
+                    ds = translated_dataset(
+                        headers[index + offset], stored[offset], job.target_modality, slope, intercept,
+                        series_instance_uid=job.output_series_uid, instance_number=index + offset + 1
+                    )
+                    _replace_file(f"{job.output_dir}/slice_{index + offset:04d}.dcm", dataset_bytes(ds))
+            else:
+                for offset, image in enumerate(images):
+                    _replace_file(f"{job.output_dir}/slice_{index + offset:04d}.png", _png_bytes(image))
+
+            done += len(images)
+            job.completed_slices = index + len(images)
+            job.slices_per_second = done / (time.perf_counter() - start)
+            job.save(update_fields=['completed_slices', 'slices_per_second', 'updated_at'])
+
+        extension = 'dcm' if dicom_output else 'png'
+        manifest = {
+            'series_instance_uid': job.series_instance_uid,
+            'output_series_instance_uid': job.output_series_uid or None,
+            'target_modality': job.target_modality,
+            'slices': [
+                dict(entry, file=f"slice_{index:04d}.{extension}")
+                for index, entry in enumerate(volume.metadata['slices'])
+            ],
+        }
+        _replace_file(f"{job.output_dir}/manifest.json", json.dumps(manifest, indent=2).encode())
+
+        job.status = 'COMPLETED'
+        job.finished_at = timezone.now()
+        job.save()
+
+    except Exception as e:
+        job.status = 'FAILED'
+        job.error = str(e)
+        job.save(update_fields=['status', 'error', 'updated_at'])
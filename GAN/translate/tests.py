@@ -1,3 +1,1883 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import hashlib
+import io
+import itertools
+import json
+import os
+import pickle
+import signal
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pydicom
+import torch
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from pydicom.dataset import FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from models.networks import (
+    DPSA, HPB, FrozenHPB, FusedDPSA, GANLoss, GradPenalty, define_D, define_G, export_G_onnx, freeze_G, fuse_attention,
+    load_G,
+)
+from translate.onnx_backend import OnnxGenerator, onnx_path, ort
+from translate.apps import serves_translations
+from translate.batching import BatchScheduler
+from translate.cache import TranslationCache, translation_cache_key
+from translate.executor import ExecutorSaturated, InferenceExecutor
+from translate.dicom import (
+    dataset_bytes, dicom_to_tensor, encode_pixels, is_dicom, modality_pixels, read_dicom, translated_dataset,
+)
+from translate.models import DICOMData, ImageAnalysis, MedicalImage, SeriesTranslationJob
+from translate.serializers import MedicalImageSerializer, SeriesTranslationJobSerializer
+from translate.services import (
+    GANTranslator, GeneratorRegistry, InferenceOptions, MedicalImageAnalyzer, OptimizedGenerator, artifact_is_fresh,
+    export_onnx_artifact, gan_translate_dicom, gan_translate_image, image_to_tensor, load_generator,
+    load_onnx_generator, optimize_generator, quantized_weights_path, save_quantized_artifact, translate_stored_images,
+)
+from translate.tasks import analyze_images, process_dicom_for_translation, translate_series
+from translate.shards import ShardDataset, ShardStore
+from translate.tiling import tiled_forward
+from translate.training import CycleGANTrainer, SliceDataset, generator_filename, load_slice
+from translate.uploads import StreamingUploadHandler, classify_upload
+from translate import worker_pool
+from translate.worker_pool import (
+    InferencePool, PooledGenerator, get_inference_pool, parse_affinity, preload_pool_weights, share_weights,
+)
+from translate.volume import Volume, build_series_volume, build_volume, open_volume
+
+SAMPLE_DIR = Path(__file__).resolve().parent.parent / 'media' / 'medical_images' / '2026' / '01' / '18'
+
+# One 8-bit gray level in the generators' [-1, 1] output range
+GRAY_LEVEL = 2 / 255
+
+
+def sample_images():
+    return [Image.open(path).convert('RGB') for path in sorted(SAMPLE_DIR.glob('*.png'))]
+
+
+def identity_generators():
+    """Patch in an empty generator registry that loads identity generators (random-weight style, no checkpoint)."""
+    return mock.patch.multiple(
+        'translate.services', generator_registry=GeneratorRegistry(),
+        load_generator=mock.Mock(side_effect=lambda *args, **kwargs: (torch.nn.Identity(), None)),
+    )
+
+
+def dicom_bytes(rows=32, columns=32, modality='CT', preamble=True, pixels=None, **attributes):
+    """A small single-frame 16-bit DICOM file; `attributes` are set on the data set."""
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.2'
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = pydicom.Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.Modality = modality
+    ds.Rows, ds.Columns = rows, columns
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.BitsAllocated = ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 0
+    if pixels is None:
+        pixels = np.arange(rows * columns, dtype=np.uint16)
+    ds.PixelData = pixels.astype(np.uint16).tobytes()
+    for keyword, value in attributes.items():
+        setattr(ds, keyword, value)
+
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=preamble)
+    return buffer.getvalue()
+
+
+@unittest.skipUnless(ort is not None, 'onnxruntime is not installed')
+class OnnxParityTests(SimpleTestCase):
+    """ONNX Runtime output of exported generators matches PyTorch."""
+
+    def _export(self, netG, directory):
+        torch.manual_seed(0)
+        model = define_G(3, 3, 64, netG, 'instance', False, 'normal', 0.02, [])
+        model.eval().requires_grad_(False)
+        path = os.path.join(directory, f'{netG}.onnx')
+        export_G_onnx(model, path, netG)
+        return model, path
+
+    def test_generators_match_pytorch_on_samples(self):
+        images = sample_images()
+        self.assertTrue(images, f'no sample PNGs in {SAMPLE_DIR}')
+        batch = torch.cat([image_to_tensor(image) for image in images])
+
+        with tempfile.TemporaryDirectory() as directory:
+            for netG in ('HPB', 'resnet_6blocks', 'unet_256'):
+                with self.subTest(netG=netG):
+                    model, path = self._export(netG, directory)
+                    with torch.no_grad():
+                        expected = model(batch).numpy()
+                    output = OnnxGenerator(path).run(batch.numpy())
+                    self.assertEqual(output.shape, expected.shape)
+                    np.testing.assert_allclose(output, expected, atol=GRAY_LEVEL)
+
+    def test_dynamic_spatial_axes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            model, path = self._export('resnet_6blocks', directory)
+            batch = torch.rand(2, 3, 128, 192) * 2 - 1
+            with torch.no_grad():
+                expected = model(batch).numpy()
+            np.testing.assert_allclose(OnnxGenerator(path).run(batch.numpy()), expected, atol=GRAY_LEVEL)
+
+
+class FusedDPSATests(SimpleTestCase):
+    """FusedDPSA is a drop-in replacement for DPSA."""
+
+    def setUp(self):
+        torch.manual_seed(0)
+        # DPSA needs the feature map width to equal dim_head
+        self.reference = DPSA(64, dim_head=16, heads=4)
+        self.fused = FusedDPSA(64, dim_head=16, heads=4)
+        self.fused.load_state_dict(self.reference.state_dict())
+        self.x = torch.randn(2, 64, 24, 16)
+
+    def test_forward_matches(self):
+        with torch.no_grad():
+            expected = self.reference(self.x)
+            output = self.fused(self.x)
+        torch.testing.assert_close(output, expected, atol=1e-5, rtol=1e-4)
+
+    def test_gradients_match(self):
+        x = self.x.clone().requires_grad_()
+        self.reference(x).square().sum().backward()
+        expected = x.grad.clone()
+
+        x.grad = None
+        self.fused(x).square().sum().backward()
+        torch.testing.assert_close(x.grad, expected, atol=1e-4, rtol=1e-3)
+        for (name, p), q in zip(self.reference.named_parameters(), self.fused.parameters()):
+            torch.testing.assert_close(q.grad, p.grad, atol=1e-4, rtol=1e-3, msg=name)
+
+    def test_fuse_attention_generator(self):
+        torch.manual_seed(0)
+        model = define_G(3, 3, 16, 'HPB', 'instance', False, 'normal', 0.02, []).eval()
+        x = torch.rand(1, 3, 96, 64) * 2 - 1
+        with torch.no_grad():
+            expected = model(x)
+            fuse_attention(model)
+            output = model(x)
+        self.assertTrue(any(isinstance(m, FusedDPSA) for m in model.modules()))
+        torch.testing.assert_close(output, expected, atol=1e-5, rtol=1e-4)
+
+
+class FreezeGTests(SimpleTestCase):
+    """freeze_G keeps the generator output."""
+
+    def _check(self, netG, norm, x):
+        torch.manual_seed(0)
+        model = define_G(3, 3, 16, netG, norm, False, 'normal', 0.02, [])
+        if norm == 'batch':
+            # non-trivial running statistics to fold
+            with torch.no_grad():
+                model(torch.rand(4, *x.shape[1:]) * 2 - 1)
+        model.eval()
+        frozen = freeze_G(model)
+        with torch.no_grad():
+            torch.testing.assert_close(frozen(x), model(x), atol=1e-4, rtol=1e-4)
+        return frozen
+
+    def test_hpb(self):
+        frozen = self._check('HPB', 'instance', torch.rand(2, 3, 96, 64) * 2 - 1)
+        self.assertFalse(any(isinstance(m, HPB) for m in frozen.modules()))
+        self.assertTrue(any(isinstance(m, FrozenHPB) for m in frozen.modules()))
+        self.assertFalse(any(p.requires_grad for p in frozen.parameters()))
+
+    def test_batch_norm_folding(self):
+        for netG in ('resnet_6blocks', 'unet_128'):
+            with self.subTest(netG=netG):
+                frozen = self._check(netG, 'batch', torch.rand(2, 3, 128, 128) * 2 - 1)
+                self.assertFalse(any(isinstance(m, torch.nn.BatchNorm2d) for m in frozen.modules()))
+
+    def test_original_untouched(self):
+        torch.manual_seed(0)
+        hpb = HPB(64, 16).eval()
+        state = {k: v.clone() for k, v in hpb.state_dict().items()}
+        FrozenHPB(hpb)
+        self.assertEqual(list(hpb.state_dict()), list(state))
+        for k, v in hpb.state_dict().items():
+            torch.testing.assert_close(v, state[k], msg=k)
+
+
+class TiledForwardTests(SimpleTestCase):
+    """Tiled inference reassembles the full image and blends tile seams."""
+
+    def test_identity_reconstruction(self):
+        for shape in ((2, 3, 300, 420), (1, 3, 100, 70)):
+            with self.subTest(shape=shape):
+                x = torch.rand(shape) * 2 - 1
+                output = tiled_forward(lambda tiles: tiles, x, tile_size=128, overlap=32, tile_batch_size=3)
+                self.assertEqual(output.shape, x.shape)
+                torch.testing.assert_close(output, x)
+
+        with self.assertRaises(ValueError):
+            tiled_forward(lambda tiles: tiles, x, tile_size=128, overlap=128)
+
+    def test_seams_are_blended(self):
+        def offset_model():
+            # Every tile comes back shifted by its own constant, the worst
+            # case for a visible seam
+            counter = itertools.count()
+            return lambda tiles: torch.stack([tile + next(counter) for tile in tiles])
+
+        def largest_step(overlap):
+            x = torch.rand(1, 1, 300, 420)
+            shift = tiled_forward(offset_model(), x, tile_size=128, overlap=overlap, tile_batch_size=3) - x
+            # Pixels covered by the first tile only are untouched
+            self.assertLess(shift[..., :64, :64].abs().max(), 1e-6)
+            return max(shift.diff(dim=-1).abs().max(), shift.diff(dim=-2).abs().max())
+
+        # 3 x 5 tiles: neighbours differ by up to 5. The feathered window
+        # spreads that over the 32-pixel overlap instead of one step
+        self.assertLess(largest_step(32), 0.25)
+        self.assertGreaterEqual(largest_step(0), 1.0)
+
+
+class TranslationCacheTests(SimpleTestCase):
+    """Memory LRU, disk persistence and oldest-first pruning of the translation cache."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.keys = [
+            translation_cache_key(hashlib.sha256(bytes([i])).hexdigest(), 'MRI', 'weights', {'size': 256})
+            for i in range(3)
+        ]
+
+    def test_key(self):
+        sha256 = hashlib.sha256(b'input').hexdigest()
+        key = translation_cache_key(sha256, 'mri', 'weights', {'size': 256, 'tiled': False})
+        self.assertEqual(key, translation_cache_key(sha256, 'MRI', 'weights', {'tiled': False, 'size': 256}))
+        self.assertNotEqual(key, translation_cache_key(sha256, 'CT', 'weights', {'size': 256, 'tiled': False}))
+        self.assertNotEqual(key, translation_cache_key(sha256, 'MRI', 'other', {'size': 256, 'tiled': False}))
+        self.assertNotEqual(key, translation_cache_key(sha256, 'MRI', 'weights', {'size': 256, 'tiled': True}))
+
+    def test_memory_lru_eviction(self):
+        a, b, c = self.keys
+        cache = TranslationCache(self.directory.name, memory_max_bytes=10)
+        cache.set(a, b'aaaa')
+        cache.set(b, b'bbbb')
+        self.assertEqual(cache.get(a), b'aaaa')  # a is now the most recent
+        cache.set(c, b'cccc')
+
+        stats = cache.stats()
+        self.assertEqual((stats['memory_entries'], stats['memory_bytes']), (2, 8))
+        self.assertEqual(cache.get(a), b'aaaa')
+        self.assertEqual(cache.stats()['disk_hits'], 0)
+        # b was evicted from memory but is still on disk
+        self.assertEqual(cache.get(b), b'bbbb')
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+
+    def test_disk_persistence(self):
+        a = self.keys[0]
+        TranslationCache(self.directory.name).set(a, b'png bytes')
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, a[:2], f'{a}.png')))
+
+        # A new process (fresh memory tier) reads it from disk
+        cache = TranslationCache(self.directory.name)
+        self.assertEqual(cache.get(a), b'png bytes')
+        self.assertEqual(cache.get(a), b'png bytes')
+        self.assertIsNone(cache.get(self.keys[1]))
+        stats = cache.stats()
+        self.assertEqual((stats['disk_hits'], stats['memory_hits'], stats['misses']), (1, 1, 1))
+
+    def test_prune_removes_least_recently_used(self):
+        a, b, c = self.keys
+        cache = TranslationCache(self.directory.name, memory_max_bytes=0, disk_max_bytes=10)
+        cache.set(a, b'aaaa')
+        cache.set(b, b'bbbb')
+        now = time.time()
+        os.utime(cache._path(a), (now - 30, now - 30))
+        os.utime(cache._path(b), (now - 20, now - 20))
+        # Reading a refreshes its mtime, so b is now the oldest
+        self.assertEqual(cache.get(a), b'aaaa')
+
+        cache.set(c, b'cccc')
+        self.assertEqual(cache.stats()['disk_evictions'], 1)
+        self.assertEqual(cache.stats()['disk_bytes'], 8)
+        self.assertIsNone(cache.get(b))
+        self.assertEqual(cache.get(a), b'aaaa')
+        self.assertEqual(cache.get(c), b'cccc')
+
+        self.assertEqual(cache.clear(), (2, 8))
+        self.assertIsNone(cache.get(a))
+
+
+class MediaLayoutTests(SimpleTestCase):
+    """MEDIA_ROOT is served under DEBUG; only uploads and results may live there."""
+
+    def test_internal_files_are_not_served(self):
+        from django.conf import settings
+
+        media_root = Path(settings.MEDIA_ROOT).resolve()
+        self.assertNotEqual(media_root, Path(settings.BASE_DIR).resolve())
+        self.assertNotIn(media_root, Path(settings.DATABASES['default']['NAME']).resolve().parents)
+        for name in ('GAN_TRANSLATION_CACHE_DIR', 'GAN_UPLOAD_TEMP_DIR', 'GAN_VOLUME_DIR', 'GAN_SHARD_DIR'):
+            with self.subTest(name):
+                path = Path(getattr(settings, name)).resolve()
+                self.assertNotEqual(path, media_root)
+                self.assertNotIn(media_root, path.parents)
+
+
+class StreamingUploadTests(TestCase):
+    """Uploads are streamed to disk, hashed and classified from their headers."""
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.upload_dir = os.path.join(self.media_root.name, '.uploads')
+        self.settings = override_settings(MEDIA_ROOT=self.media_root.name, GAN_UPLOAD_TEMP_DIR=self.upload_dir)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media_root.cleanup()
+
+    def _upload(self, name, data):
+        request = RequestFactory().post('/', {'image': SimpleUploadedFile(name, data)})
+        request.upload_handlers = [StreamingUploadHandler(request)]
+        uploaded = request.FILES['image']
+        self.addCleanup(uploaded.close)
+        return uploaded
+
+    def test_png_upload(self):
+        data = (SAMPLE_DIR / 'ct18.png').read_bytes()
+        uploaded = self._upload('slice.png', data)
+        self.assertEqual(uploaded.sha256, hashlib.sha256(data).hexdigest())
+        self.assertEqual(uploaded.image_type, 'IMAGE')
+        self.assertTrue(uploaded.temporary_file_path().startswith(self.upload_dir))
+
+    def test_dicom_classified_by_content(self):
+        self.assertEqual(self._upload('scan.bin', dicom_bytes()).image_type, 'DICOM')
+        self.assertEqual(self._upload('scan.dcm', dicom_bytes(preamble=False)).image_type, 'DICOM')
+
+    @identity_generators()
+    def test_dicom_without_preamble_translates(self):
+        # Classified as DICOM and decoded as DICOM by the same check
+        data = dicom_bytes(preamble=False)
+        self.assertNotEqual(data[128:132], b'DICM')
+        self.assertTrue(is_dicom(io.BytesIO(data)))
+        self.assertEqual(self._upload('scan.bin', data).image_type, 'DICOM')
+
+        png, _ = gan_translate_image(data, 'MRI', tiled=False)
+        self.assertEqual(Image.open(io.BytesIO(png)).size, (256, 256))
+        preview = gan_translate_dicom(data, 'MRI', tiled=False)[2]
+        self.assertEqual(preview.size, (256, 256))
+
+        self.assertFalse(is_dicom(io.BytesIO((SAMPLE_DIR / 'ct18.png').read_bytes())))
+
+    def test_unsupported_upload(self):
+        self.assertIsNone(self._upload('notes.png', b'not an image').image_type)
+        self.assertIsNone(self._upload('notes.dcm', b'not a dicom file').image_type)
+
+        serializer = MedicalImageSerializer(data={'image': self._upload('notes.png', b'not an image')})
+        self.assertFalse(serializer.is_valid())
+
+    def test_save_moves_streamed_file(self):
+        data = dicom_bytes()
+        serializer = MedicalImageSerializer(data={'image': self._upload('scan.dcm', data)})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        instance = serializer.save()
+
+        self.assertEqual(instance.image_type, 'DICOM')
+        self.assertEqual(instance.sha256, hashlib.sha256(data).hexdigest())
+        self.assertTrue(instance.image.path.startswith(self.media_root.name))
+        with open(instance.image.path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+    def test_classify_in_memory_file(self):
+        self.assertEqual(classify_upload(SimpleUploadedFile('scan', dicom_bytes())), 'DICOM')
+        self.assertEqual(classify_upload(SimpleUploadedFile('x.png', (SAMPLE_DIR / 'ct20.png').read_bytes())), 'IMAGE')
+
+
+@identity_generators()
+class TranslationTaskTests(TestCase):
+    """process_dicom_for_translation on a small synthetic DICOM upload."""
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root.name, GAN_TRANSLATION_CACHE_ENABLED=False)
+        self.settings.enable()
+        self.image = MedicalImage.objects.create(
+            image=SimpleUploadedFile('scan.dcm', dicom_bytes(PatientID='P1')), image_type='DICOM',
+        )
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media_root.cleanup()
+
+    def run_task(self, output_format):
+        # translate.services imports read_dicom by name; count both references
+        reads = mock.Mock(wraps=read_dicom)
+        with mock.patch('translate.dicom.read_dicom', reads), mock.patch('translate.services.read_dicom', reads):
+            process_dicom_for_translation(self.image.id, output_format)
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.translation_status, 'COMPLETED')
+        self.assertEqual(reads.call_count, 1)
+
+    def test_png_output(self):
+        self.run_task('png')
+        self.assertEqual(self.image.modality, 'CT')
+        self.assertEqual(self.image.dicom_data.patient_id, 'P1')
+        with self.image.translated_image.open() as f:
+            self.assertEqual(Image.open(f).size, (256, 256))
+        self.assertFalse(self.image.translated_dicom)
+
+    def test_dicom_output(self):
+        self.run_task('dicom')
+        with self.image.translated_dicom.open() as f:
+            ds = pydicom.dcmread(f)
+        self.assertEqual((ds.Modality, ds.PatientID), ('MR', 'P1'))
+        self.assertTrue(self.image.translated_image)
+
+    def test_multi_frame_retry_replaces_frames(self):
+        self.image.image.save('frames.dcm', ContentFile(dicom_bytes(
+            pixels=np.arange(3 * 32 * 32), NumberOfFrames=3, PatientID='P1'
+        )))
+        self.run_task('png')
+        frames = self.image.dicom_data.dicom_metadata['translated_frames']
+        self.assertEqual(frames, [f'translated_images/{self.image.id}/frame_{i:04d}.png' for i in range(3)])
+
+        # A retry writes the same names instead of leaving suffixed copies behind
+        self.run_task('png')
+        self.assertEqual(self.image.dicom_data.dicom_metadata['translated_frames'], frames)
+        _, files = default_storage.listdir(f'translated_images/{self.image.id}')
+        self.assertEqual(sorted(files), [os.path.basename(name) for name in frames])
+
+
+class SeriesFixtureMixin:
+    """Five single-slice DICOM files of one series under a temporary MEDIA_ROOT."""
+
+    series_uid = '1.2.3.4.5'
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            MEDIA_ROOT=self.media_root.name, GAN_VOLUME_DIR=os.path.join(self.media_root.name, 'volumes')
+        )
+        self.settings.enable()
+
+        rng = np.random.default_rng(0)
+        self.paths = []
+        # written in reverse so ordering has to come from the geometry
+        for z in reversed(range(5)):
+            path = os.path.join(self.media_root.name, f'slice{z}.dcm')
+            with open(path, 'wb') as f:
+                f.write(dicom_bytes(
+                    rows=24, columns=20, pixels=rng.integers(0, 4096, 24 * 20),
+                    SeriesInstanceUID=self.series_uid, InstanceNumber=z + 1,
+                    ImagePositionPatient=[0, 0, z * 2.5], ImageOrientationPatient=[1, 0, 0, 0, 1, 0],
+                    RescaleSlope=1, RescaleIntercept=-1024, WindowCenter=40, WindowWidth=400,
+                ))
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media_root.cleanup()
+
+    def create_rows(self, user=None):
+        for path in self.paths:
+            ds = read_dicom(path, stop_before_pixels=True)
+            image = MedicalImage.objects.create(
+                user=user, image=os.path.relpath(path, self.media_root.name), image_type='DICOM'
+            )
+            DICOMData.objects.create(
+                medical_image=image, series_instance_uid=self.series_uid, instance_number=int(ds.InstanceNumber),
+                modality='CT', dicom_metadata={'SOPInstanceUID': str(ds.SOPInstanceUID)}
+            )
+
+
+class VolumeTests(SeriesFixtureMixin, TestCase):
+    """Series stacked into a memmap give the same generator input as the files."""
+
+    def test_build_and_read(self):
+        volume = build_volume(self.paths, os.path.join(self.media_root.name, 'volumes', 'v.npy'))
+        self.assertEqual(volume.shape, (5, 24, 20))
+        self.assertEqual(volume.array.dtype, np.uint16)
+        self.assertIsInstance(volume.array, np.memmap)
+        self.assertEqual([s['instance_number'] for s in volume.metadata['slices']], [1, 2, 3, 4, 5])
+
+        by_instance = {int(read_dicom(p).InstanceNumber): p for p in self.paths}
+        for index in range(len(volume)):
+            ds = read_dicom(by_instance[index + 1])
+            np.testing.assert_array_equal(volume.raw(index)[0], ds.pixel_array)
+            torch.testing.assert_close(volume.to_tensor(index), dicom_to_tensor(ds))
+
+        batches = list(volume.batches(2))
+        self.assertEqual([start for start, _ in batches], [0, 2, 4])
+        self.assertEqual(batches[-1][1].shape, (1, 3, 256, 256))
+        self.assertEqual(volume.slice_image(0).size, (20, 24))
+
+    def test_build_series_volume_links_rows(self):
+        self.create_rows()
+        volume = build_series_volume(self.series_uid)
+        for row in DICOMData.objects.all():
+            self.assertEqual(row.volume['index'], row.instance_number - 1)
+            self.assertIsInstance(open_volume(row.volume['path']), Volume)
+        self.assertIs(open_volume(row.volume['path']), open_volume(volume.path))
+
+
+def fake_translate_volume(volume, target_modality, tiled=None, batch_size=None, start=0, raw=False, fail_after=None):
+    """translate_volume without a generator: one small image per slice."""
+    for batch, index in enumerate(range(start, len(volume), batch_size)):
+        if fail_after is not None and batch == fail_after:
+            raise RuntimeError('worker lost')
+        count = min(batch_size, len(volume) - index)
+        if raw:
+            yield index, np.stack([np.full((8, 8), (index + i) / 10, np.float32) for i in range(count)])
+        else:
+            yield index, [Image.new('L', (8, 8), color=index + i) for i in range(count)]
+
+
+class SeriesTranslationJobTests(SeriesFixtureMixin, TestCase):
+    """Series jobs translate in order, record progress and resume."""
+
+    def setUp(self):
+        super().setUp()
+        self.create_rows()
+
+    def _job(self):
+        serializer = SeriesTranslationJobSerializer(data={'series_instance_uid': self.series_uid, 'batch_size': 2})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer.save()
+
+    def _output(self, job, index):
+        path = os.path.join(self.media_root.name, job.output_dir, f'slice_{index:04d}.png')
+        return Image.open(path).getpixel((0, 0))
+
+    def test_target_modality_defaults_to_the_other_one(self):
+        self.assertEqual(self._job().target_modality, 'MRI')
+        serializer = SeriesTranslationJobSerializer(data={'series_instance_uid': 'unknown'})
+        self.assertFalse(serializer.is_valid())
+
+    @mock.patch('translate.services.translate_volume', side_effect=fake_translate_volume)
+    def test_translates_series_in_order(self, translate_volume):
+        job = self._job()
+        translate_series(job.id)
+        job.refresh_from_db()
+
+        self.assertEqual(job.status, 'COMPLETED')
+        self.assertEqual((job.completed_slices, job.total_slices), (5, 5))
+        self.assertIsNone(job.eta_seconds)
+        self.assertEqual([self._output(job, i) for i in range(5)], [0, 1, 2, 3, 4])
+        with open(os.path.join(self.media_root.name, job.output_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+        self.assertEqual([s['instance_number'] for s in manifest['slices']], [1, 2, 3, 4, 5])
+
+    def test_resumes_after_last_finished_batch(self):
+        job = self._job()
+        crash = lambda *args, **kwargs: fake_translate_volume(*args, fail_after=1, **kwargs)
+        with mock.patch('translate.services.translate_volume', side_effect=crash):
+            translate_series(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.completed_slices), ('FAILED', 2))
+        self.assertEqual(job.error, 'worker lost')
+
+        with mock.patch('translate.services.translate_volume', side_effect=fake_translate_volume) as translate_volume:
+            translate_series(job.id)
+        self.assertEqual(translate_volume.call_args.kwargs['start'], 2)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.completed_slices), ('COMPLETED', 5))
+        self.assertEqual([self._output(job, i) for i in range(5)], [0, 1, 2, 3, 4])
+
+
+    @mock.patch('translate.views.translate_series.delay')
+    def test_resume_endpoint_only_requeues_failed_jobs(self, delay):
+        client = APIClient()
+        alice = get_user_model().objects.create_user('alice', password='secret')
+        client.force_authenticate(alice)
+        job = self._job()
+        SeriesTranslationJob.objects.filter(pk=job.pk).update(user=alice)
+        url = f'/api/series-translations/{job.id}/resume/'
+
+        for current in ('PENDING', 'PROCESSING'):
+            SeriesTranslationJob.objects.filter(pk=job.pk).update(status=current)
+            self.assertEqual(client.post(url).status_code, 409)
+        SeriesTranslationJob.objects.filter(pk=job.pk).update(status='COMPLETED')
+        self.assertEqual(client.post(url).status_code, 400)
+        delay.assert_not_called()
+
+        SeriesTranslationJob.objects.filter(pk=job.pk).update(status='FAILED')
+        response = client.post(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'PENDING')
+        # A second resume before the worker picks the job up is refused
+        self.assertEqual(client.post(url).status_code, 409)
+        delay.assert_called_once_with(job.id)
+
+
+@mock.patch('translate.views.translate_series.delay')
+class SeriesTranslationJobOwnerTests(SeriesFixtureMixin, TestCase):
+    """Series jobs are scoped to the requester, like uploads."""
+
+    url = '/api/series-translations/'
+
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        self.alice = User.objects.create_user('alice', password='secret')
+        self.bob = User.objects.create_user('bob', password='secret')
+        self.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.create_rows(user=self.alice)
+        self.client = APIClient()
+
+    def post(self, user):
+        self.client.force_authenticate(user)
+        return self.client.post(self.url, {'series_instance_uid': self.series_uid})
+
+    def test_jobs_are_scoped_to_the_requester(self, delay):
+        response = self.post(self.alice)
+        self.assertEqual(response.status_code, 202)
+        job = SeriesTranslationJob.objects.get(pk=response.json()['id'])
+        self.assertEqual(job.user, self.alice)
+        SeriesTranslationJob.objects.filter(pk=job.pk).update(status='FAILED')
+
+        self.client.force_authenticate(self.bob)
+        self.assertEqual(self.client.get(self.url).json(), [])
+        self.assertEqual(self.client.get(f'{self.url}{job.id}/').status_code, 404)
+        self.assertEqual(self.client.post(f'{self.url}{job.id}/resume/').status_code, 404)
+
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.client.get(f'{self.url}{job.id}/').status_code, 200)
+        self.client.force_authenticate(self.alice)
+        self.assertEqual([row['id'] for row in self.client.get(self.url).json()], [str(job.id)])
+        self.assertEqual(self.client.post(f'{self.url}{job.id}/resume/').status_code, 202)
+
+    def test_cannot_start_a_job_on_another_users_series(self, delay):
+        self.assertEqual(self.post(self.bob).status_code, 400)
+        # Not even by adding one slice of their own to it
+        DICOMData.objects.create(
+            medical_image=MedicalImage.objects.create(user=self.bob, image='bob.dcm', image_type='DICOM'),
+            series_instance_uid=self.series_uid, modality='CT',
+        )
+        self.assertEqual(self.post(self.bob).status_code, 400)
+        self.assertEqual(self.post(self.staff).status_code, 202)
+        delay.assert_called_once()
+
+class DicomOutputTests(SeriesFixtureMixin, TestCase):
+    """Translated slices written back as DICOM."""
+
+    def test_encode_pixels_is_a_linear_map(self):
+        outputs = np.array([[-1.0, 0.0], [1.0, 2.0]], dtype=np.float32)
+        stored, slope, intercept = encode_pixels(outputs, 'CT')
+        self.assertEqual(stored.dtype, np.uint16)
+        np.testing.assert_allclose(stored * slope + intercept, [[-1024, 1023.5], [3071, 3071]], atol=0.5)
+
+    def test_translated_dataset(self):
+        source = read_dicom(self.paths[0])
+        source.PatientID = 'P1'
+        source.StudyInstanceUID = '1.2.3.4'
+        source.PixelSpacing = [0.5, 0.5]
+        stored, slope, intercept = encode_pixels(np.zeros((48, 40), np.float32), 'MRI')
+        ds = read_dicom(io.BytesIO(dataset_bytes(translated_dataset(source, stored, 'MRI', slope, intercept))))
+
+        self.assertEqual((ds.Modality, ds.PatientID, ds.StudyInstanceUID), ('MR', 'P1', '1.2.3.4'))
+        self.assertNotEqual(ds.SOPInstanceUID, source.SOPInstanceUID)
+        self.assertNotEqual(ds.SeriesInstanceUID, source.SeriesInstanceUID)
+        self.assertEqual(ds.SourceImageSequence[0].ReferencedSOPInstanceUID, source.SOPInstanceUID)
+        self.assertEqual([float(v) for v in ds.PixelSpacing], [0.25, 0.25])
+        self.assertEqual(ds.pixel_array.shape, (48, 40))
+        np.testing.assert_allclose(modality_pixels(ds), 2047.5, atol=0.5)
+
+    def test_series_job_writes_one_dicom_series(self):
+        self.create_rows()
+        job = SeriesTranslationJob.objects.create(
+            series_instance_uid=self.series_uid, target_modality='MRI', batch_size=2, output_format='dicom'
+        )
+        with mock.patch('translate.services.translate_volume', side_effect=fake_translate_volume):
+            translate_series(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'COMPLETED', job.error)
+
+        outputs = [
+            read_dicom(os.path.join(self.media_root.name, job.output_dir, f'slice_{i:04d}.dcm')) for i in range(5)
+        ]
+        self.assertEqual({ds.SeriesInstanceUID for ds in outputs}, {job.output_series_uid})
+        self.assertEqual([int(ds.InstanceNumber) for ds in outputs], [1, 2, 3, 4, 5])
+        self.assertEqual({ds.Modality for ds in outputs}, {'MR'})
+        self.assertEqual(len({ds.SOPInstanceUID for ds in outputs}), 5)
+
+
+@identity_generators()
+class BatchTranslationViewTests(TestCase):
+    """POST /api/translate/gan/batch/ with zipped slices; the generator is an identity."""
+
+    url = '/api/translate/gan/batch/'
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('radiologist', password='secret')
+        self.client.force_login(self.user)
+
+    def _post(self, members):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            for name, data in members:
+                zf.writestr(name, data)
+        archive = SimpleUploadedFile('series.zip', buffer.getvalue(), content_type='application/zip')
+        response = self.client.post(self.url, {'archive': archive, 'target_modality': 'MRI', 'batch_size': 2})
+        self.assertEqual(response.status_code, 200)
+        result = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        return result, json.loads(result.read('manifest.json'))
+
+    def test_png_zip(self):
+        pngs = sorted(SAMPLE_DIR.glob('*.png'))[:3]
+        result, manifest = self._post([(f'slice{10 - i}.png', path.read_bytes()) for i, path in enumerate(pngs)])
+        self.assertEqual(manifest['failed'], 0)
+        # Natural filename order: slice8, slice9, slice10
+        self.assertEqual([entry['source'] for entry in manifest['slices']], ['slice8.png', 'slice9.png', 'slice10.png'])
+        for entry in manifest['slices']:
+            self.assertEqual(Image.open(io.BytesIO(result.read(entry['output']))).size, (256, 256))
+
+    def test_dicom_zip(self):
+        # Names sort the other way round from the InstanceNumbers; one member
+        # has no preamble
+        members = [
+            ('a.dcm', dicom_bytes(48, 40, InstanceNumber=3)),
+            ('b.dcm', dicom_bytes(48, 40, InstanceNumber=1, preamble=False)),
+            ('c.dcm', dicom_bytes(48, 40, InstanceNumber=2)),
+        ]
+        result, manifest = self._post(members)
+        self.assertEqual(manifest['failed'], 0, manifest)
+        self.assertEqual([entry['source'] for entry in manifest['slices']], ['b.dcm', 'c.dcm', 'a.dcm'])
+        output = np.asarray(Image.open(io.BytesIO(result.read(manifest['slices'][0]['output']))))
+        self.assertEqual(output.shape, (256, 256))
+        # The windowed ramp, not a blank frame
+        self.assertGreater(output.max() - output.min(), 200)
+
+
+class InferenceOptionsTests(SimpleTestCase):
+    """The accuracy guard keeps fp32 when an optimization drifts; bad modes and dtypes are rejected."""
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = define_G(3, 3, 8, 'resnet_6blocks', norm='instance').eval().requires_grad_(False)
+
+    def test_accurate_optimization_is_used(self):
+        optimized = optimize_generator(self.model, InferenceOptions(channels_last=True))
+        self.assertIsInstance(optimized, OptimizedGenerator)
+
+    def test_drift_falls_back_to_fp32(self):
+        drifting = lambda self, x: self.model(x) + 0.5
+        with mock.patch.object(OptimizedGenerator, 'forward', drifting):
+            self.assertIs(optimize_generator(self.model, InferenceOptions(channels_last=True)), self.model)
+            # Without the guard the drifting model is served as is
+            self.assertIsInstance(
+                optimize_generator(self.model, InferenceOptions(channels_last=True), guard=False), OptimizedGenerator
+            )
+
+        # bf16 drift against a tolerance it cannot meet
+        with override_settings(GAN_ACCURACY_MIN_PSNR=200.0):
+            self.assertIs(optimize_generator(self.model, InferenceOptions(bf16=True)), self.model)
+
+    def test_unsupported_values_are_rejected(self):
+        for kwargs in ({'compile': 'tensorrt'}, {'quantize': 'int4'}, {'backend': 'tflite'}):
+            with self.subTest(**kwargs), self.assertRaises(ValueError):
+                InferenceOptions(**kwargs)
+        for dtype in (torch.int8, torch.float64, torch.qint8):
+            with self.subTest(dtype=dtype):
+                with self.assertRaisesMessage(ValueError, 'Unsupported generator dtype'):
+                    GeneratorRegistry().get('MRI', dtype=dtype)
+                with self.assertRaises(ValueError):
+                    GANTranslator('MRI', dtype=dtype)
+
+
+class GeneratorCheckpointMixin:
+    """A resnet_6blocks checkpoint in a temporary directory, resolved by _weights_path."""
+
+    netG = 'resnet_6blocks'
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.weights_path = os.path.join(self.directory.name, generator_filename('G_A', self.netG))
+        self.save_checkpoint(seed=0)
+        patcher = mock.patch('translate.services._weights_path', return_value=self.weights_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.x = torch.rand(1, 3, 64, 64) * 2 - 1
+
+    def save_checkpoint(self, seed, mtime_offset=0):
+        torch.manual_seed(seed)
+        torch.save(define_G(3, 3, 64, self.netG, norm='instance').state_dict(), self.weights_path)
+        mtime = time.time() + mtime_offset
+        os.utime(self.weights_path, (mtime, mtime))
+
+
+class QuantizedArtifactTests(GeneratorCheckpointMixin, SimpleTestCase):
+    """int8 artifacts are only loaded when they were built from the current checkpoint."""
+
+    def setUp(self):
+        super().setUp()
+        self.artifact = quantized_weights_path(self.weights_path)
+
+    def load(self):
+        with mock.patch('translate.services.save_quantized_artifact', wraps=save_quantized_artifact) as save:
+            model, _ = load_generator('MRI', self.netG, quantize=True)
+        with torch.no_grad():
+            return model(self.x), save.called
+
+    def test_quantized_load_path(self):
+        built, rebuilt = self.load()
+        self.assertTrue(rebuilt)
+        self.assertTrue(artifact_is_fresh(self.artifact, self.weights_path))
+
+        loaded, rebuilt = self.load()
+        self.assertFalse(rebuilt)
+        torch.testing.assert_close(loaded, built)
+
+    def test_stale_artifact_is_rebuilt(self):
+        old, _ = self.load()
+
+        # Retrained checkpoint: the artifact no longer matches and is rebuilt
+        self.save_checkpoint(seed=1, mtime_offset=10)
+        self.assertFalse(artifact_is_fresh(self.artifact, self.weights_path))
+        new, rebuilt = self.load()
+        self.assertTrue(rebuilt)
+        self.assertFalse(torch.allclose(new, old))
+        with open(self.artifact + '.json') as f:
+            self.assertEqual(json.load(f)['source_sha256'], hashlib.sha256(Path(self.weights_path).read_bytes()).hexdigest())
+
+        # Only the mtime changed: same content, still fresh
+        os.utime(self.weights_path, (time.time() + 20, time.time() + 20))
+        self.assertTrue(artifact_is_fresh(self.artifact, self.weights_path))
+        self.assertFalse(self.load()[1])
+
+        # Artifacts from before the record existed are not trusted
+        os.remove(self.artifact + '.json')
+        self.assertTrue(self.load()[1])
+
+    def test_artifact_is_loaded_without_unpickling_objects(self):
+        self.load()
+        torch.save({'payload': Path(self.artifact)}, self.artifact)
+        with self.assertRaises(pickle.UnpicklingError):
+            self.load()
+
+
+@unittest.skipUnless(ort is not None, 'onnxruntime is not installed')
+class OnnxArtifactTests(GeneratorCheckpointMixin, SimpleTestCase):
+    """ONNX exports are exported again when the checkpoint changes."""
+
+    def run_onnx(self):
+        with mock.patch('translate.services.export_onnx_artifact', wraps=export_onnx_artifact) as export:
+            generator, weights_path = load_onnx_generator('MRI', self.netG)
+        self.assertEqual(weights_path, self.weights_path)
+        return generator.run(self.x.numpy()), export.called
+
+    def torch_output(self):
+        model, _ = load_generator('MRI', self.netG)
+        with torch.no_grad():
+            return model(self.x).numpy()
+
+    def test_missing_export(self):
+        with self.assertRaises(FileNotFoundError):
+            load_onnx_generator('MRI', self.netG)
+
+    def test_stale_export_is_rebuilt(self):
+        model, _ = load_generator('MRI', self.netG)
+        path = export_onnx_artifact(model, self.weights_path, self.netG)
+        self.assertEqual(path, onnx_path(self.weights_path))
+
+        output, exported = self.run_onnx()
+        self.assertFalse(exported)
+        np.testing.assert_allclose(output, self.torch_output(), atol=GRAY_LEVEL)
+
+        self.save_checkpoint(seed=1, mtime_offset=10)
+        output, exported = self.run_onnx()
+        self.assertTrue(exported)
+        np.testing.assert_allclose(output, self.torch_output(), atol=GRAY_LEVEL)
+        self.assertTrue(artifact_is_fresh(path, self.weights_path))
+
+
+class GeneratorRegistryTests(SimpleTestCase):
+    """One load per key under concurrency, reloads on checkpoint change, stats."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.weights_path = os.path.join(self.directory.name, 'latest_net_G_A.pth')
+        Path(self.weights_path).write_bytes(b'weights')
+        self.loads = 0
+        patcher = mock.patch('translate.services.load_generator', side_effect=self.load_generator)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.registry = GeneratorRegistry()
+
+    def load_generator(self, *args, **kwargs):
+        self.loads += 1
+        time.sleep(0.05)
+        return torch.nn.Identity(), self.weights_path
+
+    def touch(self, offset):
+        mtime = time.time() + offset
+        os.utime(self.weights_path, (mtime, mtime))
+
+    def test_concurrent_first_load(self):
+        barrier = threading.Barrier(8)
+        models = []
+
+        def get():
+            barrier.wait()
+            models.append(self.registry.get('mri'))
+
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+        self.assertEqual(len(models), 8)
+        self.assertEqual(self.loads, 1)
+        self.assertTrue(all(model is models[0] for model in models))
+        stats = self.registry.stats()
+        self.assertEqual((stats['misses'], stats['hits'], stats['reloads']), (1, 7, 0))
+
+    def test_reload_on_checkpoint_change(self):
+        first = self.registry.get('MRI')
+        self.assertIs(self.registry.get('MRI'), first)
+
+        self.touch(10)
+        second = self.registry.get('MRI')
+        self.assertIsNot(second, first)
+        self.assertEqual(self.loads, 2)
+        self.assertEqual(self.registry.stats()['reloads'], 1)
+        self.assertEqual(self.registry.generation, 1)
+
+        with override_settings(GAN_RELOAD_ON_CHANGE=False):
+            self.touch(20)
+            self.assertIs(self.registry.get('MRI'), second)
+        self.assertEqual(self.loads, 2)
+
+        self.registry.reload('mri')
+        self.assertIsNot(self.registry.get('MRI'), second)
+        self.assertEqual(self.registry.generation, 2)
+
+    def test_stats(self):
+        self.registry.warm_up(['MRI', 'CT'])
+        self.registry.get('MRI')
+        stats = self.registry.stats()
+        self.assertEqual((stats['misses'], stats['hits']), (2, 1))
+        self.assertGreater(stats['load_seconds'], 0)
+        self.assertEqual(sorted(entry['target_modality'] for entry in stats['loaded']), ['CT', 'MRI'])
+        for entry in stats['loaded']:
+            self.assertEqual((entry['netG'], entry['device'], entry['weights_path']), ('HPB', 'cpu', self.weights_path))
+            self.assertGreater(entry['load_seconds'], 0)
+
+    def test_warm_up_only_in_serving_processes(self):
+        self.assertTrue(serves_translations(['/venv/bin/gunicorn', 'GAN.wsgi'], {}))
+        self.assertTrue(serves_translations(['/venv/bin/celery', '-A', 'GAN', 'worker'], {}))
+        self.assertTrue(serves_translations(['manage.py', 'runserver'], {'RUN_MAIN': 'true'}))
+        self.assertTrue(serves_translations(['manage.py', 'runserver', '--noreload'], {}))
+        self.assertFalse(serves_translations(['manage.py', 'runserver'], {}))
+        self.assertFalse(serves_translations(['manage.py', 'migrate'], {}))
+        self.assertFalse(serves_translations(['/venv/bin/celery', '-A', 'GAN', 'beat'], {}))
+
+
+class GatedModel(torch.nn.Module):
+    """Doubles its input; every forward pass blocks until `gate` is set and records its batch size."""
+
+    def __init__(self, error=None):
+        super().__init__()
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.batch_sizes = []
+        self.error = error
+
+    def forward(self, x):
+        self.batch_sizes.append(len(x))
+        self.started.set()
+        self.gate.wait(timeout=5)
+        if self.error is not None:
+            raise self.error
+        return x * 2
+
+
+class BatchSchedulerTests(SimpleTestCase):
+    """Micro-batching: coalescing under load, immediate dispatch when idle, errors reach every waiter."""
+
+    def test_lone_request_is_not_held(self):
+        scheduler = BatchScheduler(max_batch_size=8, max_wait_ms=5000)
+        model = torch.nn.Identity()
+        x = torch.rand(1, 3, 8, 8)
+        start = time.monotonic()
+        torch.testing.assert_close(scheduler.run(model, x, timeout=5), x)
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_coalesces_requests_queued_behind_a_batch(self):
+        scheduler = BatchScheduler(max_batch_size=3, max_wait_ms=50)
+        model = GatedModel()
+        first = scheduler.submit(model, torch.zeros(3, 4, 4))
+        self.assertTrue(model.started.wait(timeout=5))
+
+        # Queued while the first batch runs: split into max_batch_size groups
+        inputs = [torch.full((1, 3, 4, 4), float(i)) for i in range(4)]
+        futures = [scheduler.submit(model, x) for x in inputs]
+        model.gate.set()
+
+        first.result(timeout=5)
+        for x, future in zip(inputs, futures):
+            torch.testing.assert_close(future.result(timeout=5), x * 2)
+        self.assertEqual(model.batch_sizes, [1, 3, 1])
+        self.assertEqual(scheduler.stats()['batches'], 3)
+        self.assertEqual(scheduler.stats()['images'], 5)
+
+    def test_multi_image_requests_share_a_batch(self):
+        scheduler = BatchScheduler(max_batch_size=4, max_wait_ms=50)
+        model = GatedModel()
+        scheduler.submit(model, torch.zeros(1, 3, 4, 4))
+        self.assertTrue(model.started.wait(timeout=5))
+
+        # Frames of one file and a single image, then a chunk that no longer fits
+        inputs = [torch.rand(3, 3, 4, 4), torch.rand(1, 3, 4, 4), torch.rand(2, 3, 4, 4)]
+        futures = [scheduler.submit(model, x) for x in inputs]
+        model.gate.set()
+
+        for x, future in zip(inputs, futures):
+            torch.testing.assert_close(future.result(timeout=5), x * 2)
+        self.assertEqual(model.batch_sizes, [1, 4, 2])
+        self.assertEqual(scheduler.stats()['images'], 7)
+
+    def test_translator_generate_is_batched(self):
+        scheduler = BatchScheduler(max_batch_size=4, max_wait_ms=0)
+        with identity_generators(), override_settings(GAN_BATCHING_ENABLED=True, GAN_TILED_INFERENCE=False), \
+                mock.patch('translate.services.get_batch_scheduler', return_value=scheduler):
+            frames = torch.rand(6, 3, 16, 16) * 2 - 1
+            torch.testing.assert_close(GANTranslator('CT').generate(frames, batch_size=4), frames)
+        self.assertEqual(scheduler.stats()['batches'], 2)
+        self.assertEqual(scheduler.stats()['images'], 6)
+
+    def test_partial_batch_is_dispatched_after_max_wait(self):
+        scheduler = BatchScheduler(max_batch_size=8, max_wait_ms=100)
+        model = GatedModel()
+        scheduler.submit(model, torch.zeros(1, 3, 4, 4))
+        self.assertTrue(model.started.wait(timeout=5))
+        futures = [scheduler.submit(model, torch.zeros(1, 3, 4, 4)) for _ in range(2)]
+
+        # The caller's own timeout still applies while the model is busy
+        with self.assertRaises(FutureTimeoutError):
+            futures[0].result(timeout=0.05)
+
+        start = time.monotonic()
+        model.gate.set()
+        for future in futures:
+            future.result(timeout=5)
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        self.assertEqual(model.batch_sizes, [1, 2])
+
+    def test_errors_reach_every_waiter(self):
+        scheduler = BatchScheduler(max_batch_size=8, max_wait_ms=50)
+        model = GatedModel(error=RuntimeError('out of memory'))
+        first = scheduler.submit(model, torch.zeros(1, 3, 4, 4))
+        self.assertTrue(model.started.wait(timeout=5))
+        futures = [scheduler.submit(model, torch.zeros(1, 3, 4, 4)) for _ in range(3)]
+        model.gate.set()
+
+        for future in [first] + futures:
+            with self.assertRaisesMessage(RuntimeError, 'out of memory'):
+                future.result(timeout=5)
+        self.assertEqual(model.batch_sizes, [1, 3])
+        self.assertEqual(scheduler.stats()['batches'], 0)
+
+
+class InferenceExecutorTests(SimpleTestCase):
+    """Bounded pool behind the async translation view."""
+
+    def test_rejects_when_full(self):
+        executor = InferenceExecutor(max_workers=1, max_queue=1)
+        release = threading.Event()
+        running = executor.submit(release.wait)
+        queued = executor.submit(lambda: 'done')
+        with self.assertRaises(ExecutorSaturated) as cm:
+            executor.submit(lambda: None)
+        self.assertGreaterEqual(cm.exception.retry_after, 1)
+
+        release.set()
+        self.assertTrue(running.result(timeout=5))
+        self.assertEqual(queued.result(timeout=5), 'done')
+        self.assertEqual(executor.stats()['pending'], 0)
+        self.assertEqual(executor.stats()['rejected'], 1)
+
+    def test_timeout_keeps_slot_until_finished(self):
+        executor = InferenceExecutor(max_workers=1, max_queue=0)
+        release = threading.Event()
+        with self.assertRaises(TimeoutError):
+            async_to_sync(executor.run)(release.wait, timeout=0.05)
+        # The worker is still busy with the timed-out call
+        with self.assertRaises(ExecutorSaturated):
+            executor.submit(lambda: None)
+        release.set()
+        executor._executor.submit(lambda: None).result(timeout=5)
+        self.assertEqual(executor.stats()['pending'], 0)
+
+
+@mock.patch('translate.views.gan_translate_image', return_value=(b'png bytes', 'translated_mri.png'))
+class AsyncTranslationViewTests(TestCase):
+    """POST /api/translate/gan/ through the async view."""
+
+    url = '/api/translate/gan/'
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            MEDIA_ROOT=self.media_root.name, GAN_UPLOAD_TEMP_DIR=os.path.join(self.media_root.name, '.uploads')
+        )
+        self.settings.enable()
+        self.user = get_user_model().objects.create_user('radiologist', password='secret')
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media_root.cleanup()
+
+    def _post(self, client=None, **extra):
+        data = {
+            'image': SimpleUploadedFile('slice.png', (SAMPLE_DIR / 'ct18.png').read_bytes()),
+            'target_modality': 'MRI',
+        }
+        return (client or self.client).post(self.url, data, **extra)
+
+    def test_translates_with_jwt(self, translate):
+        response = self._post(**self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response.content, b'png bytes')
+        self.assertEqual(translate.call_args.args[1], 'MRI')
+
+    def test_requires_authentication(self, translate):
+        response = self._post()
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response)
+        translate.assert_not_called()
+
+    def test_session_auth_enforces_csrf(self, translate):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        self.assertEqual(self._post(client).status_code, 403)
+        # JWT requests carry no cookie and need no CSRF token
+        self.assertEqual(self._post(Client(enforce_csrf_checks=True), **self.auth).status_code, 200)
+
+    def test_saturated_returns_429(self, translate):
+        executor = InferenceExecutor(max_workers=1, max_queue=0)
+        release = threading.Event()
+        executor.submit(release.wait)
+        self.addCleanup(release.set)
+        with mock.patch('translate.views.get_inference_executor', return_value=executor):
+            response = self._post(**self.auth)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        translate.assert_not_called()
+
+    @override_settings(GAN_ASYNC_TIMEOUT=0.05)
+    def test_timeout_returns_504(self, translate):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        translate.side_effect = lambda *args, **kwargs: release.wait()
+        with mock.patch('translate.views.get_inference_executor', return_value=InferenceExecutor(1, 0)):
+            response = self._post(**self.auth)
+        self.assertEqual(response.status_code, 504)
+
+
+class InferencePoolTests(SimpleTestCase):
+    """Forked workers sharing one copy of the generator weights."""
+
+    def test_matches_in_process_generator(self):
+        from translate.services import load_generator
+
+        torch.manual_seed(0)
+        pool = InferencePool(workers=2, buffer_images=1, modalities=('MRI',)).start()
+        self.addCleanup(pool.close)
+        torch.manual_seed(0)
+        model, _ = load_generator('MRI')
+
+        x = torch.rand(2, 3, 256, 256) * 2 - 1
+        with torch.no_grad():
+            expected = model(x)
+        # Two one-image chunks, each through the shared buffers of a worker
+        torch.testing.assert_close(pool.run('mri', x), expected, atol=1e-5, rtol=0)
+        self.assertEqual(len(set(pool.pids)), 2)
+
+    def test_dead_worker_is_restarted(self):
+        pool = InferencePool(workers=1, buffer_images=1, modalities=('MRI',)).start()
+        self.addCleanup(pool.close)
+        x = torch.rand(1, 3, 256, 256) * 2 - 1
+        expected = pool.run('MRI', x)
+
+        dead = pool.pids[0]
+        os.kill(dead, signal.SIGKILL)
+        # Wait until it is a zombie, i.e. dead but not reaped yet
+        deadline = time.monotonic() + 5
+        while Path(f'/proc/{dead}/stat').read_text().split(')')[1].split()[0] != 'Z':
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        torch.testing.assert_close(pool.run('MRI', x), expected)
+        self.assertNotEqual(pool.pids, [dead])
+        self.assertEqual(pool.restarts, 1)
+
+    @override_settings(GAN_POOL_WORKERS=1, GAN_POOL_BUFFER_IMAGES=1, GAN_POOL_AFFINITY='')
+    def test_pool_is_rebuilt_for_a_new_registry_generation(self):
+        x = torch.rand(1, 3, 256, 256) * 2 - 1
+        with mock.patch('translate.worker_pool._pool', None):
+            first = get_inference_pool()
+            self.assertIs(get_inference_pool(0), first)
+            second = get_inference_pool(1)
+            self.addCleanup(second.close)
+            self.assertIsNot(second, first)
+            self.assertEqual(first.pids, [])
+            with self.assertRaises(RuntimeError):
+                first.run('MRI', x)
+            # Generators cached before the rebuild follow the current pool
+            torch.testing.assert_close(PooledGenerator('MRI')(x), second.run('MRI', x))
+            self.assertIs(get_inference_pool(1), second)
+
+    @override_settings(GAN_POOL_WORKERS=1, GAN_POOL_BUFFER_IMAGES=1, GAN_POOL_AFFINITY='')
+    def test_preloaded_weights_are_shared_across_serving_processes(self):
+        self.addCleanup(worker_pool._preloaded.clear)
+        preload_pool_weights(modalities=('MRI',))
+        model, _, _, buffer = worker_pool._preloaded[('MRI', 'HPB', False, False)]
+        start = torch.frombuffer(buffer, dtype=torch.uint8).data_ptr()
+        x = torch.rand(1, 3, 256, 256) * 2 - 1
+
+        # Two serving processes forked after the preload, like gunicorn
+        # --preload children, each with its own pool and pool worker
+        reports = []
+        for _ in range(2):
+            read_fd, write_fd = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                code = 1
+                try:
+                    os.close(read_fd)
+                    pool = get_inference_pool()
+                    output = pool.run('MRI', x)
+                    report = {
+                        'sum': float(output.double().sum()),
+                        'in_mapping': all(
+                            start <= t.data_ptr() < start + len(buffer) for t in pool._models['MRI'].parameters()
+                        ),
+                        'memory': [mapping_memory(p, start) for p in [os.getpid()] + pool.pids],
+                    }
+                    pool.close()
+                    os.write(write_fd, json.dumps(report).encode())
+                    code = 0
+                finally:
+                    os._exit(code)
+            os.close(write_fd)
+            with os.fdopen(read_fd, 'rb') as f:
+                data = f.read()
+            self.assertEqual(os.waitpid(pid, 0)[1], 0)
+            reports.append(json.loads(data))
+
+        with torch.no_grad():
+            expected = float(model(x).double().sum())
+        weights_kb = len(buffer) // 1024
+        for report in reports:
+            self.assertAlmostEqual(report['sum'], expected, delta=1e-3 * abs(expected) + 1e-2)
+            # No client loaded its own copy...
+            self.assertTrue(report['in_mapping'])
+            for memory in report['memory']:
+                # ...nor wrote to the shared pages
+                self.assertEqual(memory['Private_Dirty'] + memory['Private_Clean'], 0)
+            # The pool worker read every weight, from pages shared with this process
+            worker = report['memory'][1]
+            self.assertGreater(worker['Rss'], weights_kb // 2)
+            self.assertLess(worker['Pss'], worker['Rss'])
+
+    def test_share_weights(self):
+        model = torch.nn.Sequential(torch.nn.Conv2d(3, 4, 3), torch.nn.BatchNorm2d(4)).eval()
+        x = torch.rand(1, 3, 8, 8)
+        expected = model(x)
+        buffer = share_weights(model)
+        torch.testing.assert_close(model(x), expected)
+        start = torch.frombuffer(buffer, dtype=torch.uint8).data_ptr()
+        for tensor in list(model.parameters()) + list(model.buffers()):
+            self.assertTrue(start <= tensor.data_ptr() < start + len(buffer))
+
+    def test_parse_affinity(self):
+        self.assertEqual(parse_affinity('', 2, 1), [None, None])
+        self.assertEqual(parse_affinity('0-1;2,4', 2, 2), [{0, 1}, {2, 4}])
+        self.assertEqual(len(parse_affinity('auto', 3, 1)), 3)
+        with self.assertRaises(ValueError):
+            parse_affinity('0', 2, 1)
+
+
+def mapping_memory(pid, address):
+    """Rss, Pss, Shared_* and Private_* (kB) from /proc/<pid>/smaps for the mapping containing `address`."""
+    fields = None
+    with open(f'/proc/{pid}/smaps') as f:
+        for line in f:
+            name, _, rest = line.partition(' ')
+            if '-' in name and not name.endswith(':'):
+                low, high = (int(part, 16) for part in name.split('-'))
+                fields = {} if low <= address < high else None
+            elif fields is not None and name.endswith(':'):
+                value = rest.split()
+                if value and value[0].isdigit():
+                    fields[name[:-1]] = int(value[0])
+                if name == 'VmFlags:':
+                    return fields
+    return fields
+
+
+class FakeGenaiClient:
+    """
+    Stands in for genai.Client: answers every request with a canned JSON
+    report after `delay` seconds, records the uploaded images and the peak
+    number of requests in flight, and fails the requests listed in `fail_on`.
+    """
+
+    def __init__(self, delay=0.02, fail_on=()):
+        self.delay = delay
+        self.fail_on = set(fail_on)
+        self.images = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.models = SimpleNamespace(generate_content=self._generate)
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=self._generate_async))
+
+    def _generate(self, model, contents):
+        part = contents[1]
+        self.images.append((part.inline_data.mime_type, part.inline_data.data))
+        if len(self.images) in self.fail_on:
+            raise RuntimeError('quota exceeded')
+        report = {'imageType': 'CT', 'observations': ['ok'], 'confidenceScore': 0.9, 'disclaimer': 'test'}
+        return SimpleNamespace(text=f'```json\n{json.dumps(report)}\n```')
+
+    async def _generate_async(self, model, contents):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            return self._generate(model, contents)
+        finally:
+            self.in_flight -= 1
+
+
+class AnalysisPipelineTests(TestCase):
+    """Batched Gemini analyses against FakeGenaiClient."""
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root.name, GEMINI_IMAGE_MAX_SIZE=512)
+        self.settings.enable()
+        self.images = [
+            MedicalImage.objects.create(image=SimpleUploadedFile(f'scan{i}.png', self._png(color=40 * i)))
+            for i in range(5)
+        ]
+
+    @staticmethod
+    def _png(color=80, image=None, format='PNG'):
+        image = image or Image.new('L', (2048, 1536), color=color)
+        buffer = io.BytesIO()
+        image.save(buffer, format=format)
+        return buffer.getvalue()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media_root.cleanup()
+
+    def test_analyze_many_bounded_concurrency(self):
+        client = FakeGenaiClient(delay=0.2)
+        results = MedicalImageAnalyzer(client=client).analyze_many(self.images, concurrency=2)
+
+        self.assertTrue(all(isinstance(result, ImageAnalysis) for result in results))
+        self.assertEqual([result.medical_image_id for result in results], [image.id for image in self.images])
+        self.assertEqual(client.max_in_flight, 2)
+        self.assertEqual(results[0].observations, ['ok'])
+
+    def test_images_downscaled_before_upload(self):
+        client = FakeGenaiClient()
+        MedicalImageAnalyzer(client=client).analyze_image(self.images[0])
+        mime_type, data = client.images[0]
+        self.assertEqual(mime_type, 'image/jpeg')
+        self.assertEqual(Image.open(io.BytesIO(data)).size, (512, 384))
+
+    def test_batch_task_reports_failures(self):
+        client = FakeGenaiClient(fail_on={2})
+        with mock.patch('translate.services.get_genai_client', return_value=client):
+            summary = analyze_images([str(image.id) for image in self.images], concurrency=1)
+
+        self.assertEqual(len(summary), 5)
+        errors = [entry['error'] for entry in summary.values() if 'error' in entry]
+        self.assertEqual(len(errors), 1)
+        self.assertIn('quota exceeded', errors[0])
+        self.assertEqual(ImageAnalysis.objects.count(), 4)
+
+        # Analyzed images are skipped on the next run
+        with mock.patch('translate.services.get_genai_client', return_value=FakeGenaiClient()):
+            self.assertEqual(len(analyze_images([str(image.id) for image in self.images])), 1)
+
+
+class AnalysisDeduplicationTests(TestCase):
+    """Analyses reused for identical or near-identical content."""
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root.name)
+        self.settings.enable()
+        gradient = np.add.outer(np.arange(256), np.arange(256)).astype(np.uint8)
+        self.scan = Image.fromarray(gradient, mode='L')
+        self.client = FakeGenaiClient(delay=0)
+        self.analyzer = MedicalImageAnalyzer(client=self.client)
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media_root.cleanup()
+
+    def _upload(self, format='PNG', **params):
+        buffer = io.BytesIO()
+        self.scan.save(buffer, format=format, **params)
+        return MedicalImage.objects.create(image=SimpleUploadedFile(f'scan.{format.lower()}', buffer.getvalue()))
+
+    def test_identical_upload_reuses_analysis(self):
+        first = self.analyzer.analyze_image(self._upload())
+        second = self.analyzer.analyze_image(self._upload())
+        third = self.analyzer.analyze_image(self._upload())
+
+        self.assertEqual(len(self.client.images), 1)
+        self.assertEqual((second.reused_from, third.reused_from), (first, first))
+        self.assertEqual(second.observations, first.observations)
+        self.assertEqual(first.prompt_version, second.prompt_version)
+
+    def test_model_prompt_and_ttl_invalidate(self):
+        self.analyzer.analyze_image(self._upload())
+
+        self.analyzer.model = 'another-model'
+        self.assertIsNone(self.analyzer.analyze_image(self._upload()).reused_from)
+        with mock.patch('translate.services.ANALYSIS_PROMPT_VERSION', 'edited'):
+            self.assertIsNone(self.analyzer.analyze_image(self._upload()).reused_from)
+        with override_settings(GEMINI_ANALYSIS_CACHE_TTL=0):
+            self.assertIsNone(self.analyzer.analyze_image(self._upload()).reused_from)
+        self.assertEqual(len(self.client.images), 4)
+
+    def test_near_duplicates(self):
+        first = self.analyzer.analyze_image(self._upload('PNG'))
+        # Same scan re-encoded: different bytes, (almost) the same hash
+        with override_settings(GEMINI_ANALYSIS_NEAR_DUPLICATES=True):
+            self.assertEqual(self.analyzer.analyze_image(self._upload('JPEG', quality=90)).reused_from, first)
+        self.assertIsNone(self.analyzer.analyze_image(self._upload('JPEG', quality=70)).reused_from)
+
+    def test_duplicates_in_one_batch(self):
+        images = [self._upload() for _ in range(4)]
+        for image in images:
+            image.sha256 = 'ab' * 32
+            image.save()
+        results = self.analyzer.analyze_many(images, concurrency=4)
+        self.assertEqual(len(self.client.images), 1)
+        self.assertEqual(sum(result.reused_from is not None for result in results), 3)
+
+
+class LossTests(SimpleTestCase):
+    def test_logits_loss_matches_sigmoid_bce(self):
+        logits = torch.randn(2, 1, 6, 6) * 3
+        for real in (True, False):
+            fused = GANLoss(use_lsgan=False, use_logits=True)(logits, real)
+            reference = GANLoss(use_lsgan=False)(torch.sigmoid(logits), real)
+            torch.testing.assert_close(fused, reference)
+
+    def test_targets_are_cached_per_shape(self):
+        criterion = GANLoss()
+        x = torch.zeros(2, 1, 6, 6)
+        self.assertIs(criterion.get_target_tensor(x, True), criterion.get_target_tensor(x.clone(), True))
+        self.assertIsNot(criterion.get_target_tensor(x, True), criterion.get_target_tensor(x, False))
+        self.assertEqual(criterion.get_target_tensor(x[:1], True).shape, (1, 1, 6, 6))
+        criterion.to(torch.float64)
+        self.assertEqual(criterion._targets, {})
+
+    def test_gradient_penalties(self):
+        torch.manual_seed(0)
+        netD = define_D(3, 4, 'basic', norm='instance')
+        real, fake = torch.rand(2, 3, 32, 32), torch.rand(2, 3, 32, 32)
+
+        torch.manual_seed(1)
+        penalty = GradPenalty()(netD, real, fake)
+        torch.manual_seed(1)
+        alpha = torch.rand_like(real)
+        interpolates = (alpha * real + (1 - alpha) * fake).requires_grad_(True)
+        gradients = torch.autograd.grad(netD(interpolates).sum(), interpolates)[0].reshape(2, -1)
+        torch.testing.assert_close(penalty, ((gradients.norm(2, dim=1) - 1) ** 2).mean())
+
+        r1 = GradPenalty(mode='r1')(netD, real)
+        inputs = real.clone().requires_grad_(True)
+        gradients = torch.autograd.grad(netD(inputs).sum(), inputs)[0]
+        torch.testing.assert_close(r1, gradients.pow(2).sum() / 2)
+
+        # Lazy: due every 4th step, scaled by 4; the penalty is differentiable
+        lazy = GradPenalty(mode='r1', interval=4)
+        self.assertEqual([lazy.due(step) for step in range(5)], [True, False, False, False, True])
+        value = lazy(netD, real)
+        torch.testing.assert_close(value, r1 * 4)
+        value.backward()
+        self.assertIsNotNone(next(netD.parameters()).grad)
+
+
+class TrainingFixtureMixin:
+    """Four tiny CT DICOM and four MRI PNG uploads in a temporary MEDIA_ROOT."""
+
+    options = dict(netG='resnet_6blocks', ngf=4, ndf=4, size=32, pool_size=2, niter=1, niter_decay=0)
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root.name)
+        self.settings.enable()
+        self.output_dir = os.path.join(self.media_root.name, 'checkpoints')
+        for i in range(4):
+            pixels = (np.arange(48 * 40) * (i + 1) % 4096).astype(np.uint16)
+            MedicalImage.objects.create(
+                image=SimpleUploadedFile(f'ct{i}.dcm', dicom_bytes(48, 40, pixels=pixels)), modality='CT', image_type='DICOM'
+            )
+            buffer = io.BytesIO()
+            Image.new('L', (40, 40), color=50 * i).save(buffer, format='PNG')
+            MedicalImage.objects.create(
+                image=SimpleUploadedFile(f'mr{i}.png', buffer.getvalue()), modality='MRI', image_type='IMAGE'
+            )
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media_root.cleanup()
+
+
+class TrainGANTests(TrainingFixtureMixin, TestCase):
+    """manage.py train_gan on a handful of tiny CT DICOM and MRI PNG uploads."""
+
+    def test_dataset_decodes_dicom_and_png(self):
+        sources = [('file', image.image.path) for image in MedicalImage.objects.order_by('modality')[:8:4]]
+        items = [SliceDataset(sources, size=32, flip=False)[i] for i in range(2)]
+        for item in items:
+            self.assertEqual(item.shape, (3, 32, 32))
+            self.assertTrue(item.min() >= -1 and item.max() <= 1)
+
+    def test_train_and_resume(self):
+        out = io.StringIO()
+        call_command(
+            'train_gan', batch_size=2, accumulate=2, workers=2, amp=True, log_every=1,
+            output_dir=self.output_dir, stdout=out, **self.options
+        )
+        self.assertIn('img/s', out.getvalue())
+        self.assertIn('data wait', out.getvalue())
+
+        # The generators load the way GANTranslator loads them
+        for name in ('G_A', 'G_B'):
+            path = os.path.join(self.output_dir, generator_filename(name, 'resnet_6blocks'))
+            net = load_G(path, 3, 3, 4, 'resnet_6blocks', norm='instance')
+            self.assertEqual(net(torch.zeros(1, 3, 32, 32)).shape, (1, 3, 32, 32))
+
+        trainer = CycleGANTrainer(netG='resnet_6blocks', ngf=4, ndf=4, pool_size=2, accumulate=2)
+        trainer.load_checkpoint(self.output_dir)
+        # 4 pairs / batch 2 = 2 batches, one optimizer step with accumulate=2
+        self.assertEqual((trainer.epoch, trainer.step), (1, 1))
+
+        out = io.StringIO()
+        call_command(
+            'train_gan', batch_size=2, workers=0, resume=True, output_dir=self.output_dir, stdout=out,
+            **dict(self.options, niter_decay=1)
+        )
+        self.assertIn('Resuming at epoch 2', out.getvalue())
+
+    def test_distributed_training(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        out = io.StringIO()
+        call_command(
+            'train_gan', batch_size=1, workers=0, nproc_per_node=2, master_port=port, threads=1,
+            output_dir=self.output_dir, stdout=out, **self.options
+        )
+        self.assertIn('2 processes', out.getvalue())
+
+        trainer = CycleGANTrainer(netG='resnet_6blocks', ngf=4, ndf=4, pool_size=2)
+        trainer.load_checkpoint(self.output_dir)
+        # The DistributedSampler splits the 4 pairs: 2 steps per process, not 4
+        self.assertEqual((trainer.epoch, trainer.step), (1, 2))
+        # Rank 0 saved unwrapped networks, without DDP's `module.` prefix
+        state = torch.load(os.path.join(self.output_dir, generator_filename('G_A', 'resnet_6blocks')))
+        self.assertFalse(any(key.startswith('module.') for key in state))
+        load_G(state, 3, 3, 4, 'resnet_6blocks', norm='instance')
+
+    def test_vanilla_gan_with_lazy_r1(self):
+        trainer = CycleGANTrainer(
+            netG='resnet_6blocks', ngf=4, ndf=4, pool_size=2, gan_mode='vanilla', r1_gamma=10.0, reg_every=2
+        )
+        batch = torch.rand(1, 3, 32, 32) * 2 - 1
+        with mock.patch.object(trainer.criterionR1, 'forward', wraps=trainer.criterionR1.forward) as penalty:
+            for _ in range(3):
+                losses = trainer.train_step(batch, batch)
+        # Micro steps 0 and 2, once per discriminator
+        self.assertEqual(penalty.call_count, 4)
+        self.assertTrue(all(np.isfinite(value) for value in losses.values()))
+
+
+class ShardStoreTests(TrainingFixtureMixin, TestCase):
+    """manage.py build_shards and readers of the preprocessed shard store."""
+
+    def setUp(self):
+        super().setUp()
+        self.shard_dir = os.path.join(self.media_root.name, 'shards')
+        self.shard_settings = override_settings(GAN_SHARD_DIR=self.shard_dir, GAN_SHARD_IMAGE_SIZE=32, GAN_SHARD_CAPACITY=3)
+        self.shard_settings.enable()
+
+    def tearDown(self):
+        self.shard_settings.disable()
+        super().tearDown()
+
+    def build(self, **options):
+        out = io.StringIO()
+        call_command('build_shards', workers=2, stdout=out, stderr=io.StringIO(), **options)
+        return out.getvalue()
+
+    def test_build_and_random_access(self):
+        self.assertIn('8 images added', self.build())
+        store = ShardStore(self.shard_dir)
+        # 8 images in shards of 3
+        self.assertEqual((len(store), len(store.index['shards'])), (8, 3))
+        self.assertEqual(len(store.ids('CT')), 4)
+
+        for image in MedicalImage.objects.all():
+            stored = store.get(image.id)
+            self.assertEqual((stored.shape, stored.dtype), ((32, 32), np.float16))
+            expected = load_slice(('file', image.image.path), size=32)[0].numpy()
+            np.testing.assert_allclose(stored.astype(np.float32), expected, atol=1e-3)
+            # A view of the shard's memmap, not a copy
+            self.assertIsInstance(stored.base, np.memmap)
+
+    def test_incremental_build(self):
+        self.build()
+        buffer = io.BytesIO()
+        Image.new('L', (40, 40), color=255).save(buffer, format='PNG')
+        new = MedicalImage.objects.create(
+            image=SimpleUploadedFile('mr_new.png', buffer.getvalue()), modality='MRI', image_type='IMAGE'
+        )
+        before = ShardStore(self.shard_dir).index['images']
+
+        self.assertIn('1 images added', self.build())
+        store = ShardStore(self.shard_dir)
+        self.assertEqual(len(store), 9)
+        self.assertEqual({k: v for k, v in store.index['images'].items() if k != str(new.id)}, before)
+        self.assertTrue((store.get(new.id) == 1).all())
+
+        self.assertIn('0 images added', self.build())
+        self.assertIn('9 images added', self.build(rebuild=True))
+
+    def test_duplicates_share_a_row(self):
+        first, second = MedicalImage.objects.filter(modality='CT')[:2]
+        MedicalImage.objects.filter(id__in=[first.id, second.id]).update(sha256='a' * 64)
+        self.assertIn('7 images added, 1 duplicates', self.build())
+        store = ShardStore(self.shard_dir)
+        self.assertEqual(store.index['images'][str(first.id)]['row'], store.index['images'][str(second.id)]['row'])
+
+    def test_size_mismatch(self):
+        self.build()
+        with override_settings(GAN_SHARD_IMAGE_SIZE=64):
+            with self.assertRaises(CommandError):
+                self.build()
+
+    def test_batch_inference(self):
+        self.build()
+        store = ShardStore(self.shard_dir)
+        ids = store.ids('CT')
+        batches = list(store.batches(ids, batch_size=3))
+        self.assertEqual([len(chunk) for chunk, _ in batches], [3, 1])
+        self.assertEqual(batches[0][1].shape, (3, 3, 32, 32))
+        torch.testing.assert_close(batches[0][1][1], store.tensor(ids[1]))
+
+        with mock.patch('translate.services.GANTranslator') as translator:
+            translator.return_value.translate_tensor.side_effect = lambda batch, batch_size: [None] * len(batch)
+            translated = list(translate_stored_images(ids, 'MRI', batch_size=3))
+        self.assertEqual([chunk for chunk, _ in translated], [chunk for chunk, _ in batches])
+
+    def test_translate_stored_command(self):
+        self.build()
+        store = ShardStore(self.shard_dir)
+        outside = MedicalImage.objects.create(
+            image=SimpleUploadedFile('ct_new.png', b'not in the store'), modality='CT', image_type='IMAGE'
+        )
+
+        out = io.StringIO()
+        with identity_generators():
+            call_command('translate_stored', stdout=out, stderr=io.StringIO())
+        self.assertIn('8 images translated, 0 failed, 1 not in the shard store', out.getvalue())
+
+        for image in MedicalImage.objects.exclude(pk=outside.pk):
+            self.assertEqual(image.translation_status, 'COMPLETED')
+            target = 'ct' if image.modality == 'MRI' else 'mri'
+            self.assertIn(f'translated_{target}', image.translated_image.name)
+            with Image.open(image.translated_image.path) as translated:
+                self.assertEqual(translated.size, (32, 32))
+                # Identity generators: the output is the stored slice
+                expected = (store.get(image.id).astype(np.float32) + 1) * 127.5
+                np.testing.assert_allclose(np.asarray(translated.convert('L'), dtype=np.float32), expected, atol=1.5)
+        self.assertEqual(MedicalImage.objects.get(pk=outside.pk).translation_status, 'PENDING')
+
+        out = io.StringIO()
+        call_command('translate_stored', stdout=out)
+        self.assertIn('0 images translated', out.getvalue())
+
+    def test_dataset_and_training(self):
+        self.build()
+        dataset = ShardDataset(self.shard_dir, ShardStore(self.shard_dir).ids('MRI'), flip=False)
+        self.assertEqual(dataset[0].shape, (3, 32, 32))
+
+        out = io.StringIO()
+        call_command(
+            'train_gan', shards=True, batch_size=2, workers=2, output_dir=self.output_dir, stdout=out, **self.options
+        )
+        self.assertIn('4 CT / 4 MRI images', out.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, generator_filename('G_A', 'resnet_6blocks'))))
+
+
+class MedicalImageListTests(TestCase):
+    """GET /api/translations/: scoping, filters, cursor pages and a constant query count."""
+
+    url = '/api/translations/'
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root.name)
+        self.settings.enable()
+        User = get_user_model()
+        self.alice = User.objects.create_user('alice', password='secret')
+        self.bob = User.objects.create_user('bob', password='secret')
+        self.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.day = datetime.datetime(2026, 3, 1, 12, tzinfo=datetime.timezone.utc)
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media_root.cleanup()
+
+    def create(self, user, days=0, modality='CT', translation_status='COMPLETED', analysis=True, dicom=True):
+        image = MedicalImage.objects.create(
+            user=user, image=SimpleUploadedFile('scan.dcm', b'x'), image_type='DICOM',
+            modality=modality, translation_status=translation_status,
+        )
+        MedicalImage.objects.filter(pk=image.pk).update(uploaded_at=self.day + datetime.timedelta(days=days))
+        if analysis:
+            ImageAnalysis.objects.create(medical_image=image, image_type_detected='CT', raw_analysis='{}', disclaimer='')
+        if dicom:
+            DICOMData.objects.create(medical_image=image, patient_id='P1', modality='CT')
+        return image
+
+    def ids(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()['results']]
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for i in range(3):
+            self.create(self.alice, days=i)
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(len(self.ids()), 3)
+        for i in range(3, 12):
+            self.create(self.alice, days=i, analysis=i % 2 == 0, dicom=i % 3 == 0)
+        with self.assertNumQueries(len(few)):
+            rows = self.client.get(self.url).json()['results']
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(len(few), 1)
+        self.assertEqual(rows[-1]['dicom_data']['patient_id'], 'P1')
+        self.assertIsNone(rows[0]['analysis'])
+
+    def test_scoped_to_the_uploader(self):
+        mine = self.create(self.alice)
+        theirs = self.create(self.bob, days=1)
+        self.assertEqual(self.ids(), [str(mine.id)])
+        # Detail routes and actions are scoped too
+        self.assertEqual(self.client.get(f'{self.url}{theirs.id}/').status_code, 404)
+        self.assertEqual(self.client.delete(f'{self.url}{theirs.id}/').status_code, 404)
+        self.assertEqual(self.client.post(f'{self.url}{theirs.id}/analyze/').status_code, 404)
+        self.assertEqual(self.client.get(f'{self.url}{mine.id}/').status_code, 200)
+        with mock.patch('translate.views.analyze_images.delay', return_value=SimpleNamespace(id='task')) as task:
+            response = self.client.post(f'{self.url}analyze_batch/', {'ids': [mine.id, theirs.id]})
+        self.assertEqual(response.json()['queued'], [str(mine.id)])
+        task.assert_called_once_with([str(mine.id)])
+
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.ids(), [str(theirs.id), str(mine.id)])
+        self.assertEqual(self.client.get(f'{self.url}{theirs.id}/').status_code, 200)
+        self.assertEqual(self.ids(user=self.bob.id), [str(theirs.id)])
+        self.assertEqual(self.client.get(self.url, {'user': 'bob'}).status_code, 400)
+
+    def test_filters(self):
+        ct = self.create(self.alice, days=0)
+        mri = self.create(self.alice, days=1, modality='MRI', translation_status='PENDING')
+        failed = self.create(self.alice, days=2, translation_status='FAILED: out of memory')
+
+        self.assertEqual(self.ids(modality='mri'), [str(mri.id)])
+        self.assertEqual(self.ids(status='failed'), [str(failed.id)])
+        self.assertEqual(self.ids(status='COMPLETED'), [str(ct.id)])
+        self.assertEqual(self.ids(uploaded_after='2026-03-02'), [str(failed.id), str(mri.id)])
+        # A date upper bound includes that whole day
+        self.assertEqual(self.ids(uploaded_before='2026-03-02'), [str(mri.id), str(ct.id)])
+        self.assertEqual(
+            self.ids(uploaded_after='2026-03-02T00:00:00Z', uploaded_before='2026-03-02T23:00:00Z'), [str(mri.id)]
+        )
+        self.assertEqual(self.client.get(self.url, {'uploaded_after': 'last week'}).status_code, 400)
+
+    def test_cursor_pages(self):
+        images = [self.create(self.alice, days=i) for i in range(5)]
+        seen = []
+        url = f'{self.url}?page_size=2'
+        while url:
+            page = self.client.get(url).json()
+            self.assertNotIn('count', page)
+            seen += [row['id'] for row in page['results']]
+            url = page['next']
+        self.assertEqual(seen, [str(image.id) for image in reversed(images)])
+
+    @mock.patch('translate.views.process_dicom_for_translation')
+    def test_upload_records_the_user(self, task):
+        response = self.client.post(
+            self.url, {'image': SimpleUploadedFile('slice.png', (SAMPLE_DIR / 'ct18.png').read_bytes())},
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(MedicalImage.objects.get(pk=response.json()['id']).user, self.alice)
+        task.delay.assert_called_once()
+
+    @mock.patch('translate.views.process_dicom_for_translation')
+    def test_upload_output_format(self, task):
+        def upload(output_format):
+            return self.client.post(self.url, {
+                'image': SimpleUploadedFile('slice.png', (SAMPLE_DIR / 'ct18.png').read_bytes()),
+                'output_format': output_format,
+            }, format='multipart')
+
+        response = upload('jpeg')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('output_format', response.json())
+        # Nothing saved that no task would pick up
+        self.assertFalse(MedicalImage.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root.name, 'medical_images')))
+        task.delay.assert_not_called()
+
+        response = upload('DICOM')
+        self.assertEqual(response.status_code, 202)
+        task.delay.assert_called_once_with(mock.ANY, 'dicom')
+        self.assertNotIn('output_format', self.client.get(f"{self.url}{response.json()['id']}/").json())
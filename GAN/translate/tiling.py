@@ -0,0 +1,82 @@
+import torch
+import torch.nn.functional as F
+
+
+def tile_starts(length, tile_size, overlap):
+    """
+    Start offsets of tiles covering [0, length) with at least `overlap`
+    pixels shared between neighbours. The last tile is aligned to the end.
+    """
+    if length <= tile_size:
+        return [0]
+    stride = tile_size - overlap
+    starts = list(range(0, length - tile_size, stride))
+    starts.append(length - tile_size)
+    return starts
+
+
+def feather_window(tile_size, overlap, device=None, dtype=torch.float32):
+    """
+    (tile_size, tile_size) blending weights: 1 in the middle, ramping down
+    linearly over `overlap` pixels towards each edge. Weights never reach
+    zero, so pixels covered by a single tile keep their value after
+    normalization.
+    """
+    ramp = torch.ones(tile_size, device=device, dtype=dtype)
+    if overlap > 0:
+        edge = torch.arange(1, overlap + 1, device=device, dtype=dtype) / (overlap + 1)
+        ramp[:overlap] = edge
+        ramp[-overlap:] = torch.minimum(ramp[-overlap:], edge.flip(0))
+    return ramp[:, None] * ramp[None, :]
+
+
+def tiled_forward(model_fn, batch, tile_size=256, overlap=32, tile_batch_size=4):
+    """
+    Run `model_fn` over overlapping tile_size x tile_size tiles of a
+    (N, C, H, W) batch and blend the outputs with a feathered window.
+
+    Only `tile_batch_size` tiles are in flight at a time, so peak memory is
+    the full-resolution input and output plus one tile batch, whatever the
+    image size. Inputs smaller than a tile are padded.
+    """
+    if overlap >= tile_size:
+        raise ValueError('tile overlap must be smaller than the tile size')
+
+    n, _, height, width = batch.shape
+    pad_h = max(0, tile_size - height)
+    pad_w = max(0, tile_size - width)
+    if pad_h or pad_w:
+        mode = 'reflect' if pad_h < height and pad_w < width else 'replicate'
+        batch = F.pad(batch, (0, pad_w, 0, pad_h), mode=mode)
+    padded_h, padded_w = batch.shape[-2:]
+
+    window = feather_window(tile_size, overlap, device=batch.device, dtype=batch.dtype)
+    coords = [
+        (y, x)
+        for y in tile_starts(padded_h, tile_size, overlap)
+        for x in tile_starts(padded_w, tile_size, overlap)
+    ]
+
+    weight = torch.zeros(padded_h, padded_w, device=batch.device, dtype=batch.dtype)
+    for y, x in coords:
+        weight[y:y + tile_size, x:x + tile_size] += window
+
+    output = None
+    for i in range(n):
+        for start in range(0, len(coords), tile_batch_size):
+            chunk = coords[start:start + tile_batch_size]
+            tiles = torch.stack([
+                batch[i, :, y:y + tile_size, x:x + tile_size] for y, x in chunk
+            ])
+            results = model_fn(tiles)
+
+            if output is None:
+                output = torch.zeros(
+                    n, results.shape[1], padded_h, padded_w,
+                    device=batch.device, dtype=results.dtype
+                )
+            for (y, x), result in zip(chunk, results):
+                output[i, :, y:y + tile_size, x:x + tile_size] += result * window
+
+    output /= weight
+    return output[..., :height, :width]
@@ -0,0 +1,451 @@
+import contextlib
+import itertools
+import os
+import random
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.nn as nn
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+from torch.utils.data.distributed import DistributedSampler
+
+from models.networks import GANLoss, GradPenalty, define_D, define_G, distribute_net, get_scheduler, unwrap_net
+
+from .dicom import dicom_to_tensor, is_dicom, pixels_to_tensor, read_dicom
+
+
+def load_slice(source, size=256):
+    """
+    Decode one ('file', path) or ('volume', path, index) source to a
+    (3, size, size) tensor in [-1, 1]: DICOM through the modality LUT and
+    VOI window, PNG/JPEG as 8-bit gray, resized with bicubic interpolation.
+    """
+    if source[0] == 'volume':
+        from .volume import open_volume
+        return open_volume(source[1]).to_tensor(source[2], size=size)[0]
+    path = source[1]
+    if is_dicom(path):
+        return dicom_to_tensor(read_dicom(path), size=size)[0]
+    with Image.open(path) as image:
+        pixels = np.asarray(image.convert('L'), dtype=np.float32)
+    pixels = pixels / 127.5 - 1.0
+    return pixels_to_tensor(pixels[np.newaxis], size=size)[0]
+
+
+class SliceDataset(Dataset):
+    """
+    Training slices of one modality, decoded on the fly in the loader
+    workers. `sources` are ('file', path) entries for DICOM or PNG/JPEG
+    files and ('volume', path, index) entries for slices of a series volume
+    (translate.volume). Items are (3, size, size) tensors in [-1, 1].
+    """
+
+    def __init__(self, sources, size=256, flip=True):
+        self.sources = list(sources)
+        self.size = size
+        self.flip = flip
+        self._volumes = {}
+
+    def __len__(self):
+        return len(self.sources)
+
+    def _volume(self, path):
+        # One memmap per loader worker, opened on first use after the fork
+        from .volume import Volume
+
+        volume = self._volumes.get(path)
+        if volume is None:
+            volume = self._volumes[path] = Volume(path)
+        return volume
+
+    def __getitem__(self, index):
+        source = self.sources[index]
+        if source[0] == 'volume':
+            tensor = self._volume(source[1]).to_tensor(source[2], size=self.size)[0]
+        else:
+            tensor = load_slice(source, size=self.size)
+        if self.flip and random.random() < 0.5:
+            tensor = tensor.flip(-1)
+        return tensor.contiguous()
+
+
+class UnpairedDataset(Dataset):
+    """
+    (A, B) pairs for CycleGAN: A walks its dataset in order and B is drawn
+    at random, so the two domains need not be aligned or the same size.
+    """
+
+    def __init__(self, dataset_a, dataset_b):
+        self.dataset_a = dataset_a
+        self.dataset_b = dataset_b
+
+    def __len__(self):
+        return max(len(self.dataset_a), len(self.dataset_b))
+
+    def __getitem__(self, index):
+        return (
+            self.dataset_a[index % len(self.dataset_a)],
+            self.dataset_b[random.randrange(len(self.dataset_b))],
+        )
+
+
+def _seed_worker(worker_id):
+    # Loader workers fork with the parent's random state; give each its own
+    seed = torch.initial_seed() % 2 ** 32
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def make_loader(dataset, batch_size=1, num_workers=4, prefetch_factor=2, pin_memory=False, shuffle=True, sampler=None):
+    """
+    Multi-worker DataLoader for UnpairedDataset. Workers decode and collate
+    whole batches straight into shared memory; with `pin_memory` (CUDA)
+    batches are also page-locked for asynchronous host-to-device copies.
+    Incomplete last batches are dropped so every batch fits the trainer's
+    preallocated buffers.
+    """
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=shuffle and sampler is None,
+        sampler=sampler,
+        num_workers=num_workers,
+        prefetch_factor=prefetch_factor if num_workers else None,
+        persistent_workers=num_workers > 0,
+        pin_memory=pin_memory,
+        drop_last=True,
+        worker_init_fn=_seed_worker,
+    )
+
+
+class ImagePool:
+    """History of generated images the discriminators also train on (CycleGAN's image buffer)."""
+
+    def __init__(self, pool_size=50):
+        self.pool_size = pool_size
+        self.images = []
+
+    def query(self, images):
+        if self.pool_size == 0:
+            return images
+        out = []
+        for image in images.detach():
+            image = image.unsqueeze(0)
+            if len(self.images) < self.pool_size:
+                self.images.append(image.clone())
+                out.append(image)
+            elif random.random() > 0.5:
+                index = random.randrange(self.pool_size)
+                out.append(self.images[index].clone())
+                self.images[index] = image.clone()
+            else:
+                out.append(image)
+        return torch.cat(out)
+
+
+def generator_filename(name, netG='HPB', label='latest'):
+    """
+    Checkpoint file of generator `name` (G_A: CT -> MRI, G_B: MRI -> CT):
+    {label}_net_G_A.pth for HPB, {label}_net_G_A.<netG>.pth for other
+    architectures, so checkpoints of different generators never collide.
+    """
+    suffix = '' if netG == 'HPB' else f'.{netG}'
+    return f'{label}_net_{name}{suffix}.pth'
+
+
+def save_state_dict(state_dict, path):
+    """torch.save through a temporary file, so a reloading server never reads a partial checkpoint."""
+    tmp_path = path + '.tmp'
+    torch.save(state_dict, tmp_path)
+    os.replace(tmp_path, path)
+
+
+class CycleGANTrainer:
+    """
+    CT <-> MRI CycleGAN: G_A translates A (CT) to B (MRI) and G_B back, with
+    the discriminators D_A on B and D_B on A, least-squares GAN losses
+    (gan_mode='vanilla': BCE on the raw discriminator logits),
+    cycle-consistency and identity terms. The generators are saved as
+    latest_net_G_A.pth / latest_net_G_B.pth (see generator_filename), the
+    files GANTranslator loads for target MRI and CT.
+
+    `amp` runs forward passes under bfloat16 autocast on the CPU (float16
+    with a GradScaler on CUDA); `accumulate` sums the gradients of that
+    many batches before each optimizer step. With `r1_gamma` > 0 the
+    discriminators get an R1 gradient penalty, computed lazily on every
+    `reg_every`-th batch only.
+
+    In a torch.distributed process group (translate.distributed) the four
+    networks are wrapped in DistributedDataParallel: every process trains on
+    its shard of the data, gradients are all-reduced in `bucket_cap_mb`
+    buckets during backward (skipped on accumulation batches), and only
+    rank 0 logs and writes checkpoints.
+    """
+
+    def __init__(self, netG='HPB', ngf=64, netD='basic', ndf=64, n_layers_D=3, norm='instance',
+                 lr=2e-4, beta1=0.5, lambda_cycle=10.0, lambda_identity=0.5, pool_size=50,
+                 amp=False, accumulate=1, device='cpu', lr_policy='lambda', niter=100, niter_decay=100,
+                 lr_decay_iters=50, gan_mode='lsgan', r1_gamma=0.0, reg_every=16, bucket_cap_mb=25,
+                 find_unused_parameters=False):
+        self.device = torch.device(device)
+        self.netG = netG
+        self.ngf = ngf
+        self.norm = norm
+        self.lambda_cycle = lambda_cycle
+        self.lambda_identity = lambda_identity
+        self.amp = amp
+        self.accumulate = max(1, accumulate)
+
+        self.netG_A = define_G(3, 3, ngf, netG, norm=norm).to(self.device)
+        self.netG_B = define_G(3, 3, ngf, netG, norm=norm).to(self.device)
+        self.netD_A = define_D(3, ndf, netD, n_layers_D=n_layers_D, norm=norm).to(self.device)
+        self.netD_B = define_D(3, ndf, netD, n_layers_D=n_layers_D, norm=norm).to(self.device)
+        self.distributed = dist.is_available() and dist.is_initialized()
+        self.rank = dist.get_rank() if self.distributed else 0
+        self.world_size = dist.get_world_size() if self.distributed else 1
+        for name in ('netG_A', 'netG_B', 'netD_A', 'netD_B'):
+            # DDP broadcasts rank 0's initial weights to the other processes
+            setattr(self, name, distribute_net(
+                getattr(self, name), bucket_cap_mb=bucket_cap_mb, find_unused_parameters=find_unused_parameters
+            ))
+
+        if gan_mode not in ('lsgan', 'vanilla'):
+            raise ValueError(f'Unknown gan_mode {gan_mode!r}.')
+        self.criterionGAN = GANLoss(use_lsgan=gan_mode == 'lsgan', use_logits=True).to(self.device)
+        self.r1_gamma = r1_gamma
+        self.criterionR1 = GradPenalty(mode='r1', interval=reg_every)
+        self.criterionCycle = nn.L1Loss()
+        self.criterionIdt = nn.L1Loss()
+        self.fake_A_pool = ImagePool(pool_size)
+        self.fake_B_pool = ImagePool(pool_size)
+
+        self.optimizer_G = torch.optim.Adam(
+            itertools.chain(self.netG_A.parameters(), self.netG_B.parameters()), lr=lr, betas=(beta1, 0.999)
+        )
+        self.optimizer_D = torch.optim.Adam(
+            itertools.chain(self.netD_A.parameters(), self.netD_B.parameters()), lr=lr, betas=(beta1, 0.999)
+        )
+        opt = SimpleNamespace(
+            lr_policy=lr_policy, epoch_count=1, niter=niter, niter_decay=niter_decay, lr_decay_iters=lr_decay_iters
+        )
+        self.schedulers = [get_scheduler(self.optimizer_G, opt), get_scheduler(self.optimizer_D, opt)]
+        self.scaler = torch.amp.GradScaler('cuda', enabled=amp and self.device.type == 'cuda')
+
+        self.epoch = 0
+        self.step = 0
+        self._micro_step = 0
+
+    @property
+    def networks(self):
+        return {'G_A': self.netG_A, 'G_B': self.netG_B, 'D_A': self.netD_A, 'D_B': self.netD_B}
+
+    def _autocast(self):
+        dtype = torch.float16 if self.device.type == 'cuda' else torch.bfloat16
+        return torch.autocast(self.device.type, dtype=dtype, enabled=self.amp)
+
+    def _backward(self, loss):
+        self.scaler.scale(loss / self.accumulate).backward()
+
+    def _discriminator_loss(self, netD, real, fake):
+        with self._autocast():
+            loss_real = self.criterionGAN(netD(real).float(), True)
+            loss_fake = self.criterionGAN(netD(fake.detach()).float(), False)
+        loss = (loss_real + loss_fake) * 0.5
+        if self.r1_gamma > 0 and self.criterionR1.due(self._micro_step):
+            # Double backward in float32, outside autocast
+            loss = loss + self.criterionR1(unwrap_net(netD), real) * (self.r1_gamma * 0.5)
+        return loss
+
+    def train_step(self, real_A, real_B):
+        """
+        One batch: generator then discriminator losses and gradients. The
+        optimizers step every `accumulate` batches. Returns the losses.
+        """
+        stepping = (self._micro_step + 1) % self.accumulate == 0
+        with contextlib.ExitStack() as stack:
+            if self.distributed and not stepping:
+                # Accumulation batch: keep the gradients local until the
+                # batch the optimizers step on
+                for net in self.networks.values():
+                    stack.enter_context(net.no_sync())
+            losses = self._forward_backward(real_A, real_B)
+
+        self._micro_step += 1
+        if stepping:
+            for optimizer in (self.optimizer_G, self.optimizer_D):
+                self.scaler.step(optimizer)
+                optimizer.zero_grad(set_to_none=True)
+            self.scaler.update()
+            self.step += 1
+        return losses
+
+    def _forward_backward(self, real_A, real_B):
+        for net in (self.netD_A, self.netD_B):
+            net.requires_grad_(False)
+
+        with self._autocast():
+            fake_B = self.netG_A(real_A)
+            rec_A = self.netG_B(fake_B)
+            fake_A = self.netG_B(real_B)
+            rec_B = self.netG_A(fake_A)
+
+            # The discriminators are frozen here: no DDP wrapper, which
+            # would wait for gradients this backward does not produce
+            loss_G_A = self.criterionGAN(unwrap_net(self.netD_A)(fake_B).float(), True)
+            loss_G_B = self.criterionGAN(unwrap_net(self.netD_B)(fake_A).float(), True)
+            loss_cycle_A = self.criterionCycle(rec_A.float(), real_A) * self.lambda_cycle
+            loss_cycle_B = self.criterionCycle(rec_B.float(), real_B) * self.lambda_cycle
+            loss_G = loss_G_A + loss_G_B + loss_cycle_A + loss_cycle_B
+
+            if self.lambda_identity > 0:
+                idt_A = self.netG_A(real_B)
+                idt_B = self.netG_B(real_A)
+                loss_idt_A = self.criterionIdt(idt_A.float(), real_B) * self.lambda_cycle * self.lambda_identity
+                loss_idt_B = self.criterionIdt(idt_B.float(), real_A) * self.lambda_cycle * self.lambda_identity
+                loss_G = loss_G + loss_idt_A + loss_idt_B
+        self._backward(loss_G)
+
+        for net in (self.netD_A, self.netD_B):
+            net.requires_grad_(True)
+        loss_D_A = self._discriminator_loss(self.netD_A, real_B, self.fake_B_pool.query(fake_B.float()))
+        loss_D_B = self._discriminator_loss(self.netD_B, real_A, self.fake_A_pool.query(fake_A.float()))
+        self._backward(loss_D_A + loss_D_B)
+
+        return {
+            'G': loss_G.item(), 'cycle': (loss_cycle_A + loss_cycle_B).item(),
+            'D_A': loss_D_A.item(), 'D_B': loss_D_B.item(),
+        }
+
+    def save_generators(self, directory, label='latest'):
+        """The G_A and G_B files named by generator_filename: plain state dicts, as load_G reads them."""
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for name in ('G_A', 'G_B'):
+            path = os.path.join(directory, generator_filename(name, self.netG, label))
+            save_state_dict(unwrap_net(self.networks[name]).state_dict(), path)
+            paths.append(path)
+        return paths
+
+    def state_dict(self):
+        return {
+            'networks': {name: unwrap_net(net).state_dict() for name, net in self.networks.items()},
+            'optimizer_G': self.optimizer_G.state_dict(),
+            'optimizer_D': self.optimizer_D.state_dict(),
+            'schedulers': [scheduler.state_dict() for scheduler in self.schedulers],
+            'scaler': self.scaler.state_dict(),
+            'epoch': self.epoch,
+            'step': self.step,
+        }
+
+    def load_state_dict(self, state):
+        for name, net in self.networks.items():
+            unwrap_net(net).load_state_dict(state['networks'][name])
+        self.optimizer_G.load_state_dict(state['optimizer_G'])
+        self.optimizer_D.load_state_dict(state['optimizer_D'])
+        for scheduler, scheduler_state in zip(self.schedulers, state['schedulers']):
+            scheduler.load_state_dict(scheduler_state)
+        self.scaler.load_state_dict(state['scaler'])
+        self.epoch = state['epoch']
+        self.step = state['step']
+
+    def save_checkpoint(self, directory):
+        """Generators for serving plus the full training state for --resume."""
+        self.save_generators(directory)
+        path = os.path.join(directory, 'latest_train_state.pth')
+        save_state_dict(self.state_dict(), path)
+        return path
+
+    def load_checkpoint(self, directory):
+        path = os.path.join(directory, 'latest_train_state.pth')
+        self.load_state_dict(torch.load(path, map_location=self.device, weights_only=False))
+
+    def fit(self, loader, epochs, checkpoint_dir, save_every=1, log_every=50, log=print):
+        """
+        Train until `epochs` total epochs, continuing from self.epoch.
+        Logs throughput every `log_every` batches: images/s, and how the
+        time splits between waiting for the loader and computing. Saves a
+        checkpoint every `save_every` epochs and at the end. In a process
+        group, images/s counts all processes and only rank 0 logs and saves.
+        """
+        for net in self.networks.values():
+            net.train()
+        buffers = None
+        main = self.rank == 0
+
+        while self.epoch < epochs:
+            sampler = getattr(loader, 'sampler', None)
+            if hasattr(sampler, 'set_epoch'):
+                sampler.set_epoch(self.epoch)
+
+            images = batches = 0
+            data_seconds = compute_seconds = 0.0
+            window_start = time.perf_counter()
+            ready = time.perf_counter()
+            for real_A, real_B in loader:
+                fetched = time.perf_counter()
+                data_seconds += fetched - ready
+
+                if self.device.type != 'cpu':
+                    # Preallocated device buffers, filled by async copies
+                    # from the pinned loader batches
+                    if buffers is None:
+                        buffers = (torch.empty_like(real_A, device=self.device),
+                                   torch.empty_like(real_B, device=self.device))
+                    real_A = buffers[0].copy_(real_A, non_blocking=True)
+                    real_B = buffers[1].copy_(real_B, non_blocking=True)
+
+                losses = self.train_step(real_A, real_B)
+                ready = time.perf_counter()
+                compute_seconds += ready - fetched
+                images += real_A.shape[0] * self.world_size
+                batches += 1
+
+                if main and log_every and batches % log_every == 0:
+                    elapsed = ready - window_start
+                    log(
+                        f"epoch {self.epoch + 1} batch {batches}: {images / elapsed:.2f} img/s, "
+                        f"data wait {data_seconds:.1f}s, compute {compute_seconds:.1f}s "
+                        f"({100 * data_seconds / max(elapsed, 1e-9):.0f}% waiting), "
+                        + ', '.join(f'{name} {value:.3f}' for name, value in losses.items())
+                    )
+
+            for scheduler in self.schedulers:
+                scheduler.step()
+            self.epoch += 1
+            elapsed = time.perf_counter() - window_start
+            if not main:
+                continue
+            log(
+                f"epoch {self.epoch} done: {images} images in {elapsed:.1f}s "
+                f"({images / max(elapsed, 1e-9):.2f} img/s, data wait {data_seconds:.1f}s, "
+                f"compute {compute_seconds:.1f}s)"
+            )
+            if self.epoch % save_every == 0 or self.epoch == epochs:
+                self.save_checkpoint(checkpoint_dir)
+                log(f"saved checkpoint to {checkpoint_dir}")
+
+
+def train(dataset, trainer_options, loader_options, output_dir, epochs, fit_options=None, resume=False, log=print):
+    """
+    Build the loader and trainer and run CycleGANTrainer.fit. In a process
+    group a DistributedSampler gives each process its own shard of
+    `dataset`, reshuffled every epoch. Only depends on torch, so
+    translate.distributed can run it in spawned processes.
+    """
+    sampler = None
+    if dist.is_available() and dist.is_initialized():
+        sampler = DistributedSampler(
+            dataset, num_replicas=dist.get_world_size(), rank=dist.get_rank(), shuffle=True, drop_last=True
+        )
+    loader = make_loader(dataset, sampler=sampler, **loader_options)
+    trainer = CycleGANTrainer(**trainer_options)
+    if resume:
+        trainer.load_checkpoint(output_dir)
+        if trainer.rank == 0:
+            log(f"Resuming at epoch {trainer.epoch + 1}")
+    trainer.fit(loader, epochs, output_dir, log=log, **(fit_options or {}))
+    return trainer
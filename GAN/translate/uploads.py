@@ -0,0 +1,112 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, TemporaryFileUploadHandler
+from PIL import Image, UnidentifiedImageError
+
+from .dicom import is_dicom, read_dicom
+
+IMAGE_FORMATS = ('PNG', 'JPEG')
+
+
+def classify_upload(uploaded_file, header=None):
+    """
+    'DICOM' or 'IMAGE' from the file contents, None if unsupported. Only
+    headers are read: the DICOM meta and data set up to the pixel data, or
+    the image header PIL needs to identify the format. DICOM is detected
+    with dicom.is_dicom, the check the translation pipeline uses.
+    """
+    source = uploaded_file.temporary_file_path() if hasattr(uploaded_file, 'temporary_file_path') else uploaded_file
+    if header is None:
+        uploaded_file.seek(0)
+        header = uploaded_file.read(132)
+        uploaded_file.seek(0)
+
+    if is_dicom(source, header=header):
+        try:
+            read_dicom(source, stop_before_pixels=True)
+        except Exception:
+            return None
+        finally:
+            if hasattr(source, 'seek'):
+                source.seek(0)
+        return 'DICOM'
+
+    try:
+        with Image.open(source) as image:
+            image_format = image.format
+    except (UnidentifiedImageError, OSError):
+        return None
+    finally:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+    return 'IMAGE' if image_format in IMAGE_FORMATS else None
+
+
+def file_sha256(uploaded_file, chunk_size=1024 * 1024):
+    """SHA-256 hex digest of an upload, read chunk by chunk."""
+    h = hashlib.sha256()
+    for chunk in uploaded_file.chunks(chunk_size):
+        h.update(chunk)
+    uploaded_file.seek(0)
+    return h.hexdigest()
+
+
+class StreamedUploadedFile(TemporaryUploadedFile):
+    """TemporaryUploadedFile kept in GAN_UPLOAD_TEMP_DIR."""
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        directory = settings.GAN_UPLOAD_TEMP_DIR
+        os.makedirs(directory, exist_ok=True)
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix='.upload' + ext, dir=directory)
+        super(TemporaryUploadedFile, self).__init__(file, name, content_type, size, charset, content_type_extra)
+
+
+class StreamingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Writes multipart file uploads chunk by chunk to a temporary file under
+    MEDIA_ROOT, hashing them on the way, so memory per upload stays at one
+    chunk whatever the file size. Because the temporary file lives on the
+    storage filesystem, saving it to a FileField is a rename, not a copy.
+
+    The finished file carries `sha256` and `image_type` (see
+    classify_upload).
+    """
+
+    chunk_size = 1024 * 1024
+
+    def new_file(self, *args, **kwargs):
+        FileUploadHandler.new_file(self, *args, **kwargs)
+        self.file = StreamedUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+        self.sha256 = hashlib.sha256()
+        self.header = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        if len(self.header) < 132:
+            self.header += raw_data[:132 - len(self.header)]
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.sha256 = self.sha256.hexdigest()
+        uploaded_file.image_type = classify_upload(uploaded_file, header=self.header)
+        return uploaded_file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+
+
+class StreamingUploadMixin:
+    """Use StreamingUploadHandler for the multipart uploads of a DRF view."""
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [StreamingUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
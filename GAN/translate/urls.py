@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
-from .views import MedicalImageViewSet, csrf, login_view, UserMeView, LogoutView, GoogleLoginView, GANTranslationView
+from .views import MedicalImageViewSet, SeriesTranslationJobViewSet, csrf, login_view, UserMeView, LogoutView, GoogleLoginView, GANTranslationView, GANBatchTranslationView
 
 # 1. Create a router instance
 router = DefaultRouter()
@@ -11,6 +11,8 @@ router = DefaultRouter()
 # - POST /translations/        (for create/upload)
 # - GET /translations/{id}/    (for retrieve/status check)
 router.register(r'translations', MedicalImageViewSet, basename='translation')
+# - POST /series-translations/, GET /series-translations/{id}/ (progress)
+router.register(r'series-translations', SeriesTranslationJobViewSet, basename='series-translation')
 
 
 # 3. Define the urlpatterns for this app
@@ -24,6 +26,7 @@ urlpatterns = [
     path("auth/token/refresh/", TokenRefreshView.as_view(), name='token-refresh'),
     path("auth/logout/", LogoutView.as_view()),
     path('translate/gan/', GANTranslationView.as_view(), name='gan-translate'),
+    path('translate/gan/batch/', GANBatchTranslationView.as_view(), name='gan-translate-batch'),
     
     # You can add other custom paths here if needed later
 ]
@@ -1,24 +1,42 @@
+import datetime
+import zipfile
+
 from rest_framework import viewsets, mixins
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import APIException, NotAuthenticated, ValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.request import Request
 from rest_framework.views import APIView
 
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.authentication import SessionAuthentication
 
 from django.contrib.auth import authenticate, login, logout, get_user_model
-from django.http import JsonResponse, HttpResponse
-from django.views.decorators.csrf import ensure_csrf_cookie
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.conf import settings
-
-
-from .models import MedicalImage, ImageAnalysis
-from .serializers import MedicalImageSerializer, ImageAnalysisSerializer
-from .tasks import process_dicom_for_translation
-from .services import MedicalImageAnalyzer, gan_translate_image
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from asgiref.sync import sync_to_async
+
+
+from .models import MedicalImage, ImageAnalysis, SeriesTranslationJob
+from .serializers import MedicalImageSerializer, ImageAnalysisSerializer, SeriesTranslationJobSerializer
+from .tasks import analyze_images, process_dicom_for_translation, translate_series
+from .executor import ExecutorSaturated, get_inference_executor
+from .uploads import StreamingUploadHandler, StreamingUploadMixin
+from .services import (
+    MedicalImageAnalyzer, gan_translate_dicom, gan_translate_image,
+    archive_slices, uploaded_slices, stream_translated_zip
+)
 
 from google.oauth2 import id_token
 from google.auth.transport import requests
@@ -26,20 +44,120 @@ from google.auth.transport import requests
 User = get_user_model()
 
 
-class GANTranslationView(APIView):
+class GANTranslationView(View):
+    """
+    Async translation endpoint. The request is authenticated and parsed on
+    Django's sync thread, then the generator runs on the bounded
+    InferenceExecutor, so waiting for a translation holds no web worker and
+    auth/status endpoints stay responsive under translation load.
+
+    Authentication, permissions and CSRF follow the DRF views: JWT or
+    session, and CSRF is only enforced for session-authenticated requests.
+    """
+    authentication_classes = [JWTAuthentication, SessionAuthentication]
     parser_classes = (MultiPartParser, FormParser)
-    permission_classes = [IsAuthenticated]
 
-    def post(self, request, *args, **kwargs):
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # CSRF is checked by SessionAuthentication, like APIView does
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def _authenticate_and_parse(self, request):
+        request.upload_handlers = [StreamingUploadHandler(request)]
+        drf_request = Request(
+            request,
+            parsers=[parser() for parser in self.parser_classes],
+            authenticators=[auth() for auth in self.authentication_classes],
+        )
+        if not drf_request.user or not drf_request.user.is_authenticated:
+            raise NotAuthenticated()
+        return drf_request.data
+
+    def _error(self, message, status_code):
+        return JsonResponse({'error': message}, status=status_code)
+
+    @staticmethod
+    def _translate(image_file, target_modality, tiled, output_format):
+        if output_format == 'dicom':
+            data, filename, _ = gan_translate_dicom(image_file, target_modality, tiled=tiled)
+            return data, filename, 'application/dicom'
+        data, filename = gan_translate_image(image_file, target_modality, tiled=tiled)
+        return data, filename, 'image/png'
+
+    async def post(self, request, *args, **kwargs):
         """
         Accepts an image and a target modality, and returns the translated image.
+        Pass tiled=true to translate at full resolution with tiled inference,
+        and output_format=dicom to get a 16-bit DICOM back for a DICOM upload.
+        Answers 429 with Retry-After when the inference queue is full and 504
+        when the translation does not finish within GAN_ASYNC_TIMEOUT.
         """
-        image_file = request.data.get('image')
-        target_modality = request.data.get('target_modality') # e.g., 'MRI' or 'CT'
+        try:
+            data = await sync_to_async(self._authenticate_and_parse)(request)
+        except APIException as e:
+            response = JsonResponse({'detail': e.detail}, status=e.status_code)
+            if e.status_code == status.HTTP_401_UNAUTHORIZED:
+                response['WWW-Authenticate'] = self.authentication_classes[0]().authenticate_header(request)
+            return response
+
+        image_file = data.get('image')
+        target_modality = data.get('target_modality') # e.g., 'MRI' or 'CT'
 
         if not image_file or not target_modality:
+            return self._error("Image and target_modality are required.", status.HTTP_400_BAD_REQUEST)
+
+        if target_modality.upper() not in ['MRI', 'CT']:
+            return self._error("target_modality must be either 'MRI' or 'CT'.", status.HTTP_400_BAD_REQUEST)
+
+        tiled = data.get('tiled')
+        if tiled is not None:
+            tiled = str(tiled).lower() in ('1', 'true', 'yes')
+
+        output_format = str(data.get('output_format', settings.GAN_OUTPUT_FORMAT)).lower()
+        if output_format not in ('png', 'dicom'):
+            return self._error("output_format must be either 'png' or 'dicom'.", status.HTTP_400_BAD_REQUEST)
+        if output_format == 'dicom' and getattr(image_file, 'image_type', 'DICOM') != 'DICOM':
+            return self._error("output_format=dicom needs a DICOM upload.", status.HTTP_400_BAD_REQUEST)
+
+        try:
+            output_data, output_filename, content_type = await get_inference_executor().run(
+                self._translate, image_file, target_modality, tiled, output_format,
+                timeout=settings.GAN_ASYNC_TIMEOUT
+            )
+        except ExecutorSaturated as e:
+            response = self._error("Too many translations in progress, retry later.", status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(e.retry_after)
+            return response
+        except TimeoutError:
+            return self._error("Translation timed out.", status.HTTP_504_GATEWAY_TIMEOUT)
+        except Exception as e:
+            return self._error(
+                f"An error occurred during translation: {str(e)}", status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        response = HttpResponse(output_data, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{output_filename}"'
+        return response
+
+
+class GANBatchTranslationView(StreamingUploadMixin, APIView):
+    parser_classes = (MultiPartParser, FormParser)
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Translates many slices in one request. Accepts either a list of
+        `images` or a zip/tar `archive`, and streams back a zip of the
+        translated PNGs in slice order with a manifest.json listing any
+        per-slice failures.
+        """
+        images = request.FILES.getlist('images')
+        archive = request.FILES.get('archive')
+        target_modality = request.data.get('target_modality')
+
+        if not (images or archive) or not target_modality:
             return Response(
-                {"error": "Image and target_modality are required."},
+                {"error": "images (or archive) and target_modality are required."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
@@ -50,19 +168,32 @@ class GANTranslationView(APIView):
             )
 
         try:
-            output_image_data, output_filename = gan_translate_image(image_file, target_modality)
-            
-            response = HttpResponse(output_image_data, content_type='image/png')
-            response['Content-Disposition'] = f'attachment; filename="{output_filename}"'
-            
-            return response
+            batch_size = int(request.data.get('batch_size', settings.GAN_BATCH_MAX_SIZE))
+        except ValueError:
+            return Response(
+                {"error": "batch_size must be an integer."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        batch_size = max(1, min(batch_size, 64))
 
-        except Exception as e:
+        try:
+            slices = archive_slices(archive) if archive else uploaded_slices(images)
+        except (ValueError, zipfile.BadZipFile) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not slices:
             return Response(
-                {'error': f"An error occurred during translation: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"error": "No images found in the upload."},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
+        response = StreamingHttpResponse(
+            stream_translated_zip(slices, target_modality, batch_size=batch_size),
+            content_type='application/zip'
+        )
+        response['Content-Disposition'] = f'attachment; filename="translated_{target_modality.lower()}.zip"'
+        return response
+
 
 class GoogleLoginView(APIView):
     permission_classes = [AllowAny]
@@ -195,10 +326,72 @@ class LogoutView(APIView):
             return Response({'error': str(e)}, status=400)
 
 
-class MedicalImageViewSet(viewsets.ModelViewSet):
-    queryset = MedicalImage.objects.all()
+class MedicalImageCursorPagination(CursorPagination):
+    """
+    Newest first, keyed on uploaded_at: every page is an index range scan
+    from the cursor, however deep the client pages, and no COUNT(*).
+    """
+    ordering = '-uploaded_at'
+    page_size = settings.GAN_LIST_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.GAN_LIST_MAX_PAGE_SIZE
+
+
+def _parse_bound(value, name, end=False):
+    # uploaded_after / uploaded_before: an ISO datetime, or a date meaning
+    # the start (or, for the upper bound, the end) of that day
+    day = parse_date(value)
+    if day is not None:
+        parsed = datetime.datetime.combine(day, datetime.time.max if end else datetime.time.min)
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValidationError({name: 'Expected an ISO date or datetime.'})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class MedicalImageViewSet(StreamingUploadMixin, viewsets.ModelViewSet):
+    """
+    Uploads and their translation and analysis results. Non-staff users
+    only see their own uploads. The list is cursor-paginated and filters on `status`, `modality`, `uploaded_after`, `uploaded_before`
+    and, for staff, `user` (an id).
+    """
+    queryset = MedicalImage.objects.select_related('analysis', 'dicom_data')
     serializer_class = MedicalImageSerializer
     parser_classes = (MultiPartParser, FormParser)
+    pagination_class = MedicalImageCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        # Non-staff users only ever see, analyze or delete their own uploads
+        if not user.is_staff:
+            queryset = queryset.filter(user=user)
+        if self.action != 'list':
+            return queryset
+
+        params = self.request.query_params
+        if user.is_staff and params.get('user'):
+            try:
+                queryset = queryset.filter(user_id=int(params['user']))
+            except ValueError:
+                raise ValidationError({'user': 'Expected a user id.'})
+
+        if params.get('status'):
+            value = params['status'].upper()
+            # Failed translations are stored as 'FAILED: <error>'
+            queryset = queryset.filter(Q(translation_status=value) | Q(translation_status__startswith=f'{value}:'))
+        if params.get('modality'):
+            queryset = queryset.filter(modality=params['modality'].upper())
+        if params.get('uploaded_after'):
+            queryset = queryset.filter(uploaded_at__gte=_parse_bound(params['uploaded_after'], 'uploaded_after'))
+        if params.get('uploaded_before'):
+            queryset = queryset.filter(
+                uploaded_at__lte=_parse_bound(params['uploaded_before'], 'uploaded_before', end=True)
+            )
+        return queryset
 
     def perform_create(self, serializer):
         # Associate with user if authenticated
@@ -212,7 +405,9 @@ class MedicalImageViewSet(viewsets.ModelViewSet):
         Handles the file upload, saves the record, and triggers the Celery task.
         """
         serializer = self.get_serializer(data=request.data)
+        # Rejects an invalid output_format before anything is saved
         serializer.is_valid(raise_exception=True)
+        output_format = serializer.validated_data.get('output_format', settings.GAN_OUTPUT_FORMAT).lower()
         
         # 1. Save the model instance
         self.perform_create(serializer)
@@ -221,7 +416,7 @@ class MedicalImageViewSet(viewsets.ModelViewSet):
         # 2. Trigger the asynchronous GAN translation task
         # The Celery task will now need to check image_instance.input_type 
         # to determine if it needs pydicom or simple image loading.
-        process_dicom_for_translation.delay(image_instance.id)
+        process_dicom_for_translation.delay(image_instance.id, output_format)
 
         # 3. Return an immediate response 
         headers = self.get_success_headers(serializer.data)
@@ -265,12 +460,36 @@ class MedicalImageViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=False, methods=['post'])
+    def analyze_batch(self, request):
+        """Queue a Gemini analysis of several images (`ids`); results land on each image."""
+        ids = request.data.getlist('ids') if hasattr(request.data, 'getlist') else request.data.get('ids')
+        if not ids:
+            return Response(
+                {'error': 'ids is required.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            found = [str(pk) for pk in self.get_queryset().filter(pk__in=ids).values_list('pk', flat=True)]
+        except DjangoValidationError:
+            return Response(
+                {'error': 'ids must be image ids.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        task = analyze_images.delay(found)
+        return Response(
+            {'task_id': task.id, 'queued': found},
+            status=status.HTTP_202_ACCEPTED
+        )
+
     @action(detail=False, methods=['post'])
     def upload_and_analyze(self, request):
         """Upload and immediately analyze an image"""
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        medical_image = serializer.save()
+        self.perform_create(serializer)
+        medical_image = serializer.instance
         
         try:
             analyzer = MedicalImageAnalyzer()
@@ -293,3 +512,66 @@ class MedicalImageViewSet(viewsets.ModelViewSet):
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class SeriesTranslationJobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                                  mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Whole-series translation jobs. POST a series_instance_uid (plus optional
+    target_modality and batch_size) to start one; GET the job for its
+    progress, throughput and ETA. Non-staff users only see, and can only
+    start jobs on, their own series.
+    """
+    queryset = SeriesTranslationJob.objects.all()
+    serializer_class = SeriesTranslationJobSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user=self.request.user)
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = serializer.save(user=request.user)
+
+        translate_series.delay(job.id)
+
+        return Response({
+            'id': job.id,
+            'status': 'Series translation queued. Check detail_url for progress.',
+            'detail_url': request.build_absolute_uri(f'/api/series-translations/{job.id}/')
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        """
+        Re-queue a failed job; it continues after the last finished batch.
+        Jobs that crashed mid-run are redelivered by Celery (acks_late), so
+        pending and running jobs are refused rather than queued twice.
+        """
+        job = self.get_object()
+        if job.status == 'COMPLETED':
+            return Response(
+                {'error': 'Job already completed.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Compare-and-swap FAILED -> PENDING: of two concurrent resumes only
+        # one updates the row and queues the job
+        claimed = SeriesTranslationJob.objects.filter(pk=job.pk, status='FAILED').update(
+            status='PENDING', updated_at=timezone.now()
+        )
+        if not claimed:
+            return Response(
+                {'error': 'Job is already queued or running.'},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        translate_series.delay(job.id)
+        job.refresh_from_db()
+        return Response(
+            self.get_serializer(job).data,
+            status=status.HTTP_202_ACCEPTED
+        )
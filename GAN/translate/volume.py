@@ -0,0 +1,234 @@
+import functools
+import json
+import os
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from .dicom import _first, normalize_pixels, pixels_to_tensor, read_dicom
+
+
+def _sidecar_path(path):
+    return os.path.splitext(path)[0] + '.json'
+
+
+def _slice_position(ds):
+    """Distance along the slice normal, falling back to InstanceNumber."""
+    position = ds.get('ImagePositionPatient')
+    orientation = ds.get('ImageOrientationPatient')
+    if position is not None and orientation is not None and len(orientation) == 6:
+        row, column = np.array(orientation[:3], dtype=float), np.array(orientation[3:], dtype=float)
+        return float(np.dot(np.cross(row, column), np.array(position, dtype=float)))
+    return float(ds.get('InstanceNumber', 0) or 0)
+
+
+def _write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def build_volume(sources, path):
+    """
+    Stack the slices of one series into a (slices, H, W) .npy file at `path`
+    with the stored (pre-rescale) dtype, plus a JSON sidecar with what is
+    needed to turn slices back into modality values: per-slice rescale,
+    VOI window, photometric interpretation and geometry.
+
+    `sources` are the series' DICOM files (paths or file objects). They are
+    ordered by position along the slice normal, and decoded and written one
+    at a time, so memory use stays at a single slice. Multi-frame files add
+    all of their frames. Returns the opened Volume.
+    """
+    headers = sorted(
+        ((read_dicom(source, stop_before_pixels=True), source) for source in sources),
+        key=lambda item: _slice_position(item[0])
+    )
+    if not headers:
+        raise ValueError('A volume needs at least one DICOM file.')
+
+    first = headers[0][0]
+    rows, columns = int(first.Rows), int(first.Columns)
+    frames = [int(ds.get('NumberOfFrames', 1) or 1) for ds, _ in headers]
+    for ds, _ in headers:
+        if (int(ds.Rows), int(ds.Columns)) != (rows, columns):
+            raise ValueError('All slices of a volume must have the same size.')
+        if int(ds.get('SamplesPerPixel', 1) or 1) != 1:
+            raise ValueError('Volumes only hold single-channel images.')
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp.npy'
+    array = None
+    slices = []
+    lower, upper = np.inf, -np.inf
+    index = 0
+    for (header, source), n_frames in zip(headers, frames):
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        pixels = read_dicom(source).pixel_array
+        if pixels.ndim == 2:
+            pixels = pixels[np.newaxis]
+        if array is None:
+            array = np.lib.format.open_memmap(
+                tmp_path, mode='w+', dtype=pixels.dtype, shape=(sum(frames), rows, columns)
+            )
+        array[index:index + n_frames] = pixels
+
+        slope = _first(header.get('RescaleSlope'), 1.0)
+        intercept = _first(header.get('RescaleIntercept'), 0.0)
+        low, high = float(pixels.min()) * slope + intercept, float(pixels.max()) * slope + intercept
+        lower, upper = min(lower, low, high), max(upper, low, high)
+        for frame in range(n_frames):
+            slices.append({
+                'sop_instance_uid': str(header.get('SOPInstanceUID', '')),
+                'instance_number': int(header.get('InstanceNumber', 0) or 0),
+                'frame': frame,
+                'position': _slice_position(header),
+                'rescale_slope': slope,
+                'rescale_intercept': intercept,
+            })
+        index += n_frames
+        del pixels
+
+    array.flush()
+    del array
+    os.replace(tmp_path, path)
+
+    center, width = _first(first.get('WindowCenter')), _first(first.get('WindowWidth'))
+    if center is not None and width is not None and width > 1:
+        lower, upper = center - width / 2.0, center + width / 2.0
+
+    _write_json(_sidecar_path(path), {
+        'series_instance_uid': str(first.get('SeriesInstanceUID', '')),
+        'modality': str(first.get('Modality', '')),
+        'photometric_interpretation': str(first.get('PhotometricInterpretation', '')),
+        'pixel_spacing': [float(v) for v in first.get('PixelSpacing', [])],
+        'slice_thickness': _first(first.get('SliceThickness')),
+        'window': [lower, upper],
+        'slices': slices,
+    })
+    return Volume(path)
+
+
+class Volume:
+    """
+    Read-only view of a volume written by build_volume. Slices are served
+    straight from a numpy memmap: indexing returns views of the file, and
+    the only copy is the float batch handed to the generator.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.array = np.load(path, mmap_mode='r')
+        with open(_sidecar_path(path)) as f:
+            self.metadata = json.load(f)
+        slices = self.metadata['slices']
+        self._slope = np.array([s['rescale_slope'] for s in slices], dtype=np.float32)
+        self._intercept = np.array([s['rescale_intercept'] for s in slices], dtype=np.float32)
+
+    def __len__(self):
+        return self.array.shape[0]
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    def raw(self, start, stop=None):
+        """Stored pixel values of slices [start, stop), no copy."""
+        stop = start + 1 if stop is None else stop
+        return self.array[start:stop]
+
+    def modality_pixels(self, start, stop=None):
+        """float32 (n, H, W) with the per-slice modality LUT applied."""
+        stop = start + 1 if stop is None else min(stop, len(self))
+        pixels = self.raw(start, stop).astype(np.float32)
+        pixels *= self._slope[start:stop, None, None]
+        pixels += self._intercept[start:stop, None, None]
+        return pixels
+
+    def normalized(self, start, stop=None):
+        """Slices windowed into [-1, 1], like dicom_to_tensor."""
+        lower, upper = self.metadata['window']
+        invert = self.metadata['photometric_interpretation'] == 'MONOCHROME1'
+        return normalize_pixels(self.modality_pixels(start, stop), lower, upper, invert=invert)
+
+    def to_tensor(self, start, stop=None, size=256, channels=3):
+        """(n, channels, size, size) generator input for slices [start, stop)."""
+        return pixels_to_tensor(self.normalized(start, stop), size=size, channels=channels)
+
+    def batches(self, batch_size, size=256, channels=3, start=0):
+        """Yield (start, tensor) batches covering slices [start, len)."""
+        for index in range(start, len(self), batch_size):
+            yield index, self.to_tensor(index, index + batch_size, size=size, channels=channels)
+
+    def slice_image(self, index):
+        """8-bit grayscale PIL image of one windowed slice."""
+        pixels = self.normalized(index)[0]
+        pixels += 1.0
+        pixels *= 127.5
+        return Image.fromarray(pixels.clip(0, 255).astype(np.uint8), mode='L')
+
+
+@functools.lru_cache(maxsize=32)
+def _open_volume(path, mtime_ns):
+    return Volume(path)
+
+
+def volume_path(series_instance_uid):
+    return os.path.join(settings.GAN_VOLUME_DIR, f'{series_instance_uid}.npy')
+
+
+def resolve_volume_path(path):
+    """Absolute path of a volume stored as DICOMData.volume['path'] (relative to GAN_VOLUME_DIR)."""
+    return path if os.path.isabs(path) else os.path.join(settings.GAN_VOLUME_DIR, path)
+
+
+def open_volume(path):
+    """Open a volume by path (absolute or relative to GAN_VOLUME_DIR), cached per file version."""
+    path = resolve_volume_path(path)
+    return _open_volume(path, os.stat(path).st_mtime_ns)
+
+
+def build_series_volume(series_instance_uid):
+    """
+    Build the volume of every DICOMData row in a series and point the rows
+    at their slice. Returns the Volume.
+    """
+    from .models import DICOMData
+
+    rows = list(
+        DICOMData.objects.filter(series_instance_uid=series_instance_uid)
+        .select_related('medical_image')
+    )
+    if not rows:
+        raise ValueError(f'No DICOM files in series {series_instance_uid}.')
+
+    by_uid = {row.dicom_metadata.get('SOPInstanceUID'): row for row in rows}
+    path = volume_path(series_instance_uid)
+    volume = build_volume([row.medical_image.image.path for row in rows], path)
+
+    relative_path = os.path.relpath(path, settings.GAN_VOLUME_DIR)
+    for index, entry in enumerate(volume.metadata['slices']):
+        row = by_uid.get(entry['sop_instance_uid'])
+        if row is not None and entry['frame'] == 0:
+            row.volume = {'path': relative_path, 'index': index}
+            row.save(update_fields=['volume'])
+    return volume
+
+
+def volume_headers(series_instance_uid, volume):
+    """Source DICOM header (no pixel data) of every slice of a series volume."""
+    from .models import DICOMData
+
+    paths = {
+        row.dicom_metadata.get('SOPInstanceUID'): row.medical_image.image.path
+        for row in DICOMData.objects.filter(series_instance_uid=series_instance_uid).select_related('medical_image')
+    }
+    headers = {}
+    for entry in volume.metadata['slices']:
+        uid = entry['sop_instance_uid']
+        if uid not in headers:
+            headers[uid] = read_dicom(paths[uid], stop_before_pixels=True)
+    return [headers[entry['sop_instance_uid']] for entry in volume.metadata['slices']]
@@ -0,0 +1,400 @@
+import atexit
+import math
+import mmap
+import os
+import queue
+import signal
+import threading
+from multiprocessing import Pipe
+
+import torch
+from django.conf import settings
+
+MODALITIES = ('MRI', 'CT')
+
+
+def parse_affinity(spec, workers, threads_per_worker):
+    """
+    CPU sets for each worker from GAN_POOL_AFFINITY: '' (no pinning),
+    'auto' (consecutive blocks of threads_per_worker CPUs from the ones this
+    process may use, wrapping around) or explicit per-worker lists such as
+    '0-1;2-3'. Returns a list of sets, or Nones when not pinned.
+    """
+    spec = (spec or '').strip()
+    if not spec:
+        return [None] * workers
+    if spec == 'auto':
+        cpus = sorted(os.sched_getaffinity(0))
+        return [
+            {cpus[(i * threads_per_worker + j) % len(cpus)] for j in range(threads_per_worker)}
+            for i in range(workers)
+        ]
+
+    sets = []
+    for group in spec.split(';'):
+        cpus = set()
+        for part in group.split(','):
+            part = part.strip()
+            if '-' in part:
+                low, high = part.split('-')
+                cpus.update(range(int(low), int(high) + 1))
+            elif part:
+                cpus.add(int(part))
+        sets.append(cpus)
+    if len(sets) < workers:
+        raise ValueError(f'GAN_POOL_AFFINITY lists {len(sets)} CPU sets for {workers} workers.')
+    return sets[:workers]
+
+
+def share_weights(model, alignment=64):
+    """
+    Move every parameter and buffer of `model` into one anonymous shared
+    mapping, in place. Children forked afterwards map the same pages, so the
+    weights exist once however many workers there are, and nothing a worker
+    does to its Python objects (refcounts, GC) can copy them. Returns the
+    mapping, which must stay referenced while the model is in use.
+    """
+    tensors = {}
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        tensors.setdefault(id(tensor), tensor)
+
+    offsets = []
+    total = 0
+    for tensor in tensors.values():
+        offsets.append(total)
+        total += -(-tensor.numel() * tensor.element_size() // alignment) * alignment
+    buffer = mmap.mmap(-1, max(total, 1))
+    storage = torch.frombuffer(buffer, dtype=torch.uint8)
+
+    for offset, tensor in zip(offsets, tensors.values()):
+        nbytes = tensor.numel() * tensor.element_size()
+        shared = storage[offset:offset + nbytes].view(tensor.dtype).view(tensor.shape)
+        shared.copy_(tensor.detach())
+        tensor.data = shared
+    return buffer
+
+
+def _shared_buffer(numel):
+    # Anonymous MAP_SHARED mapping: the parent and the forked worker see
+    # the same pages, so tensors cross the process boundary without pickling
+    buffer = mmap.mmap(-1, numel * 4)
+    return buffer, torch.frombuffer(buffer, dtype=torch.float32)
+
+
+def _worker_main(conn, models, inputs, outputs, num_threads, cpus):
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(num_threads)
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+
+        target_modality, shape = message
+        try:
+            with torch.inference_mode():
+                result = models[target_modality](inputs[:math.prod(shape)].view(shape))
+            if result.numel() > outputs.numel():
+                raise ValueError('Generator output does not fit in the shared buffer.')
+            outputs[:result.numel()].copy_(result.reshape(-1))
+            conn.send(('ok', tuple(result.shape)))
+        except Exception as e:
+            conn.send(('error', f'{type(e).__name__}: {e}'))
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns if path else None
+    except OSError:
+        return None
+
+
+# Generators loaded into shared mappings by preload_pool_weights, keyed by
+# (target modality, netG, quantize, fused_attention):
+# (model, weights_path, checkpoint mtime, mapping)
+_preloaded = {}
+
+
+def load_shared_generator(target_modality, netG='HPB', quantize=False, fused_attention=False):
+    """
+    (model, weights_path, mapping) with the weights in a shared mapping:
+    the preloaded generator when its checkpoint has not changed since,
+    otherwise a freshly loaded one.
+    """
+    from models.networks import fuse_attention
+    from .services import load_generator
+
+    key = (target_modality, netG, quantize, fused_attention)
+    preloaded = _preloaded.get(key)
+    if preloaded is not None:
+        model, weights_path, mtime, buffer = preloaded
+        if _mtime(weights_path) == mtime:
+            return model, weights_path, buffer
+
+    model, weights_path = load_generator(target_modality, netG, quantize=quantize)
+    if fused_attention:
+        fuse_attention(model)
+    return model, weights_path, share_weights(model)
+
+
+def preload_pool_weights(modalities=MODALITIES, netG='HPB'):
+    """
+    Load the pool generators into shared mappings in this process before a
+    server forks its children (gunicorn --preload, the Celery prefork
+    parent). Pools started in the children, and their workers, map these
+    pages instead of loading their own copy, so the weights exist once
+    across every serving process, not once per process.
+    """
+    options = _pool_options()
+    for modality in modalities:
+        key = (modality.upper(), netG, options['quantize'], options['fused_attention'])
+        model, weights_path, buffer = load_shared_generator(*key)
+        _preloaded[key] = (model, weights_path, _mtime(weights_path), buffer)
+
+
+class _Worker:
+    def __init__(self, pid, conn, cpus, input_buffer, inputs, output_buffer, outputs):
+        self.pid = pid
+        self.conn = conn
+        self.cpus = cpus
+        self._buffers = (input_buffer, output_buffer)
+        self.inputs = inputs
+        self.outputs = outputs
+        self.exited = False
+
+    def is_alive(self):
+        # Reaps the child if it exited; never signal a reaped pid again
+        if not self.exited:
+            try:
+                pid, _ = os.waitpid(self.pid, os.WNOHANG)
+            except ChildProcessError:
+                pid = self.pid
+            self.exited = pid != 0
+        return not self.exited
+
+
+class InferencePool:
+    """
+    Forked inference workers sharing one copy of the generator weights.
+
+    The generators are loaded once in the parent, their weights moved into
+    a shared mapping (share_weights), and the workers forked afterwards, so
+    every worker maps the same weight pages instead of holding a private
+    copy: total memory grows by the per-worker activations, not by the
+    weights. Weights preloaded before the server forked
+    (preload_pool_weights) are reused, so pools in several serving
+    processes share them too. int8 packed weights are not tensors share_weights can reach;
+    they stay shared copy-on-write, as nothing writes to them. Each worker has
+    a shared input and output buffer of `buffer_images` 3x256x256 images;
+    requests only send the modality and shape through a pipe.
+
+    run() is thread-safe: each call takes a free worker, so up to `workers`
+    batches run in parallel. Workers are plain os.fork() children, which
+    also works from daemonic processes such as Celery prefork workers. A
+    worker that died (OOM killer, crash) is reaped and forked again from the
+    parent's models the next time it is handed out.
+    """
+
+    def __init__(self, workers=2, threads_per_worker=1, affinity='', buffer_images=8, netG='HPB',
+                 modalities=MODALITIES, quantize=False, fused_attention=False):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.affinity = parse_affinity(affinity, workers, threads_per_worker)
+        self.buffer_numel = buffer_images * 3 * 256 * 256
+        self.netG = netG
+        self.modalities = tuple(m.upper() for m in modalities)
+        self.quantize = quantize
+        self.fused_attention = fused_attention
+        self.weights_paths = {}
+        self.generation = 0
+        self.restarts = 0
+        self._models = {}
+        self._workers = []
+        self._weight_buffers = []
+        self._free = queue.Queue()
+        self._owner = None
+        self._closed = False
+
+    def start(self):
+        for modality in self.modalities:
+            model, self.weights_paths[modality], buffer = load_shared_generator(
+                modality, self.netG, self.quantize, self.fused_attention
+            )
+            self._weight_buffers.append(buffer)
+            self._models[modality] = model
+
+        self._owner = os.getpid()
+        for cpus in self.affinity:
+            input_buffer, inputs = _shared_buffer(self.buffer_numel)
+            output_buffer, outputs = _shared_buffer(self.buffer_numel)
+            worker = self._fork(_Worker(None, None, cpus, input_buffer, inputs, output_buffer, outputs))
+            self._workers.append(worker)
+            self._free.put(worker)
+        return self
+
+    def _fork(self, worker):
+        """Fork a child serving `worker`'s buffers and point `worker` at it."""
+        # The models stay referenced in the parent so dead workers can be
+        # forked again; their weights live in the shared mappings anyway
+        parent_conn, child_conn = Pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Child: drop the parent's ends of the other workers' pipes so
+            # each worker sees EOF as soon as the parent goes away
+            parent_conn.close()
+            for other in self._workers:
+                if other.conn is not None:
+                    other.conn.close()
+            code = 0
+            try:
+                _worker_main(child_conn, self._models, worker.inputs, worker.outputs, self.threads_per_worker, worker.cpus)
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        child_conn.close()
+        worker.pid, worker.conn, worker.exited = pid, parent_conn, False
+        return worker
+
+    def _restart(self, worker):
+        worker.conn.close()
+        if worker.is_alive():
+            os.kill(worker.pid, signal.SIGKILL)
+            os.waitpid(worker.pid, 0)
+        self.restarts += 1
+        return self._fork(worker)
+
+    @property
+    def pids(self):
+        return [worker.pid for worker in self._workers]
+
+    def _run_chunk(self, target_modality, chunk):
+        if self._closed:
+            raise RuntimeError('The inference pool is closed.')
+        worker = self._free.get()
+        try:
+            if not worker.is_alive():
+                self._restart(worker)
+            worker.inputs[:chunk.numel()].copy_(chunk.reshape(-1))
+            try:
+                worker.conn.send((target_modality, tuple(chunk.shape)))
+                status, result = worker.conn.recv()
+            except (EOFError, OSError) as e:
+                # Died on this chunk: replace it for the next caller, but do
+                # not retry what may have killed it
+                pid = worker.pid
+                self._restart(worker)
+                raise RuntimeError(f'Inference worker {pid} died; restarted it as {worker.pid}.') from e
+            if status != 'ok':
+                raise RuntimeError(f'Inference worker {worker.pid} failed: {result}')
+            return worker.outputs[:math.prod(result)].view(result).clone()
+        finally:
+            self._free.put(worker)
+
+    def run(self, target_modality, batch):
+        """Translate an (N, C, H, W) float batch; splits it to fit the buffers."""
+        target_modality = target_modality.upper()
+        if target_modality not in self.modalities:
+            raise ValueError(f'No {target_modality} generator in the inference pool.')
+        batch = batch.detach().float().cpu()
+        per_image = math.prod(batch.shape[1:])
+        if per_image > self.buffer_numel:
+            raise ValueError('Image does not fit in the inference pool buffers.')
+        step = self.buffer_numel // per_image
+        return torch.cat([
+            self._run_chunk(target_modality, batch[start:start + step])
+            for start in range(0, batch.shape[0], step)
+        ])
+
+    def close(self, timeout=30):
+        """Stop the workers, after letting running chunks finish for up to `timeout` seconds."""
+        if self._owner != os.getpid():
+            return
+        self._closed = True
+        for _ in self._workers:
+            try:
+                self._free.get(timeout=timeout)
+            except queue.Empty:
+                break
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+                worker.conn.close()
+            except OSError:
+                pass
+        for worker in self._workers:
+            if worker.is_alive():
+                os.waitpid(worker.pid, 0)
+        self._workers = []
+        self._models = {}
+        self._owner = None
+
+
+class PooledGenerator:
+    """
+    Stands in for a generator and runs it in `pool`, by default the
+    process-wide pool current at call time, so it follows rebuilds.
+    """
+
+    def __init__(self, target_modality, pool=None):
+        self.pool = pool
+        self.target_modality = target_modality.upper()
+
+    def __call__(self, x):
+        pool = self.pool or get_inference_pool()
+        return pool.run(self.target_modality, x).to(x.dtype)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_inference_pool(generation=0):
+    """
+    Process-wide pool configured from GAN_POOL_* settings, started on first
+    use. A pool started before GeneratorRegistry `generation` (bumped when
+    checkpoints are reloaded) is replaced by one with freshly loaded weights.
+    """
+    global _pool
+    if _pool is None or _pool.generation < generation:
+        with _pool_lock:
+            if _pool is None or _pool.generation < generation:
+                pool = InferencePool(**_pool_options())
+                pool.generation = generation
+                stale, _pool = _pool, pool.start()
+                if stale is not None:
+                    stale.close()
+    return _pool
+
+
+def _pool_options():
+    return {
+        'workers': settings.GAN_POOL_WORKERS,
+        'threads_per_worker': settings.GAN_POOL_THREADS_PER_WORKER,
+        'affinity': settings.GAN_POOL_AFFINITY,
+        'buffer_images': settings.GAN_POOL_BUFFER_IMAGES,
+        'quantize': getattr(settings, 'GAN_QUANTIZATION', 'none') == 'int8',
+        'fused_attention': getattr(settings, 'GAN_FUSED_ATTENTION', False),
+    }
+
+
+def _close_pool():
+    if _pool is not None:
+        _pool.close()
+
+
+atexit.register(_close_pool)
+
+
+def _reset_after_fork():
+    # A forked web/Celery child must start its own pool, not talk to the
+    # parent's workers; preloaded weights are kept and shared with it
+    global _pool
+    _pool = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)